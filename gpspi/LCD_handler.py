@@ -1,11 +1,41 @@
 import logging
-from typing import Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
 import gpspi.lcd.LCD_1in44 as LCD_1in44
 from gpspi.types.page import Page
 
+# Once this fraction of the screen has changed a single full frame push is cheaper than several windows.
+FULL_REFRESH_RATIO: float = 0.5
+# Changed row bands separated by at most this many clean rows are sent as one window.
+REGION_MERGE_ROWS: int = 4
+# Rasterized text lines kept around, a page has at most a dozen lines so this covers many pages worth of values.
+LINE_CACHE_SIZE: int = 256
+
+WHITE: tuple[int, int, int] = (255, 255, 255)
+
+
+@dataclass(frozen=True)
+class PageChrome:
+    """The parts of a page that never change: the page number header and the button column."""
+
+    background: Image.Image  # full frame with the header drawn on black
+    button_mask: Optional[Image.Image]  # alpha mask of the button labels, cropped to their bounding box
+    button_origin: tuple[int, int]  # where the button mask goes on the frame
+
+
+@dataclass(frozen=True)
+class ComposedPage:
+    """What is currently drawn in LCDHandler.image, so the next page can redraw only the lines that differ."""
+
+    chrome: PageChrome
+    lines: list[str]
+    colors: list[tuple[int, int, int]]
+
 
 class LCDHandler:
     def __init__(self) -> None:
@@ -22,6 +52,16 @@ class LCDHandler:
         self.draw = ImageDraw.Draw(self.image)
         self.font = ImageFont.load_default()
 
+        # RGB565 copy of the last frame that was sent to the display, None until the first full push
+        self.__sent_frame: Optional[np.ndarray] = None
+        self.__pending_frame: bool = False  # set when self.image holds a frame that has not been pushed yet
+        self.__diff: np.ndarray = np.empty((self.height, self.width), dtype=bool)
+
+        # text is rasterized once and then blitted, see __line_mask and __page_chrome
+        self.__line_cache: OrderedDict[tuple[str, Any], Image.Image] = OrderedDict()
+        self.__chrome_cache: dict[tuple[Page, Optional[tuple[str, ...]]], PageChrome] = {}
+        self.__composed: Optional[ComposedPage] = None
+
         logging.info("LCD initialized")
 
     def __set_brightness(self, level: int) -> None:
@@ -46,28 +86,159 @@ class LCDHandler:
         colors: Optional[list[tuple[int, int, int]]] = None,
         buttons: Optional[list[str]] = None,
     ) -> None:
+        """Compose a page into self.image, flush() sends it to the display."""
         # Make max line length 20 characters, raise error
         for line in lines:
             if len(line) > 20:
                 raise ValueError(f"Line {line} too long")
-        # page number on top,
-        lines.insert(0, f"Page {page_number.value}")
-        if colors is not None:
-            colors.insert(0, (255, 255, 255))  # make page number white, stops error
-
-        self.draw.rectangle((0, 0, self.width, self.height), outline=0, fill=(0, 0, 0))
-        y = 0
-        for i, line in enumerate(lines):
-            color = (255, 255, 255) if not colors else colors[i]
-            self.draw.text((0, y), line, font=self.font, fill=color)
+
+        chrome = self.__page_chrome(page_number, buttons)
+        line_colors = [colors[i] if colors and i < len(colors) else WHITE for i in range(len(lines))]
+        composed = self.__composed
+        if composed is not None and composed.chrome is chrome and len(composed.lines) == len(lines):
+            # same page layout as the frame already in self.image, only redraw the rows of lines that changed
+            changed = [
+                i for i in range(len(lines)) if lines[i] != composed.lines[i] or line_colors[i] != composed.colors[i]
+            ]
+            if not changed:
+                return
+            for i in changed:
+                top = 10 + 10 * i
+                bottom = top + max(self.__line_height(composed.lines[i]), self.__line_height(lines[i]))
+                self.__compose_rows(chrome, top, min(bottom, self.height), lines, line_colors)
+        else:
+            self.__compose_rows(chrome, 0, self.height, lines, line_colors)
+
+        self.__composed = ComposedPage(chrome, list(lines), line_colors)
+        self.__pending_frame = True
+
+    def display_map(
+        self, page_number: Page, view: Image.Image, lines: list[str], buttons: Optional[list[str]] = None
+    ) -> None:
+        """Compose a page of an image under the header, with lines over its bottom, flush() sends it to the display."""
+        chrome = self.__page_chrome(page_number, buttons)
+        self.image.paste(chrome.background)
+        self.image.paste(view, (0, 10))
+        y = self.height - 10 * len(lines)
+        for line in lines:
+            self.__paste_rows(WHITE, (0, y), self.__line_mask(line), 0, self.height)
+            y += 10
+        if chrome.button_mask is not None:
+            self.__paste_rows(WHITE, chrome.button_origin, chrome.button_mask, 0, self.height)
+        # the next text page is drawn in full, push_frame still only sends the pixels that changed
+        self.__composed = None
+        self.__pending_frame = True
+
+    def __compose_rows(
+        self, chrome: PageChrome, top: int, bottom: int, lines: list[str], colors: list[tuple[int, int, int]]
+    ) -> None:
+        """Draw rows top to bottom of the page into self.image, the rest of the image is left alone."""
+        if top == 0 and bottom == self.height:
+            self.image.paste(chrome.background)
+        else:
+            self.image.paste(chrome.background.crop((0, top, self.width, bottom)), (0, top))
+        # the page number is part of the chrome, so the lines start on the second row
+        y = 10
+        for line, color in zip(lines, colors):
+            if line:
+                self.__paste_rows(color, (0, y), self.__line_mask(line), top, bottom)
             y += 10
 
-        # also add 3 button messages for left side
+        # buttons go over the text on the right side
+        if chrome.button_mask is not None:
+            self.__paste_rows(WHITE, chrome.button_origin, chrome.button_mask, top, bottom)
+
+    def __paste_rows(
+        self, color: tuple[int, int, int], origin: tuple[int, int], mask: Image.Image, top: int, bottom: int
+    ) -> None:
+        """Paste color through mask at origin, clipped to rows top to bottom."""
+        x, y = origin
+        clip_top, clip_bottom = max(top, y), min(bottom, y + mask.height)
+        if clip_top >= clip_bottom:
+            return
+        if clip_top != y or clip_bottom != y + mask.height:
+            mask = mask.crop((0, clip_top - y, mask.width, clip_bottom - y))
+        self.image.paste(color, (x, clip_top), mask)
+
+    def __line_height(self, text: str) -> int:
+        return self.__line_mask(text).height if text else 10
+
+    def __line_mask(self, text: str) -> Image.Image:
+        """Return the rasterized alpha mask of a line of text, from an LRU cache keyed by text and font."""
+        key = (text, self.font)
+        mask = self.__line_cache.get(key)
+        if mask is not None:
+            self.__line_cache.move_to_end(key)
+            return mask
+        _, _, right, bottom = self.draw.textbbox((0, 0), text, font=self.font)
+        mask = Image.new("L", (max(1, int(right)), max(1, int(bottom))))
+        ImageDraw.Draw(mask).text((0, 0), text, font=self.font, fill=255)
+        self.__line_cache[key] = mask
+        if len(self.__line_cache) > LINE_CACHE_SIZE:
+            self.__line_cache.popitem(last=False)
+        return mask
+
+    def __page_chrome(self, page_number: Page, buttons: Optional[list[str]]) -> PageChrome:
+        """Return the pre-rendered header and button column for a page, rendering them on first use."""
+        key = (page_number, tuple(buttons) if buttons is not None else None)
+        chrome = self.__chrome_cache.get(key)
+        if chrome is not None:
+            return chrome
+
+        background = Image.new("RGB", (self.width, self.height))
+        ImageDraw.Draw(background).text((0, 0), f"Page {page_number.value}", font=self.font, fill=WHITE)
+        button_mask: Optional[Image.Image] = None
+        button_origin = (0, 0)
         if buttons is not None:
+            mask = Image.new("L", (self.width, self.height))
+            draw = ImageDraw.Draw(mask)
             # draw from other side
             for i, button in enumerate(buttons):
-                self.draw.text(
-                    (self.width - 20, (((self.height - 25) * i) / 3) + 25), button, font=self.font, fill=(255, 255, 255)
-                )
+                draw.text((self.width - 20, (((self.height - 25) * i) / 3) + 25), button, font=self.font, fill=255)
+            bbox = mask.getbbox()
+            if bbox is not None:
+                button_mask = mask.crop(bbox)
+                button_origin = (bbox[0], bbox[1])
+        chrome = PageChrome(background, button_mask, button_origin)
+        self.__chrome_cache[key] = chrome
+        return chrome
+
+    def flush(self) -> None:
+        """Push the last frame composed by display_text to the display, if it has not been sent yet."""
+        if self.__pending_frame:
+            self.__pending_frame = False
+            self.__push_frame()
+
+    def __dirty_regions(self, frame: np.ndarray) -> list[tuple[int, int, int, int]]:
+        """Return the (x start, y start, x end, y end) windows that differ from the last frame sent."""
+        assert self.__sent_frame is not None
+        changed = np.not_equal(frame, self.__sent_frame, out=self.__diff)
+        rows = np.flatnonzero(changed.any(axis=1))
+        if rows.size == 0:
+            return []
+        regions: list[tuple[int, int, int, int]] = []
+        # split the changed rows into bands and find the changed columns of each band
+        for band in np.split(rows, np.flatnonzero(np.diff(rows) > REGION_MERGE_ROWS) + 1):
+            y_start, y_end = int(band[0]), int(band[-1]) + 1
+            cols = np.flatnonzero(changed[y_start:y_end].any(axis=0))
+            regions.append((int(cols[0]), y_start, int(cols[-1]) + 1, y_end))
+        return regions
+
+    def __push_frame(self) -> None:
+        """Send the parts of self.image that changed since the last push to the display."""
+        self.disp.LCD_LoadImage(self.image)
+        # compare pixels as single RGB565 words instead of byte pairs
+        frame: np.ndarray = self.disp.framebuffer.view(np.uint16)[..., 0]
+        if self.__sent_frame is None:
+            self.disp.LCD_ShowWindow(0, 0, self.width, self.height)
+            self.__sent_frame = frame.copy()
+            return
 
-        self.disp.LCD_ShowImage(self.image, 0, 0)
+        regions = self.__dirty_regions(frame)
+        dirty_area = sum((x_end - x_start) * (y_end - y_start) for x_start, y_start, x_end, y_end in regions)
+        if dirty_area >= FULL_REFRESH_RATIO * self.width * self.height:
+            self.disp.LCD_ShowWindow(0, 0, self.width, self.height)
+        else:
+            for region in regions:
+                self.disp.LCD_ShowWindow(*region)
+        np.copyto(self.__sent_frame, frame)
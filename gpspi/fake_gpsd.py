@@ -0,0 +1,164 @@
+"""Replays a recorded gpsd log over the gpsd socket protocol, so the app and the GPSD client can be
+run and benchmarked without a receiver.
+
+Record a log on the device with `gpspipe -w > drive.log` (JSON) or `gpspipe -r > drive.nmea` (NMEA), then:
+
+    python3 -m gpspi.fake_gpsd drive.log              # serve it on 127.0.0.1:2947 at 1 epoch per second
+    python3 -m gpspi.fake_gpsd drive.log --benchmark  # time the GPSD client against it
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import time
+from typing import Any, Optional
+
+from gpspi.gpsd_client import REPORT_PREFIXES, GPSDClient, apply_report
+from gpspi.types.GPS_data import GPSData
+
+KNOTS_TO_MPS: float = 0.514444
+VERSION_REPORT: bytes = b'{"class":"VERSION","release":"fake","rev":"fake","proto_major":3,"proto_minor":14}\n'
+
+
+def _nmea_degrees(value: str, hemisphere: str) -> Optional[float]:
+    """Convert an NMEA ddmm.mmmm / dddmm.mmmm field to signed decimal degrees."""
+    if not value:
+        return None
+    minutes_start = value.index(".") - 2
+    degrees = float(value[:minutes_start]) + float(value[minutes_start:]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+class NMEAConverter:
+    """Turns RMC and GGA sentences into gpsd style TPV reports, one per valid RMC fix."""
+
+    def __init__(self) -> None:
+        self.altitude: Optional[float] = None  # GGA carries the altitude, RMC the rest
+
+    def convert(self, sentence: str) -> Optional[dict[str, Any]]:
+        fields = sentence.split("*", 1)[0].split(",")
+        kind = fields[0][3:]
+        if kind == "GGA" and len(fields) > 9:
+            self.altitude = float(fields[9]) if fields[9] else None
+            return None
+        if kind != "RMC" or len(fields) < 10 or fields[2] != "A":
+            return None
+        clock, date = fields[1], fields[9]
+        fix_time = datetime.datetime.strptime(date + clock[:6], "%d%m%y%H%M%S").replace(tzinfo=datetime.timezone.utc)
+        report: dict[str, Any] = {
+            "class": "TPV",
+            "mode": 3 if self.altitude is not None else 2,
+            "time": fix_time.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "lat": _nmea_degrees(fields[3], fields[4]),
+            "lon": _nmea_degrees(fields[5], fields[6]),
+            "alt": self.altitude,
+            "speed": float(fields[7]) * KNOTS_TO_MPS if fields[7] else None,
+            "track": float(fields[8]) if fields[8] else None,
+        }
+        return {key: value for key, value in report.items() if value is not None}
+
+
+def load_log(path: str) -> list[list[bytes]]:
+    """Read a gpspipe log and split it into epochs of gpsd JSON lines, each starting at a TPV report."""
+    converter = NMEAConverter()
+    epochs: list[list[bytes]] = [[]]
+    with open(path, "r") as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if line.startswith("{"):
+                report = line.encode()
+            elif line.startswith("$"):
+                converted = converter.convert(line)
+                if converted is None:
+                    continue
+                report = json.dumps(converted, separators=(",", ":")).encode()
+            else:
+                continue
+            if report.startswith(b'{"class":"TPV"') and epochs[-1]:
+                epochs.append([])
+            epochs[-1].append(report + b"\n")
+    return [epoch for epoch in epochs if epoch]
+
+
+class FakeGPSD:
+    """Serves a recorded log to every client that connects."""
+
+    def __init__(self, epochs: list[list[bytes]], rate: float = 1.0, passes: int = 0) -> None:
+        self.epochs: list[list[bytes]] = epochs
+        self.rate: float = rate  # epochs per second, 0 sends as fast as the client reads
+        self.passes: int = passes  # times the log is replayed per connection, 0 repeats forever
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(VERSION_REPORT)
+        await reader.readline()  # the ?WATCH command
+        replayed = 0
+        try:
+            while self.passes == 0 or replayed < self.passes:
+                for epoch in self.epochs:
+                    writer.writelines(epoch)
+                    await writer.drain()
+                    if self.rate:
+                        await asyncio.sleep(1 / self.rate)
+                replayed += 1
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> asyncio.Server:
+        return await asyncio.start_server(self.handle_client, host, port)
+
+
+async def benchmark(epochs: list[list[bytes]], passes: int) -> None:
+    """Time the GPSD client decoding and applying every report in the log `passes` times."""
+    expected = passes * sum(1 for epoch in epochs for line in epoch if line.startswith(REPORT_PREFIXES))
+    server = await FakeGPSD(epochs, rate=0, passes=passes).serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    gps_data = GPSData()
+    received = 0
+    changed = 0
+    start = time.perf_counter()
+    async with server:
+        async for report in GPSDClient(port=port).reports():
+            changed += apply_report(gps_data, report).changed
+            received += 1
+            if received >= expected:
+                break
+    elapsed = time.perf_counter() - start
+    print(f"{received} reports ({changed} changed the GPS data) in {elapsed:.3f}s")
+    print(f"{received / elapsed:.0f} reports/s, {elapsed / received * 1e6:.1f} us per report")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="gpspipe -w (JSON) or gpspipe -r (NMEA) capture")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2947)
+    parser.add_argument("--rate", type=float, default=1.0, help="epochs per second, 0 for as fast as possible")
+    parser.add_argument("--benchmark", action="store_true", help="time the GPSD client instead of serving")
+    parser.add_argument("--passes", type=int, default=100, help="log replays for --benchmark")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    epochs = load_log(args.log)
+    logging.info(f"Loaded {len(epochs)} epochs from {args.log}")
+    if args.benchmark:
+        asyncio.run(benchmark(epochs, args.passes))
+        return
+
+    async def serve_forever() -> None:
+        server = await FakeGPSD(epochs, rate=args.rate).serve(args.host, args.port)
+        logging.info(f"Fake GPSD listening on {args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional
+
+from gpspi.types.GPS_data import GPSData
+
+try:  # orjson is several times faster than the standard library, but optional
+    import orjson
+
+    _loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+WATCH_COMMAND: bytes = b'?WATCH={"enable":true,"json":true}\n'
+# gpsd always writes the class first, so reports we do not use are skipped without being decoded.
+REPORT_PREFIXES: tuple[bytes, ...] = (b'{"class":"TPV"', b'{"class":"SKY"')
+
+
+class GPSDClient:
+    """Lightweight asyncio client for the gpsd JSON protocol, reconnecting with exponential backoff."""
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 2947, min_backoff: float = 0.5, max_backoff: float = 30.0
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.min_backoff: float = min_backoff
+        self.max_backoff: float = max_backoff
+
+    async def reports(self) -> AsyncIterator[dict[str, Any]]:
+        """Yield every TPV and SKY report gpsd sends, forever."""
+        backoff = self.min_backoff
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                logging.warning(f"Could not connect to GPSD ({e}), retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            logging.info("Connected to GPSD")
+            backoff = self.min_backoff
+            try:
+                writer.write(WATCH_COMMAND)
+                await writer.drain()
+                while True:
+                    try:
+                        line = await reader.readline()
+                    except ValueError:
+                        # longer than the stream limit, readline dropped it (or the part buffered so far, the rest
+                        # arrives as a fragment that is skipped below)
+                        logging.warning("Skipping an oversized GPSD report")
+                        continue
+                    if not line:
+                        break
+                    if not line.startswith(REPORT_PREFIXES):
+                        continue
+                    try:
+                        yield _loads(line)
+                    except ValueError:
+                        logging.debug(f"Skipping malformed GPSD report {line!r}")
+            except OSError as e:
+                logging.warning(f"Lost connection to GPSD ({e})")
+            finally:
+                writer.close()
+            logging.warning("GPSD connection closed, reconnecting")
+
+
+@dataclass(frozen=True)
+class AppliedReport:
+    changed: bool  # the GPS data changed
+    # the report was a TPV with a 2D or 3D fix; without one gps_data keeps the last position while its time moves on
+    position: bool
+
+
+def apply_report(gps_data: GPSData, report: dict[str, Any]) -> AppliedReport:
+    """Fold a single gpsd report into gps_data."""
+    report_class: Optional[str] = report.get("class")
+    if report_class == "TPV":  # Time, Position, Velocity report
+        changed = gps_data.update_position_data(
+            latitude=report.get("lat"),
+            longitude=report.get("lon"),
+            altitude=report.get("alt"),
+            speed=report.get("speed"),
+            time=report.get("time"),
+            true_heading=report.get("track"),
+            mag_heading=report.get("magtrack"),
+        )
+        position = report.get("mode", 2) >= 2 and report.get("lat") is not None and report.get("lon") is not None
+        return AppliedReport(changed, position)
+    if report_class == "SKY":  # Satellite information
+        # newer gpsd releases only send the satellite list every few epochs, keep the last one until then
+        return AppliedReport(
+            gps_data.update_satellite_data(time=report.get("time"), satellites=report.get("satellites")), False
+        )
+    return AppliedReport(False, False)
@@ -1,21 +1,34 @@
-import json
+import asyncio
+import copy
 import logging
+import os
+import threading
 import time
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
-import gps
+import numpy as np
 
 from gpspi.button_handler import ButtonHandler, LCDButton
+from gpspi.gpsd_client import GPSDClient, apply_report
 from gpspi.LCD_handler import LCDHandler
+from gpspi.map_view import MapRenderer
 from gpspi.mapping.coord_utils import (
     get_distance_feet,
+    get_distances_and_bearings,
     get_magnetic_bearing,
     get_nearest_city,
+    get_proximity_order,
+    prewarm_nearest_city,
 )
-#from gpspi.mapping.WIP.path_finder import GPSPathFinder
+from gpspi.render_worker import RenderEvent, RenderWorker
+from gpspi.resources import BackgroundResource, ResourceLoader, ResourceState
+from gpspi.route_worker import RouteWorker
+from gpspi.track_log import TrackRecorder
+from gpspi.track_simplify import TrackSimplifier
 from gpspi.types.GPS_data import GPSData
-from gpspi.types.page import Page
-from gpspi.types.saved_data import DictSavedData, SavedData, Waypoint
+from gpspi.types.page import PAGE_LAYOUTS, Page, PageView
+from gpspi.types.saved_data import SavedData, Waypoint
+from gpspi.waypoint_store import WaypointStore
 
 # GPIO Pins
 KEY_UP_PIN: int = 6
@@ -27,109 +40,182 @@ KEY1_PIN: int = 21
 KEY2_PIN: int = 20
 KEY3_PIN: int = 16
 
+# gpsd sends several reports (TPV, SKY, ...) per epoch, wait this long after one for the rest before redrawing.
+EPOCH_SETTLE_SECONDS: float = 0.05
+
+ROAD_GRAPH_PATH: str = "north-america-all-roads.graph"
+SAVED_DATA_PATH: str = "destination.json"
+# computed routes persist next to destination.json
+ROUTE_CACHE_PATH: str = "routes.json"
+# the breadcrumb trail, a ring of the most recent fixes
+TRACK_PATH: str = "track.bin"
+# fixes closer than this to the line through the ones kept are not recorded, the track stays drawable at 10 Hz
+TRACK_TOLERANCE_M: float = 3.0
+
+MAP_BUTTONS: list[str] = ["Z+", "Z-", "N/A"]
+
+# for the time to first frame and time to ready metrics
+STARTED_AT: float = time.monotonic()
+
+
+def load_path_finder() -> Optional[Any]:
+    """Load the road graph, takes minutes for a large region so it only ever runs on the resource loader."""
+    if not os.path.exists(ROAD_GRAPH_PATH):
+        logging.info(f"No road graph at {ROAD_GRAPH_PATH}, road features are disabled")
+        return None
+    from gpspi.mapping.WIP.path_finder import GPSPathFinder
+
+    return GPSPathFinder(ROAD_GRAPH_PATH, ROUTE_CACHE_PATH)
+
 
 class GPSDisplay:
     def __init__(self, lcd_handler: LCDHandler, gpio_handler: ButtonHandler) -> None:
         self.lcd_handler: LCDHandler = lcd_handler
         self.gpio_handler: ButtonHandler = gpio_handler
-        #self.gps_path_finder = GPSPathFinder("north-america-all-roads.graphml")
 
-        # GPS setup
-        logging.info("Connecting to GPSD")
-        self.session = gps.gps(host="127.0.0.1", port="2947", reconnect=True)
-        self.session.stream(gps.WATCH_ENABLE | gps.WATCH_NEWSTYLE)
-        logging.info("Connected to GPSD")
+        # GPS setup, the connection is made once the event loop runs
+        self.gps_client: GPSDClient = GPSDClient(host="127.0.0.1", port=2947)
 
         # GPS data
         self.gps_data: GPSData = GPSData()
 
         # Screen variables
         self.current_screen: Page = Page.TIME_AND_SATELLITES
-        self.total_screens: int = 6
+        self.total_screens: int = len(Page)
+        # changes are applied to saved_data at once and written to disk on the store's own thread
+        self.waypoint_store: WaypointStore = WaypointStore(SAVED_DATA_PATH)
         self.saved_data: SavedData = self.load_data()
+        # every fix is simplified, buffered and written to the track in batches on the recorder's own thread
+        self.track_recorder: TrackRecorder = TrackRecorder(
+            TRACK_PATH, simplifier=TrackSimplifier(tolerance_m=TRACK_TOLERANCE_M)
+        )
         self.cur_waypoint_index: int = 0
+        # SELECT_WAYPOINTS can list the waypoints nearest first, the arrays are refreshed every time it is drawn
+        self.sort_waypoints_by_distance: bool = False
+        self.waypoint_distances: Optional[np.ndarray] = None  # meters, in saved order
+        self.waypoint_bearings: Optional[np.ndarray] = None  # magnetic degrees, in saved order
+        self.waypoint_order: Optional[np.ndarray] = None  # saved indexes, nearest first
+        # the map page crops its view out of a cached tile, the header row stays above it
+        self.map_renderer: MapRenderer = MapRenderer(self.lcd_handler.width, self.lcd_handler.height - 10)
+
+        # Pages are declared in gpspi.types.page, only the pages with button actions need a handler here; the map
+        # page is drawn by update_map, which handles its buttons itself
+        self.page_views: dict[Page, PageView] = {page: PageView(page, layout) for page, layout in PAGE_LAYOUTS.items()}
+        self.button_handlers: dict[Page, Callable[[LCDButton, list[str]], bool]] = {
+            Page.TIME_AND_SATELLITES: self.time_and_satellites_button,
+            Page.SELECT_DESTINATION: self.select_destination_button,
+            Page.SELECT_WAYPOINTS: self.select_waypoints_button,
+        }
+
+        # Event loop state, set up in run()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__epoch_timer: Optional[asyncio.TimerHandle] = None
+        self.__epoch_position: bool = False  # the epoch being gathered carried a fix
+        # (time, latitude, longitude) of the last epoch with a fix, for the breadcrumb on the map
+        self.last_fix: Optional[tuple[float, float, float]] = None
+
+        # The render worker owns the LCD, state_lock keeps it from drawing while a GPS report is half applied
+        self.state_lock: threading.Lock = threading.Lock()
+        self.render_worker: RenderWorker = RenderWorker(self.render)
+        # route searches run here, never under state_lock
+        self.route_worker: RouteWorker = RouteWorker()
+        self.__first_frame_logged: bool = False
+        # set when a button put up a message in place of the page during the batch being rendered, see render()
+        self.__message_shown: bool = False
+
+        # Heavy resources load in the background after the first frame, features check .ready before using them
+        self.resources: ResourceLoader = ResourceLoader(self.render_worker.request_redraw, started_at=STARTED_AT)
+        self.nearest_city_lookup: BackgroundResource[bool] = self.resources.register("cities", prewarm_nearest_city)
+        self.gps_path_finder: BackgroundResource[Any] = self.resources.register("roads", load_path_finder)
 
         # Configure button callbacks
-        self.gpio_handler.configure_callbacks(self.button_callback)
+        self.gpio_handler.configure_callbacks(self.render_worker.push_button)
         logging.info("Button callbacks configured")
 
     # Util Functions
 
     def load_data(self) -> SavedData:
-        try:
-            with open("destination.json", "r") as f:
-                return SavedData.from_dict(DictSavedData(**json.load(f)))  # type: ignore[typeddict-item]
-        except FileNotFoundError:
-            return SavedData()
+        """The saved data, as replayed from the snapshot and journal by the store."""
+        return self.waypoint_store.data
 
-    def save_data(self) -> None:
-        with open("destination.json", "w") as f:
-            json.dump(self.saved_data.to_dict(), f)
-
-    def button_callback(self, button: LCDButton) -> None:
+    def button_callback(self, button: LCDButton) -> bool:
+        """Handle a button press on the render worker, returns True if the page changed and still needs drawing."""
         if button == LCDButton.UP:
             self.current_screen = Page((self.current_screen.value - 1) % self.total_screens)
+            self.__message_shown = False
+            return True
         elif button == LCDButton.DOWN:
             self.current_screen = Page((self.current_screen.value + 1) % self.total_screens)
-        else:
-            self.update_display(button)
-
-    # Parse GPS Data
-
-    def update_gps_data(self) -> None:
-        try:
-            report = dict(self.session.next())
-            if report["class"] == "TPV":  # Time, Position, Velocity report
-                # parse data
-                latitude: Optional[float] = report.get("lat")
-                longitude: Optional[float] = report.get("lon")
-                altitude: Optional[float] = report.get("alt")
-                speed: Optional[float] = report.get("speed")
-                time: Optional[str] = report.get("time")
-                true_heading: Optional[float] = report.get("track")
-                mag_heading: Optional[float] = report.get("magtrack")
-
-                self.gps_data.update_position_data(
-                    latitude=latitude,
-                    longitude=longitude,
-                    altitude=altitude,
-                    speed=speed,
-                    time=time,
-                    true_heading=true_heading,
-                    mag_heading=mag_heading,
-                )
-
-            if report["class"] == "SKY":  # Satellite information
-                time = report.get("time")
-                satellites: list[dict[str, Any]] = list(report.get("satellites", [{}]))
-                self.gps_data.update_satellite_data(time=time, satellites=satellites)
-
-        except (TypeError, KeyError, StopIteration):
-            return None
+            self.__message_shown = False
+            return True
+        self.update_display(button)
+        return False
+
+    def render(self, events: list[RenderEvent]) -> None:
+        """Apply a batch of queued events and push the resulting frame once, runs on the render worker."""
+        with self.state_lock:
+            needs_redraw = False
+            self.__message_shown = False
+            for event in events:
+                needs_redraw |= self.button_callback(event) if event is not None else True
+            # a message a button put up stays until the next batch, drawing the page over it in the same batch would
+            # hide it before it was ever pushed; a page change always draws
+            if needs_redraw and not self.__message_shown:
+                self.update_display()
+        # the frame push is slow, do it without holding up the GPS reader
+        self.lcd_handler.flush()
+        if not self.__first_frame_logged:
+            self.__first_frame_logged = True
+            logging.info(f"Time to first frame: {time.monotonic() - STARTED_AT:.2f}s")
+
+    @property
+    def resource_status(self) -> str:
+        return self.resources.status
+
+    def resource_message(self, resource: BackgroundResource[Any]) -> str:
+        """The message shown when a feature is used before its resource is ready."""
+        if resource.state == ResourceState.LOADING:
+            return f"{resource.name.capitalize()} loading..."
+        return f"No {resource.name} data"
 
     def get_nearest_city(self) -> Waypoint:
         """Return the coordinates of the nearest town."""
         # Now Implemented YAY
         return get_nearest_city(self.gps_data.as_waypoint()).as_waypoint()
 
-    def navigate_to_city(self) -> list[Waypoint]:
-        """start navigation to the nearest city"""
+    def navigate_to_city(self, position: GPSData) -> list[Waypoint]:
+        """start navigation to the nearest city, runs on the route worker with a copy of the GPS data"""
         # Now Implemented YAY
-        if not self.gps_data.in_sync:
-            return []
-        nearest_city: Waypoint = get_nearest_city(self.gps_data.as_waypoint()).as_waypoint()
-        # generate route to the nearest city, this is disabled to save processing power.
-        #return self.gps_path_finder.navigate_to_waypoint(self.gps_data, nearest_city)
-        return [nearest_city]
-
-    def get_nearest_road(self) -> Waypoint:
-        """Navigate to the nearest road"""
+        nearest_city: Waypoint = get_nearest_city(position.as_waypoint()).as_waypoint()
+        if not self.gps_path_finder.ready:
+            return [nearest_city]
+        # the destination first, then the route to it
+        start = time.monotonic()
+        path_finder = self.gps_path_finder.value
+        route = path_finder.navigate_to_waypoint(position, nearest_city)
+        logging.info(
+            f"Routed to {nearest_city.name} through {len(route)} nodes in {time.monotonic() - start:.2f}s "
+            f"({path_finder.last_route_source})"
+        )
+        return [nearest_city] + route
+
+    def route_to_city(self, position: GPSData) -> None:
+        """Routes to the nearest city and sets it as the destination, runs on the route worker."""
+        nav_output = self.navigate_to_city(position)
+        with self.state_lock:
+            self.waypoint_store.set_destination(nav_output[0])
+            self.waypoint_store.add_waypoints(nav_output[1:])
+        self.render_worker.request_redraw()
+
+    def get_nearest_road(self) -> Optional[Waypoint]:
+        """Navigate to the nearest road, None if there is none in the loaded roads near enough to find"""
         # Now Implemented YAY
         if not self.gps_data.in_sync:
             return Waypoint(0.0, 0.0, 0.0)
-        #return self.gps_path_finder.navigate_to_nearest_road(self.gps_data)
-        #this code should not be called
-        return self.get_nearest_city()
+        if not self.gps_path_finder.ready:
+            # this code should not be called
+            return self.get_nearest_city()
+        return self.gps_path_finder.value.navigate_to_nearest_road(self.gps_data)
 
     def compass_heading(self, destination) -> float:
         """Return the compass heading from the current location to the destination, ex 60 degrees east."""
@@ -141,27 +227,91 @@ class GPSDisplay:
         # Implemented this
         return get_distance_feet(self.gps_data.as_waypoint(), destination)
 
+    def update_waypoint_proximity(self) -> None:
+        """Recompute the distance and bearing to every saved waypoint in one vectorized pass."""
+        if not self.saved_data.waypoints or self.gps_data.latitude is None or self.gps_data.longitude is None:
+            self.waypoint_distances = self.waypoint_bearings = self.waypoint_order = None
+            return
+        current_pos = Waypoint(self.gps_data.latitude, self.gps_data.longitude, 0.0)
+        self.waypoint_distances, self.waypoint_bearings = get_distances_and_bearings(
+            current_pos, self.saved_data.waypoints
+        )
+        self.waypoint_order = get_proximity_order(self.waypoint_distances)
+
+    @property
+    def cur_waypoint_saved_index(self) -> int:
+        """The index in saved_data.waypoints of the waypoint under the cursor."""
+        order = self.waypoint_order
+        if self.sort_waypoints_by_distance and order is not None and len(order) == len(self.saved_data.waypoints):
+            return int(order[self.cur_waypoint_index])
+        return self.cur_waypoint_index
+
+    @property
+    def cur_waypoint(self) -> Optional[Waypoint]:
+        if not self.saved_data.waypoints:
+            return None
+        return self.saved_data.waypoints[self.cur_waypoint_saved_index]
+
+    @property
+    def cur_waypoint_proximity(self) -> Optional[tuple[float, float]]:
+        """Distance (meters) and magnetic bearing (degrees) to the waypoint under the cursor."""
+        if self.waypoint_distances is None or self.waypoint_bearings is None:
+            return None
+        index = self.cur_waypoint_saved_index
+        if index >= len(self.waypoint_distances):
+            return None
+        return float(self.waypoint_distances[index]), float(self.waypoint_bearings[index])
+
+    @property
+    def waypoint_count(self) -> int:
+        return len(self.saved_data.waypoints)
+
     # GUI Functions
 
     def update_display(self, button: Optional[LCDButton] = None) -> None:
         if self.gps_data.time is None:
-            self.lcd_handler.display_text(Page.TIME_AND_SATELLITES, ["No GPS data"])
+            self.lcd_handler.display_text(Page.TIME_AND_SATELLITES, ["No GPS data", self.resource_status])
+            return
+        if self.last_fix is not None:
+            # the breadcrumb grows whichever page is shown
+            self.map_renderer.add_fix(*self.last_fix)
+        if self.current_screen == Page.MAP:
+            self.update_map(button)
+            return
+        if self.current_screen == Page.SELECT_WAYPOINTS:
+            self.update_waypoint_proximity()
+        view = self.page_views[self.current_screen]
+        handler = self.button_handlers.get(self.current_screen)
+        self.__message_shown = button is not None and handler is not None and handler(button, view.layout.buttons)
+        if self.__message_shown:
+            return  # the handler put up a message instead of the page
+        lines, colors = view.update(self)
+        self.lcd_handler.display_text(self.current_screen, lines, colors=colors, buttons=view.layout.buttons)
+
+    def update_map(self, button: Optional[LCDButton] = None) -> None:
+        if button is not None:
+            self.map_button(button, MAP_BUTTONS)
+        if self.gps_data.latitude is None or self.gps_data.longitude is None:
+            self.lcd_handler.display_text(Page.MAP, ["No GPS fix"], buttons=MAP_BUTTONS)
             return
-        if self.current_screen == Page.TIME_AND_SATELLITES:
-            self.display_time_and_satellites(button)
-        elif self.current_screen == Page.GPS_COORDINATES:
-            self.display_gps_coordinates(button)
-        elif self.current_screen == Page.SELECT_DESTINATION:
-            self.display_select_destination(button)
-        elif self.current_screen == Page.SELECT_WAYPOINTS:
-            self.display_select_waypoints(button)
-        elif self.current_screen == Page.COMPASS_HEADING_AND_SPEED:
-            self.display_compass_heading_and_speed(button)
-        elif self.current_screen == Page.COORDINATES_AND_DISTANCE:
-            self.display_coordinates_and_distance(button)
-
-    def display_time_and_satellites(self, button: Optional[LCDButton] = None) -> None:
-        assert self.gps_data.time is not None
+        path_finder = self.gps_path_finder.value if self.gps_path_finder.ready else None
+        view = self.map_renderer.render(
+            self.gps_data.latitude,
+            self.gps_data.longitude,
+            self.gps_data.true_heading,
+            self.track_recorder.track,
+            self.saved_data.waypoints,
+            self.saved_data.destination,
+            path_finder.spatial_index if path_finder is not None else None,
+        )
+        scale = self.map_renderer.meters_per_pixel * self.map_renderer.width
+        self.lcd_handler.display_map(
+            Page.MAP, view, [f"{scale / 1000:g} km" if scale >= 1000 else f"{scale:g} m"], buttons=MAP_BUTTONS
+        )
+
+    # Button handlers, these return True if they displayed a message in place of the page
+
+    def time_and_satellites_button(self, button: LCDButton, buttons: list[str]) -> bool:
         if button == LCDButton.KEY1:
             # increase brightness
             self.lcd_handler.raise_brightness()
@@ -171,62 +321,51 @@ class GPSDisplay:
         elif button == LCDButton.KEY3:
             # reset brightness
             self.lcd_handler.reset_brightness()
-        self.lcd_handler.display_text(
-            Page.TIME_AND_SATELLITES,
-            [
-                time.strftime("%Y-%m-%d %H:%M:%S", self.gps_data.time.timetuple()),
-                f"Sats connected: {self.gps_data.num_satellites}",
-                f"Synced: {'Yes' if self.gps_data.in_sync else 'No'}",
-            ],
-            buttons=["B+", "B-", "RB"],
-        )
+        return False
 
-    def display_gps_coordinates(self, button: Optional[LCDButton] = None) -> None:
-        color = (0, 255, 0) if self.gps_data.in_sync else (255, 0, 0)
-        self.lcd_handler.display_text(
-            Page.GPS_COORDINATES,
-            ["Current Cords", "Green = recent", f"Lat: {self.gps_data.latitude}", f"Lon: {self.gps_data.longitude}"],
-            colors=[color, color],
-            buttons=["N/A", "N/A", "N/A"],
-        )
-
-    def display_select_destination(self, button: Optional[LCDButton] = None) -> None:
-        buttons = ["NR", "NC", "WP"]
+    def select_destination_button(self, button: LCDButton, buttons: list[str]) -> bool:
         if button == LCDButton.KEY1:
             # Set the destination to the nearest road
-            #self.saved_data.destination = self.get_nearest_road()
-            self.save_data()
+            if not self.gps_path_finder.ready:
+                self.lcd_handler.display_text(
+                    Page.SELECT_DESTINATION, [self.resource_message(self.gps_path_finder)], buttons=buttons
+                )
+                return True
+            if not self.gps_data.in_sync:
+                self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["No GPS fix"], buttons=buttons)
+                return True
+            nearest_road = self.get_nearest_road()
+            if nearest_road is None:
+                self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["No road nearby"], buttons=buttons)
+                return True
+            self.waypoint_store.set_destination(nearest_road)
         elif button == LCDButton.KEY2:
             # navigate to the nearest city
-            nav_output = self.navigate_to_city()
-            self.saved_data.destination = nav_output[0]
-            self.saved_data.waypoints += nav_output[1:]
-            self.save_data()
+            if not self.nearest_city_lookup.ready:
+                self.lcd_handler.display_text(
+                    Page.SELECT_DESTINATION, [self.resource_message(self.nearest_city_lookup)], buttons=buttons
+                )
+                return True
+            if not self.gps_data.in_sync:
+                self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["No GPS fix"], buttons=buttons)
+                return True
+            # the search runs on the route worker from a copy of the position, the page is redrawn when it is set
+            position = copy.copy(self.gps_data)
+            if not self.route_worker.submit(lambda: self.route_to_city(position)):
+                self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["Still routing..."], buttons=buttons)
+                return True
+            self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["Routing..."], buttons=buttons)
+            return True
         elif button == LCDButton.KEY3:
             # Select the destination from a list of waypoints
             if self.saved_data.waypoints:
-                self.saved_data.destination = self.saved_data.waypoints[self.cur_waypoint_index]
-                self.save_data()
+                self.waypoint_store.set_destination(self.cur_waypoint)
             else:
                 self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["No waypoints saved"], buttons=buttons)
-                return
-
-        if self.saved_data.destination:
-            self.lcd_handler.display_text(
-                Page.SELECT_DESTINATION,
-                [
-                    f"Destination set to:",
-                    f"Lat: {self.saved_data.destination.latitude}",
-                    f"Lon: {self.saved_data.destination.longitude}",
-                    f"Name: {self.saved_data.destination.name}",
-                ],
-                buttons=buttons,
-            )
-        else:
-            self.lcd_handler.display_text(Page.SELECT_DESTINATION, ["No destination set"], buttons=buttons)
-
-    def display_select_waypoints(self, button: Optional[LCDButton] = None) -> None:
-        buttons = ["DEL", "PREV", "NEXT"]
+                return True
+        return False
+
+    def select_waypoints_button(self, button: LCDButton, buttons: list[str]) -> bool:
         if button == LCDButton.SELECT:
             if self.gps_data.in_sync:
                 assert self.gps_data.latitude is not None
@@ -237,86 +376,83 @@ class GPSDisplay:
                     longitude=float(self.gps_data.longitude),
                     altitude=float(self.gps_data.altitude),
                 )
-                self.saved_data.waypoints.append(new_waypoint)
-                self.save_data()
+                self.waypoint_store.add_waypoints([new_waypoint])
                 self.lcd_handler.display_text(Page.SELECT_WAYPOINTS, ["Waypoint saved!"], buttons=buttons)
+                return True
         elif len(self.saved_data.waypoints) == 0:  # all other button presses are invalid if there are no waypoints
-            self.lcd_handler.display_text(Page.SELECT_WAYPOINTS, ["No waypoints saved"], buttons=buttons)
-            return
+            return False  # the page shows "No waypoints saved"
         elif button == LCDButton.KEY1:
             # Delete the current waypoint (confirmation can be added if needed)
-            del self.saved_data.waypoints[self.cur_waypoint_index]
-            self.save_data()
+            self.waypoint_store.delete_waypoint(self.cur_waypoint_saved_index)
             self.cur_waypoint_index = max(0, self.cur_waypoint_index - 1)
             self.lcd_handler.display_text(Page.SELECT_WAYPOINTS, ["Waypoint deleted!"], buttons=buttons)
-            return
+            return True
         elif button == LCDButton.KEY2:
             # Move to the previous waypoint
             self.cur_waypoint_index = (self.cur_waypoint_index - 1) % len(self.saved_data.waypoints)
         elif button == LCDButton.KEY3:
             # Move to the next waypoint
             self.cur_waypoint_index = (self.cur_waypoint_index + 1) % len(self.saved_data.waypoints)
+        elif button == LCDButton.RIGHT:
+            # Toggle between the saved order and nearest first
+            self.sort_waypoints_by_distance = not self.sort_waypoints_by_distance
+            self.cur_waypoint_index = 0
+        return False
 
-        waypoint = self.saved_data.waypoints[self.cur_waypoint_index]
-        self.lcd_handler.display_text(
-            Page.SELECT_WAYPOINTS,
-            [
-                f"Waypoint {self.cur_waypoint_index + 1}/{len(self.saved_data.waypoints)}",
-                f"Lat: {waypoint.latitude}",
-                f"Lon: {waypoint.longitude}",
-                f"Alt: {waypoint.altitude}",
-                f"Name: {waypoint.name}",
-            ],
-            buttons=buttons,
-        )
-
-    def display_compass_heading_and_speed(self, button) -> None:
-        assert self.gps_data.mag_heading is not None
-        buttons = ["N/A", "N/A", "N/A"]
-        if self.saved_data.destination:
-            self.lcd_handler.display_text(
-                Page.COMPASS_HEADING_AND_SPEED,
-                [
-                    f"Cur Speed:{round(self.gps_data.speed * gps.MPS_TO_MPH,2)}MPH",
-                    f"CurH:{round(self.gps_data.mag_heading,2)}",
-                    f"TgtH:{self.compass_heading(self.saved_data.destination)}",
-                    "Headings are in",
-                    "Magnetic Degrees",
-                ],
-                buttons=buttons,
-            )
-        else:
-            self.lcd_handler.display_text(Page.COMPASS_HEADING_AND_SPEED, ["No destination set"], buttons=buttons)
-
-    def display_coordinates_and_distance(self, button) -> None:
-        assert self.gps_data.speed is not None
-        buttons = ["N/A", "N/A", "N/A"]
-        if self.saved_data.destination:
-            self.lcd_handler.display_text(
-                Page.COORDINATES_AND_DISTANCE,
-                [
-                    f"LAT: {self.gps_data.latitude}",
-                    f"Lng: {self.gps_data.longitude}",
-                    "Current Cords^",
-                    f"LAT: {self.saved_data.destination.latitude}",
-                    f"Lng: {self.saved_data.destination.longitude}",
-                    "Target Cords^",
-                    "Dist to Tgt:",
-                    f"{round(self.calculate_distance(self.saved_data.destination) / 5280,2)} Mi",
-                ],
-                buttons=buttons,
-            )
-        else:
-            self.lcd_handler.display_text(Page.COORDINATES_AND_DISTANCE, ["No destination set"], buttons=buttons)
+    def map_button(self, button: LCDButton, buttons: list[str]) -> bool:
+        if button == LCDButton.KEY1:
+            self.map_renderer.zoom_in()
+        elif button == LCDButton.KEY2:
+            self.map_renderer.zoom_out()
+        return False
+
+    # Event loop
+
+    async def read_gps_data(self) -> None:
+        """Fold gpsd reports into gps_data as they arrive and redraw once per changed epoch."""
+        assert self.loop is not None
+        async for report in self.gps_client.reports():
+            with self.state_lock:
+                applied = apply_report(self.gps_data, report)
+            if not applied.changed:
+                continue
+            self.__epoch_position |= applied.position
+            if self.__epoch_timer is None:
+                # let the rest of the epoch arrive so it is drawn as one update
+                self.__epoch_timer = self.loop.call_later(EPOCH_SETTLE_SECONDS, self.__end_epoch)
+
+    def __end_epoch(self) -> None:
+        self.__epoch_timer = None
+        # after the fix is lost SKY reports and empty TPVs still move the time on, the stale position is not a fix
+        if self.__epoch_position and self.gps_data.time is not None:
+            self.__epoch_position = False
+            self.track_recorder.record(self.gps_data)
+            self.last_fix = (self.gps_data.time.timestamp(), self.gps_data.latitude, self.gps_data.longitude)
+        self.render_worker.request_redraw()
+
+    async def run(self) -> None:
+        """Read gpsd on the event loop, all drawing happens on the render worker."""
+        self.loop = asyncio.get_running_loop()
+        await self.read_gps_data()
 
     def main_loop(self) -> None:
+        self.waypoint_store.start()
+        self.track_recorder.start()
+        self.render_worker.start()
+        self.route_worker.start()
+        self.render_worker.request_redraw()
+        self.resources.start()
         try:
-            while True:
-                self.update_gps_data()
-                self.update_display()
-                time.sleep(1)
+            asyncio.run(self.run())
         except KeyboardInterrupt:
             pass  # gpiozero does not require explicit cleanup
+        finally:
+            self.render_worker.stop()
+            self.route_worker.stop()
+            self.waypoint_store.close()
+            self.track_recorder.close()
+            if self.gps_path_finder.ready and self.gps_path_finder.value is not None:
+                self.gps_path_finder.value.close()
 
 
 def main() -> None:
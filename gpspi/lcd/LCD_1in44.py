@@ -66,6 +66,7 @@ class LCD(config.RaspberryPi):
     LCD_Scan_Dir = SCAN_DIR_DFT
     LCD_X_Adjust = LCD_X
     LCD_Y_Adjust = LCD_Y
+    framebuffer = None  # RGB565 frame, allocated by LCD_AllocFramebuffer
 
     """    Hardware reset     """
 
@@ -293,16 +294,35 @@ class LCD(config.RaspberryPi):
         self.LCD_WriteReg(0x2C)
 
     def LCD_Clear(self):
-        # hello
-        _buffer = [0xFF] * (self.width * self.height * 2)
+        _buffer = b"\xff" * (self.width * self.height * 2)
         self.LCD_SetWindows(0, 0, self.width, self.height)
         self.digital_write(self.GPIO_DC_PIN, True)
-        for i in range(0, len(_buffer), 4096):
-            self.spi_writebyte(_buffer[i : i + 4096])
+        self.spi_writebuffer(_buffer)
 
-    def LCD_ShowImage(self, Image, Xstart, Ystart):
-        if Image == None:
+    # /********************************************************************************
+    # function:      Allocate the persistent RGB565 framebuffer (once per scan size)
+    #                The framebuffer is (height, width, 2) big endian RGB565, which is
+    #                exactly the byte order the ST7735S expects on the wire.
+    # ********************************************************************************/
+    def LCD_AllocFramebuffer(self):
+        if self.framebuffer is not None and self.framebuffer.shape[:2] == (self.height, self.width):
             return
+        self.framebuffer = np.zeros((self.height, self.width, 2), dtype=np.uint8)
+        # views and scratch space are built once so a frame conversion allocates nothing
+        self._fb_high = self.framebuffer[..., 0]
+        self._fb_low = self.framebuffer[..., 1]
+        self._fb_scratch = np.empty((self.height, self.width), dtype=np.uint8)
+        self._fb_bytes = memoryview(self.framebuffer).cast("B")
+        # staging area for windows narrower than the screen, whose rows are not contiguous
+        self._fb_window = np.empty(self.height * self.width * 2, dtype=np.uint8)
+        self._fb_window_bytes = memoryview(self._fb_window)
+
+    # /********************************************************************************
+    # function:      Convert a PIL RGB image into the framebuffer without sending it
+    # parameter:
+    #       Image   :   PIL image, must be the same size as the display
+    # ********************************************************************************/
+    def LCD_LoadImage(self, Image):
         imwidth, imheight = Image.size
         if imwidth != self.width or imheight != self.height:
             raise ValueError(
@@ -311,15 +331,43 @@ class LCD(config.RaspberryPi):
                     self.width, self.height
                 )
             )
+        self.LCD_AllocFramebuffer()
         img = np.asarray(Image)
-        pix = np.zeros((self.width, self.height, 2), dtype=np.uint8)
-        pix[..., [0]] = np.add(np.bitwise_and(img[..., [0]], 0xF8), np.right_shift(img[..., [1]], 5))
-        pix[..., [1]] = np.add(
-            np.bitwise_and(np.left_shift(img[..., [1]], 3), 0xE0),
-            np.right_shift(img[..., [2]], 3),
-        )
-        pix = pix.flatten().tolist()
-        self.LCD_SetWindows(0, 0, self.width, self.height)
+        tmp = self._fb_scratch
+        # high byte: RRRRRGGG
+        np.bitwise_and(img[..., 0], 0xF8, out=self._fb_high)
+        np.right_shift(img[..., 1], 5, out=tmp)
+        np.bitwise_or(self._fb_high, tmp, out=self._fb_high)
+        # low byte: GGGBBBBB
+        np.left_shift(img[..., 1], 3, out=self._fb_low)
+        np.bitwise_and(self._fb_low, 0xE0, out=self._fb_low)
+        np.right_shift(img[..., 2], 3, out=tmp)
+        np.bitwise_or(self._fb_low, tmp, out=self._fb_low)
+
+    # /********************************************************************************
+    # function:      Send one window of the framebuffer to the display
+    # parameter:
+    #       Xstart  :   X direction Start coordinates
+    #       Ystart  :   Y direction Start coordinates
+    #       Xend    :   X direction end coordinates (exclusive)
+    #       Yend    :   Y direction end coordinates (exclusive)
+    # ********************************************************************************/
+    def LCD_ShowWindow(self, Xstart, Ystart, Xend, Yend):
+        self.LCD_AllocFramebuffer()
+        if Xstart == 0 and Xend == self.width:
+            # full width rows are already contiguous in the framebuffer
+            data = self._fb_bytes[Ystart * self.width * 2 : Yend * self.width * 2]
+        else:
+            size = (Yend - Ystart) * (Xend - Xstart) * 2
+            window = self._fb_window[:size].reshape(Yend - Ystart, Xend - Xstart, 2)
+            np.copyto(window, self.framebuffer[Ystart:Yend, Xstart:Xend])
+            data = self._fb_window_bytes[:size]
+        self.LCD_SetWindows(Xstart, Ystart, Xend, Yend)
         self.digital_write(self.GPIO_DC_PIN, True)
-        for i in range(0, len(pix), 4096):
-            self.spi_writebyte(pix[i : i + 4096])
+        self.spi_writebuffer(data)
+
+    def LCD_ShowImage(self, Image, Xstart, Ystart):
+        if Image is None:
+            return
+        self.LCD_LoadImage(Image)
+        self.LCD_ShowWindow(0, 0, self.width, self.height)
@@ -113,6 +113,12 @@ class RaspberryPi:
         if self.SPI != None:
             self.SPI.writebytes(data)
 
+    def spi_writebuffer(self, data):
+        # writebytes2 takes any buffer object (bytes, memoryview, numpy array)
+        # and does its own chunking, so no python list is ever built.
+        if self.SPI != None:
+            self.SPI.writebytes2(data)
+
     def bl_DutyCycle(self, duty):
         self.GPIO_BL_PIN.value = duty / 100
 
@@ -0,0 +1,235 @@
+"""
+The map page: the track, saved waypoints, destination and nearby roads around the current position, north up.
+
+Drawing thousands of points every frame would take longer than the frame, so the map is drawn once into a tile
+three screens wide, in a flat projection (metres east and north of the tile's centre, see MapTile), and each frame
+only crops the view out of it around the position and draws the position marker on top. The tile is redrawn when
+the view would leave it, when the zoom changes, or when the waypoints, destination or roads change; new fixes are
+drawn onto the cached tile as they arrive, so the breadcrumb grows without a redraw. A redraw only reads the newest
+MAP_TRACK_POINTS of the recorded track, so it costs the same on the first day as after the ring has filled.
+"""
+
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from gpspi.mapping.spatial_index import METERS_PER_DEGREE, SpatialIndex
+from gpspi.track_log import TrackFile
+from gpspi.types.saved_data import Waypoint, WaypointSet
+
+Color = tuple[int, int, int]
+
+ROAD_COLOR: Color = (90, 90, 90)
+TRACK_COLOR: Color = (255, 200, 0)
+WAYPOINT_COLOR: Color = (0, 200, 255)
+DESTINATION_COLOR: Color = (255, 0, 0)
+POSITION_COLOR: Color = (0, 255, 0)
+
+# the tile is this many views across, the view can move a screen either way before the tile is redrawn
+TILE_VIEWS: int = 3
+# meters per pixel of every zoom level, the view is 128 pixels wide
+ZOOM_LEVELS: tuple[float, ...] = (2.0, 5.0, 12.0, 30.0, 80.0, 200.0)
+DEFAULT_ZOOM: int = 1
+# fixes further apart in time than this are not joined, the device was off or had no fix between them
+TRACK_GAP_SECONDS: float = 600.0
+# the latest fixes, drawn on top of the recorded track until the recorder has written them
+LIVE_POINTS: int = 2048
+# the most recorded fixes a tile redraw reads, hours of simplified track; older ones are left off the map
+MAP_TRACK_POINTS: int = 20_000
+
+
+@dataclass(frozen=True)
+class MapTile:
+    """A cached raster of the map around a point, in metres east and north of it scaled to pixels."""
+
+    image: Image.Image
+    latitude: float  # the centre of the tile
+    longitude: float
+    meters_per_pixel: float
+    key: tuple[Any, ...]  # what was drawn, the tile is redrawn when it changes
+
+    @property
+    def x_scale(self) -> float:
+        """Pixels per degree of longitude."""
+        return METERS_PER_DEGREE * math.cos(math.radians(self.latitude)) / self.meters_per_pixel
+
+    @property
+    def y_scale(self) -> float:
+        """Pixels per degree of latitude."""
+        return METERS_PER_DEGREE / self.meters_per_pixel
+
+    def project(self, latitudes: np.ndarray, longitudes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the pixel (x, y) of the points in the tile, y down."""
+        delta_lon = (np.asarray(longitudes, dtype=np.float64) - self.longitude + 180) % 360 - 180
+        x = self.image.width / 2 + delta_lon * self.x_scale
+        y = self.image.height / 2 - (np.asarray(latitudes, dtype=np.float64) - self.latitude) * self.y_scale
+        return x, y
+
+    def bounds(self) -> tuple[float, float, float, float]:
+        """
+        Returns the (south, west, north, east) edges of the tile (degrees), the longitudes wrapped like project() wraps
+        them, so west is east of east when the tile crosses the antimeridian
+        """
+        half_height = self.image.height / 2 / self.y_scale
+        half_width = self.image.width / 2 / self.x_scale
+        return (
+            self.latitude - half_height,
+            (self.longitude - half_width + 180) % 360 - 180,
+            self.latitude + half_height,
+            (self.longitude + half_width + 180) % 360 - 180,
+        )
+
+
+def _polylines(x: np.ndarray, y: np.ndarray, breaks: np.ndarray) -> list[list[tuple[float, float]]]:
+    """Splits the points into lines at every True in breaks (set on the first point of a new line)."""
+    starts = np.flatnonzero(breaks)
+    return [
+        list(zip(line_x.tolist(), line_y.tolist())) for line_x, line_y in zip(np.split(x, starts), np.split(y, starts))
+    ]
+
+
+class MapRenderer:
+    """Draws the map view for a position, see the module docstring."""
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width: int = width
+        self.height: int = height
+        self.zoom: int = DEFAULT_ZOOM
+        self.tile: Optional[MapTile] = None
+        self.tile_renders: int = 0
+        self.__live: deque[tuple[float, float, float]] = deque(maxlen=LIVE_POINTS)  # (time, latitude, longitude)
+
+    @property
+    def meters_per_pixel(self) -> float:
+        return ZOOM_LEVELS[self.zoom]
+
+    def zoom_in(self) -> None:
+        self.zoom = max(0, self.zoom - 1)
+
+    def zoom_out(self) -> None:
+        self.zoom = min(len(ZOOM_LEVELS) - 1, self.zoom + 1)
+
+    def add_fix(self, timestamp: float, latitude: float, longitude: float) -> None:
+        """Adds the latest fix to the breadcrumb, drawing it onto the cached tile."""
+        if self.__live and self.__live[-1][0] == timestamp:
+            return
+        previous = self.__live[-1] if self.__live else None
+        self.__live.append((timestamp, latitude, longitude))
+        if self.tile is None or previous is None or timestamp - previous[0] > TRACK_GAP_SECONDS:
+            return
+        x, y = self.tile.project(np.array([previous[1], latitude]), np.array([previous[2], longitude]))
+        ImageDraw.Draw(self.tile.image).line(list(zip(x.tolist(), y.tolist())), fill=TRACK_COLOR)
+
+    def __draw_track(self, draw: ImageDraw.ImageDraw, tile: MapTile, track: Optional[TrackFile]) -> None:
+        chunks: list[tuple[np.ndarray, ...]] = []
+        recent = track.recent(MAP_TRACK_POINTS) if track is not None else None
+        if recent is not None and len(recent):
+            chunks.append((recent["time"], recent["latitude"], recent["longitude"]))
+        if self.__live:
+            chunks.append(tuple(np.array(self.__live).T))
+        previous: tuple[float, ...] = ()  # the last point of the previous chunk, to join the lines across
+        for chunk in chunks:
+            times, latitudes, longitudes = (np.concatenate((previous[k : k + 1], chunk[k])) for k in range(3))
+            previous = (float(times[-1]), float(latitudes[-1]), float(longitudes[-1]))
+            # clipped in pixels, project() wraps the longitudes across the antimeridian
+            x, y = tile.project(latitudes, longitudes)
+            inside = (x >= 0) & (x <= tile.image.width) & (y >= 0) & (y <= tile.image.height)
+            # keep the points either side of the edge so the lines leaving the tile are drawn to it
+            inside[1:] |= inside[:-1].copy()
+            inside[:-1] |= inside[1:].copy()
+            kept = np.flatnonzero(inside)
+            if len(kept) < 2:
+                continue
+            breaks = np.zeros(len(kept), dtype=bool)
+            breaks[1:] = (np.diff(kept) > 1) | (np.diff(times[kept]) > TRACK_GAP_SECONDS)
+            for line in _polylines(x[kept], y[kept], breaks):
+                if len(line) > 1:
+                    draw.line(line, fill=TRACK_COLOR)
+
+    def __render_tile(
+        self,
+        latitude: float,
+        longitude: float,
+        key: tuple[Any, ...],
+        track: Optional[TrackFile],
+        waypoints: WaypointSet,
+        destination: Optional[Waypoint],
+        spatial_index: Optional[SpatialIndex],
+    ) -> MapTile:
+        image = Image.new("RGB", (self.width * TILE_VIEWS, self.height * TILE_VIEWS))
+        tile = MapTile(image, latitude, longitude, self.meters_per_pixel, key)
+        draw = ImageDraw.Draw(image)
+        south, west, north, east = tile.bounds()
+
+        pieces = spatial_index.pieces_in_box(south, west, north, east) if spatial_index is not None else None
+        if pieces is not None:
+            start_x, start_y = tile.project(pieces[0], pieces[1])
+            end_x, end_y = tile.project(pieces[2], pieces[3])
+            for segment in zip(start_x.tolist(), start_y.tolist(), end_x.tolist(), end_y.tolist()):
+                draw.line(segment, fill=ROAD_COLOR)
+
+        self.__draw_track(draw, tile, track)
+
+        x, y = tile.project(waypoints.latitudes, waypoints.longitudes)
+        inside = (x >= 0) & (x < image.width) & (y >= 0) & (y < image.height)
+        for point_x, point_y in zip(x[inside].tolist(), y[inside].tolist()):
+            draw.rectangle((point_x - 1, point_y - 1, point_x + 1, point_y + 1), outline=WAYPOINT_COLOR)
+
+        if destination is not None:
+            (point_x,), (point_y,) = tile.project(np.array([destination.latitude]), np.array([destination.longitude]))
+            draw.line((point_x - 3, point_y - 3, point_x + 3, point_y + 3), fill=DESTINATION_COLOR, width=2)
+            draw.line((point_x - 3, point_y + 3, point_x + 3, point_y - 3), fill=DESTINATION_COLOR, width=2)
+        self.tile_renders += 1
+        return tile
+
+    def render(
+        self,
+        latitude: float,
+        longitude: float,
+        heading: Optional[float],
+        track: Optional[TrackFile],
+        waypoints: WaypointSet,
+        destination: Optional[Waypoint],
+        spatial_index: Optional[SpatialIndex],
+    ) -> Image.Image:
+        """
+        Draws the view around the position
+        :param latitude: latitude of the position (degrees)
+        :param longitude: longitude of the position (degrees)
+        :param heading: the direction of travel (degrees from true north), None for a dot instead of an arrow
+        :param track: the recorded track, its newest MAP_TRACK_POINTS are drawn with the fixes given to add_fix
+        :param waypoints: the saved waypoints
+        :param destination: the destination, if one is set
+        :param spatial_index: the road index, None if the roads are not loaded
+        :return: the view, width by height, centred on the position
+        """
+        key = (self.zoom, waypoints.version, destination, spatial_index is not None)
+        tile = self.tile
+        moved_off = True
+        if tile is not None:
+            (x,), (y,) = tile.project(np.array([latitude]), np.array([longitude]))
+            margin_x, margin_y = (tile.image.width - self.width) / 2, (tile.image.height - self.height) / 2
+            moved_off = abs(x - tile.image.width / 2) > margin_x or abs(y - tile.image.height / 2) > margin_y
+        if tile is None or tile.key != key or moved_off:
+            tile = self.tile = self.__render_tile(
+                latitude, longitude, key, track, waypoints, destination, spatial_index
+            )
+            x, y = tile.image.width / 2, tile.image.height / 2
+        left, top = round(x - self.width / 2), round(y - self.height / 2)
+        view = tile.image.crop((left, top, left + self.width, top + self.height))
+
+        draw = ImageDraw.Draw(view)
+        center_x, center_y = self.width / 2, self.height / 2
+        if heading is None:
+            draw.ellipse((center_x - 3, center_y - 3, center_x + 3, center_y + 3), outline=POSITION_COLOR)
+        else:
+            angles = [math.radians(heading + offset) for offset in (0, 140, 220)]
+            draw.polygon(
+                [(center_x + 6 * math.sin(angle), center_y - 6 * math.cos(angle)) for angle in angles],
+                outline=POSITION_COLOR,
+            )
+        return view
@@ -1,19 +1,95 @@
-"""This file converts it from extracted OSM data to the osmnx format"""
+"""
+Streaming importer, converts an extracted OSM file (.osm.pbf) into the road graph GPSPathFinder loads.
+
+The file is read in passes, so memory is bounded by the size of the road network, never by the size of the file:
+    ways    every drivable highway way, its node ids and direction are appended to scratch files on disk
+    nodes   the locations of the nodes those ways use are looked up in chunks, into memory mapped arrays
+    edges   consecutive nodes of every way become edges, a chunk of ways at a time
+    graph   the edges are sorted into the compact graph
+    simplify
+            the chains of nodes that only shape a road are merged into single edges (see simplify.py), then the
+            contraction hierarchy and spatial index are built on the simplified graph
+Every stage prints its time and throughput.
+
+With --tile-miles the region is first split into square tiles (one osmium-tool extract pass), the tiles run the
+first three passes in a process pool, and the tiles are stitched back together on the OSM ids of the nodes on their
+edges. Every edge belongs to the tile holding the node it leaves, so no road is lost or doubled at a tile edge.
+
+With --page-degrees the graph is written as a tiled graph instead (see tiled_graph.py), which the device maps a few
+tiles at a time. It gets no contraction hierarchy, routes on it use bidirectional A*.
+
+    python3 -m gpspi.mapping.WIP.importer florida-all-roads.osm.pbf florida-all-roads.graph
+    python3 -m gpspi.mapping.WIP.importer florida-all-roads.osm.pbf lakeland.graph --center 27.99 -81.76 --radius 50
+    python3 -m gpspi.mapping.WIP.importer north-america-all-roads.osm.pbf --tile-miles 100 --workers 8
+    python3 -m gpspi.mapping.WIP.importer north-america-all-roads.osm.pbf --tile-miles 100 --page-degrees 0.5
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import time
+from array import array
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import osmium
+
+from gpspi.mapping.contraction import build_contraction_hierarchy
+from gpspi.mapping.road_graph import RoadGraph, build_road_graph
+from gpspi.mapping.simplify import simplify_road_graph
+from gpspi.mapping.spatial_index import build_spatial_index
+from gpspi.mapping.tiled_graph import build_tiled_graph
 
-#source_path = "north-america-all-roads.osm.pbf"
 source_path = "florida-all-roads.osm.pbf"
+output_path = "north-america-all-roads.graph"
+
+# values are buffered in memory up to this many at a time, then written out or processed as one numpy batch
+CHUNK_SIZE: int = 1 << 20
+
+# the highway values cars can use, the same network pyrosm's "driving" filter selected
+DRIVING_HIGHWAYS: frozenset[str] = frozenset(
+    {
+        "motorway",
+        "motorway_link",
+        "trunk",
+        "trunk_link",
+        "primary",
+        "primary_link",
+        "secondary",
+        "secondary_link",
+        "tertiary",
+        "tertiary_link",
+        "unclassified",
+        "residential",
+        "living_street",
+        "service",
+        "road",
+    }
+)
+NO_ACCESS: frozenset[str] = frozenset({"no", "private"})
+
+# the arrays every tile saves for stitching
+TILE_ARRAYS: tuple[str, ...] = ("osm_id", "latitude", "longitude", "sources", "targets")
 
-import datetime
-import osmnx as ox
-from networkx import MultiDiGraph
-from pyrosm import OSM
+# way directions
+BOTH_WAYS: int = 0
+FORWARD_ONLY: int = 1
+BACKWARD_ONLY: int = -1
 
 
 def miles_to_degrees(miles):
     """Convert miles to degrees (approximately)."""
     return miles / 69.0
 
-def get_bounding_box(lat, lon, radius_miles=50) -> tuple[float,float,float,float]:
+
+def get_bounding_box(lat, lon, radius_miles=50) -> tuple[float, float, float, float]:
     """
     Returns a bounding box representing a circle of a given radius (in miles) around a coordinate point.
 
@@ -30,37 +106,453 @@ def get_bounding_box(lat, lon, radius_miles=50) -> tuple[float,float,float,float
     max_lat = lat + radius_degrees
     min_lon = lon - radius_degrees
     max_lon = lon + radius_degrees
-    
+
     return (min_lon, min_lat, max_lon, max_lat)
 
 
-def get_graph(file_name: str) -> MultiDiGraph:
-    
-    b_box = list(get_bounding_box(27.994402, -81.760254, 50))
-    
-    
-    #osm = OSM(file_name, b_box)
-    osm = OSM(file_name)
-    print("Getting driving network")
-    time = datetime.datetime.now()
-    nodes, edges = osm.get_network(nodes=True,network_type="driving")
-    print(f"Time taken: {datetime.datetime.now() - time}")
-    print("Converting to graphml")
-    time = datetime.datetime.now()
-    graph = osm.to_graph(nodes, edges, graph_type="networkx")
-    print(f"Time taken: {datetime.datetime.now() - time}")
-    
+@dataclass
+class Stage:
+    """Progress of one import stage, printed when the stage ends."""
+
+    name: str
+    unit: str
+    count: int = 0
+
+
+@contextmanager
+def stage(name: str, unit: str) -> Iterator[Stage]:
+    progress = Stage(name, unit)
+    print(f"{name}...")
+    start = time.perf_counter()
+    yield progress
+    elapsed = time.perf_counter() - start
+    rate = f", {progress.count / elapsed:,.0f} {unit}/s" if elapsed > 0 and progress.count else ""
+    print(f"{name}: {progress.count:,} {unit} in {elapsed:.1f}s{rate}")
+
+
+def way_direction(tags: osmium.osm.TagList, highway: str) -> int:
+    oneway = tags.get("oneway", "")
+    if oneway in ("yes", "true", "1"):
+        return FORWARD_ONLY
+    if oneway == "-1":
+        return BACKWARD_ONLY
+    if oneway == "no":
+        return BOTH_WAYS
+    # implied one way roads
+    if highway in ("motorway", "motorway_link") or tags.get("junction") in ("roundabout", "circular"):
+        return FORWARD_ONLY
+    return BOTH_WAYS
+
+
+class ScratchArray:
+    """An append only array on disk, written a chunk at a time."""
+
+    def __init__(self, path: str, typecode: str, dtype: type) -> None:
+        self.path: str = path
+        self.dtype: type = dtype
+        self.length: int = 0
+        self.__buffer: array = array(typecode)
+        self.__file = open(path, "wb")
+
+    def __len__(self) -> int:
+        return self.length + len(self.__buffer)
+
+    def append(self, value: int) -> None:
+        self.__buffer.append(value)
+        if len(self.__buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def extend(self, values: list[int]) -> None:
+        self.__buffer.extend(values)
+        if len(self.__buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def write(self, values: np.ndarray) -> None:
+        self.flush()
+        np.asarray(values, dtype=self.dtype).tofile(self.__file)
+        self.length += len(values)
+
+    def flush(self) -> None:
+        self.__buffer.tofile(self.__file)
+        self.length += len(self.__buffer)
+        del self.__buffer[:]
+
+    def close(self) -> np.ndarray:
+        """Flushes the array and returns it memory mapped."""
+        self.flush()
+        self.__file.close()
+        if self.length == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.length,))
+
+
+class WayCollector(osmium.SimpleHandler):
+    """First pass, keeps the node ids and direction of every drivable way."""
+
+    def __init__(self, work_path: str) -> None:
+        super().__init__()
+        self.refs: ScratchArray = ScratchArray(os.path.join(work_path, "refs.bin"), "q", np.int64)
+        self.way_start: ScratchArray = ScratchArray(os.path.join(work_path, "way_start.bin"), "q", np.int64)
+        self.direction: ScratchArray = ScratchArray(os.path.join(work_path, "direction.bin"), "b", np.int8)
+        self.ways: int = 0
+
+    def way(self, w: osmium.osm.Way) -> None:
+        tags = w.tags
+        highway = tags.get("highway")
+        if highway not in DRIVING_HIGHWAYS or tags.get("area") == "yes":
+            return
+        if tags.get("access") in NO_ACCESS or tags.get("motor_vehicle") in NO_ACCESS:
+            return
+        refs = [node.ref for node in w.nodes]
+        if len(refs) < 2:
+            return
+        self.way_start.append(len(self.refs))
+        self.refs.extend(refs)
+        self.direction.append(way_direction(tags, highway))
+        self.ways += 1
+
+    def close(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the node ids of every way, the start of every way in them and the way directions."""
+        self.way_start.append(len(self.refs))  # the end of the last way
+        return self.refs.close(), self.way_start.close(), self.direction.close()
+
+
+class NodeLocator(osmium.SimpleHandler):
+    """Second pass, finds the location of every node the ways use."""
+
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        bbox: Optional[tuple[float, float, float, float]],
+    ) -> None:
+        super().__init__()
+        self.node_ids: np.ndarray = node_ids  # sorted
+        self.latitude: np.ndarray = latitude
+        self.longitude: np.ndarray = longitude
+        self.bbox: Optional[tuple[float, float, float, float]] = bbox
+        self.nodes_read: int = 0
+        self.__ids: array = array("q")
+        self.__latitudes: array = array("d")
+        self.__longitudes: array = array("d")
+
+    def node(self, n: osmium.osm.Node) -> None:
+        location = n.location
+        if not location.valid():
+            return
+        self.__ids.append(n.id)
+        self.__latitudes.append(location.lat)
+        self.__longitudes.append(location.lon)
+        if len(self.__ids) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        ids = np.frombuffer(self.__ids, dtype=np.int64)
+        latitudes = np.frombuffer(self.__latitudes, dtype=np.float64)
+        longitudes = np.frombuffer(self.__longitudes, dtype=np.float64)
+        positions = np.searchsorted(self.node_ids, ids)
+        used = positions < len(self.node_ids)
+        used[used] = self.node_ids[positions[used]] == ids[used]
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            used &= (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+        self.latitude[positions[used]] = latitudes[used]
+        self.longitude[positions[used]] = longitudes[used]
+        self.nodes_read += len(ids)
+        # the views above hold the buffers, replace them instead of resizing
+        self.__ids, self.__latitudes, self.__longitudes = array("q"), array("d"), array("d")
+
+
+def assemble_edges(
+    work_path: str,
+    refs: np.ndarray,
+    way_start: np.ndarray,
+    direction: np.ndarray,
+    node_ids: np.ndarray,
+    located: np.ndarray,
+    owned: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Turns consecutive way nodes into directed edges (as indexes into node_ids), a chunk of ways at a time
+    :param located: which nodes have a location, edges to the others are dropped
+    :param owned: which nodes this tile owns, only edges leaving them are kept so every edge belongs to one tile
+    :return: the source and target of every edge
+    """
+    sources = ScratchArray(os.path.join(work_path, "sources.bin"), "q", np.int64)
+    targets = ScratchArray(os.path.join(work_path, "targets.bin"), "q", np.int64)
+    way_count = len(direction)
+    first_way = 0
+    while first_way < way_count:
+        # whole ways, about CHUNK_SIZE node references at a time
+        last_way = max(first_way + 1, int(np.searchsorted(way_start, way_start[first_way] + CHUNK_SIZE)) - 1)
+        last_way = min(last_way, way_count)
+        starts = np.asarray(way_start[first_way : last_way + 1])
+        chunk = np.searchsorted(node_ids, refs[starts[0] : starts[-1]])
+        way = np.repeat(np.arange(last_way - first_way), np.diff(starts))
+        # a pair of consecutive references is an edge if both are in the same way and both were located
+        pair = (way[:-1] == way[1:]) & located[chunk[:-1]] & located[chunk[1:]]
+        first, second, pair_direction = chunk[:-1][pair], chunk[1:][pair], direction[first_way:last_way][way[:-1][pair]]
+        forward = (pair_direction != BACKWARD_ONLY) & owned[first]
+        backward = (pair_direction != FORWARD_ONLY) & owned[second]
+        sources.write(np.concatenate((first[forward], second[backward])))
+        targets.write(np.concatenate((second[forward], first[backward])))
+        first_way = last_way
+    return sources.close(), targets.close()
+
+
+@dataclass(frozen=True)
+class TileGrid:
+    """Splits a (min lon, min lat, max lon, max lat) box into rows and columns of square tiles."""
+
+    bbox: tuple[float, float, float, float]
+    tile_degrees: float
+
+    @property
+    def rows(self) -> int:
+        return max(1, math.ceil((self.bbox[3] - self.bbox[1]) / self.tile_degrees))
+
+    @property
+    def columns(self) -> int:
+        return max(1, math.ceil((self.bbox[2] - self.bbox[0]) / self.tile_degrees))
+
+    def __len__(self) -> int:
+        return self.rows * self.columns
+
+    def box(self, tile: int, margin: float = 0.0) -> tuple[float, float, float, float]:
+        row, column = divmod(tile, self.columns)
+        min_lon = self.bbox[0] + column * self.tile_degrees
+        min_lat = self.bbox[1] + row * self.tile_degrees
+        return (
+            min_lon - margin,
+            min_lat - margin,
+            min_lon + self.tile_degrees + margin,
+            min_lat + self.tile_degrees + margin,
+        )
+
+    def tile_of(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        """Returns the tile owning every point, points outside the grid go to the nearest edge tile."""
+        row = np.clip(np.floor((latitude - self.bbox[1]) / self.tile_degrees), 0, self.rows - 1).astype(np.int64)
+        column = np.clip(np.floor((longitude - self.bbox[0]) / self.tile_degrees), 0, self.columns - 1)
+        return row * self.columns + column.astype(np.int64)
+
+
+@dataclass(frozen=True)
+class TileJob:
+    tile: int
+    source: str  # the tile's own extract, or the whole file
+    work_path: str
+    grid: Optional[TileGrid]  # None to import the whole file as one tile
+    clip: Optional[tuple[float, float, float, float]]
+
+
+@dataclass(frozen=True)
+class TileResult:
+    tile: int
+    ways: int
+    nodes_read: int
+    nodes: int
+    edges: int
+    seconds: float
+
+
+def import_tile(job: TileJob) -> TileResult:
+    """
+    Runs the way, node and edge passes over one tile and saves the tile's roads to its work directory
+    (osm_id, latitude, longitude of its nodes and the node indexes of its edges), runs in a worker process.
+    """
+    start = time.perf_counter()
+    os.makedirs(job.work_path, exist_ok=True)
+    collector = WayCollector(job.work_path)
+    collector.apply_file(job.source)
+    refs, way_start, direction = collector.close()
+
+    node_ids = np.unique(refs)
+    latitude = np.memmap(os.path.join(job.work_path, "lat.bin"), np.float64, "w+", shape=(max(1, len(node_ids)),))
+    longitude = np.memmap(os.path.join(job.work_path, "lon.bin"), np.float64, "w+", shape=(max(1, len(node_ids)),))
+    latitude[:] = np.nan
+    locator = NodeLocator(node_ids, latitude, longitude, job.clip)
+    locator.apply_file(job.source)
+    locator.flush()
+    latitude, longitude = latitude[: len(node_ids)], longitude[: len(node_ids)]
+    located = ~np.isnan(latitude)
+    if job.grid is None:
+        owned = np.ones(len(node_ids), dtype=bool)
+    else:
+        owned = located & (job.grid.tile_of(np.nan_to_num(latitude), np.nan_to_num(longitude)) == job.tile)
+
+    sources, targets = assemble_edges(job.work_path, refs, way_start, direction, node_ids, located, owned)
+    # only the nodes the kept edges use, stitching matches them up across tiles by their OSM id
+    used = np.zeros(len(node_ids), dtype=bool)
+    used[sources] = True
+    used[targets] = True
+    remap = np.cumsum(used) - 1
+    arrays = (node_ids[used], latitude[used], longitude[used], remap[sources], remap[targets])
+    for name, values in zip(TILE_ARRAYS, arrays):
+        np.save(os.path.join(job.work_path, f"tile_{name}.npy"), values)
+    return TileResult(
+        job.tile, collector.ways, locator.nodes_read, int(used.sum()), len(sources), time.perf_counter() - start
+    )
+
+
+def file_bbox(source: str) -> Optional[tuple[float, float, float, float]]:
+    """Returns the bounding box in the file header, if it has one."""
+    reader = osmium.io.Reader(source, osmium.osm.osm_entity_bits.NOTHING)
+    try:
+        box = reader.header().box()
+    finally:
+        reader.close()
+    if not box.valid():
+        return None
+    return (box.bottom_left.lon, box.bottom_left.lat, box.top_right.lon, box.top_right.lat)
+
+
+def extract_tiles(source: str, grid: TileGrid, work_path: str) -> Optional[list[str]]:
+    """
+    Splits the file into one extract per tile with osmium-tool, in a single pass over the file, keeping whole ways
+    so the roads crossing a tile edge can be stitched back together
+    :return: the extract of every tile, or None if osmium-tool is not installed
+    """
+    if shutil.which("osmium") is None:
+        return None
+    # a little margin, so nodes right on a tile edge are in the extract of the tile that owns them
+    extracts = [
+        {"output": f"tile_{tile}.osm.pbf", "bbox": list(grid.box(tile, margin=1e-4))} for tile in range(len(grid))
+    ]
+    config_path = os.path.join(work_path, "extracts.json")
+    with open(config_path, "w") as f:
+        json.dump({"directory": work_path, "extracts": extracts}, f)
+    subprocess.run(
+        ["osmium", "extract", "--config", config_path, "--strategy", "complete_ways", "--overwrite", source],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return [os.path.join(work_path, extract["output"]) for extract in extracts]
+
+
+def stitch_tiles(work_paths: list[str], output: str) -> RoadGraph:
+    """Joins the tiles into one graph, a node shared by several tiles (at a tile edge) becomes a single node."""
+    tiles = [{name: np.load(os.path.join(path, f"tile_{name}.npy")) for name in TILE_ARRAYS} for path in work_paths]
+    osm_ids = np.concatenate([tile["osm_id"] for tile in tiles])
+    node_ids, first = np.unique(osm_ids, return_index=True)
+    latitudes = np.concatenate([tile["latitude"] for tile in tiles])[first]
+    longitudes = np.concatenate([tile["longitude"] for tile in tiles])[first]
+    sources = np.searchsorted(node_ids, np.concatenate([tile["osm_id"][tile["sources"]] for tile in tiles]))
+    targets = np.searchsorted(node_ids, np.concatenate([tile["osm_id"][tile["targets"]] for tile in tiles]))
+    return build_road_graph(output, node_ids, latitudes, longitudes, sources, targets)
+
+
+def import_graph(
+    source: str,
+    output: str,
+    bbox: Optional[tuple[float, float, float, float]] = None,
+    contraction: bool = True,
+    tile_miles: Optional[float] = None,
+    workers: Optional[int] = None,
+    page_degrees: Optional[float] = None,
+    simplify: bool = True,
+) -> RoadGraph:
+    """
+    Imports the drivable roads of an OSM file into a road graph
+    :param source: the .osm.pbf file
+    :param output: the road graph directory to write
+    :param bbox: only keep roads inside this (min lon, min lat, max lon, max lat) box, see get_bounding_box
+    :param contraction: build the contraction hierarchy, slow for large regions
+    :param tile_miles: split the region into tiles this size and import them in parallel, None for one tile
+    :param workers: the number of worker processes, every core if not set
+    :param page_degrees: write a tiled graph with tiles this many degrees across, None for a flat graph
+    :param simplify: merge the nodes that only shape a road into the edges, much smaller and faster to route on
+    :return: the road graph
+    """
+    work_path = f"{output}.work"
+    os.makedirs(work_path, exist_ok=True)
+    try:
+        region = bbox if bbox is not None else file_bbox(source) if tile_miles else None
+        grid = TileGrid(region, miles_to_degrees(tile_miles)) if region is not None and tile_miles else None
+        jobs = [TileJob(0, source, os.path.join(work_path, "tile_0"), None, bbox)]
+        if grid is not None and len(grid) > 1:
+            with stage(f"Splitting into {len(grid)} tiles", "tiles") as progress:
+                extracts = extract_tiles(source, grid, work_path)
+                if extracts is None:
+                    print("osmium-tool is not installed, every tile reads the whole file")
+                    extracts = [source] * len(grid)
+                jobs = [
+                    TileJob(tile, extract, os.path.join(work_path, f"tile_{tile}"), grid, bbox)
+                    for tile, extract in enumerate(extracts)
+                ]
+                progress.count = len(grid)
+
+        with stage("Importing tiles", "edges") as progress:
+            with ProcessPoolExecutor(max_workers=min(len(jobs), workers or os.cpu_count() or 1)) as pool:
+                # a single tile runs in this process
+                for result in pool.map(import_tile, jobs) if len(jobs) > 1 else map(import_tile, jobs):
+                    print(
+                        f"  tile {result.tile}: {result.ways:,} ways, {result.nodes:,} nodes, {result.edges:,} edges "
+                        f"in {result.seconds:.1f}s, {result.nodes_read / max(result.seconds, 1e-9):,.0f} nodes read/s"
+                    )
+                    progress.count += result.edges
+
+        with stage("Stitching tiles", "nodes") as progress:
+            last_stage = not simplify and not page_degrees
+            graph = stitch_tiles(
+                [job.work_path for job in jobs], output if last_stage else os.path.join(work_path, "stitched")
+            )
+            progress.count = graph.node_count
+            print(f"{graph.node_count:,} nodes, {graph.edge_count:,} edges")
+
+        if simplify:
+            with stage("Simplifying", "nodes") as progress:
+                graph, stats = simplify_road_graph(
+                    graph, os.path.join(work_path, "simplified") if page_degrees else output
+                )
+                progress.count = stats.nodes_before
+                print(stats)
+
+        if page_degrees:
+            with stage("Writing paged tiles", "nodes") as progress:
+                tiled = build_tiled_graph(graph, output, page_degrees)
+                progress.count = tiled.node_count
+                print(f"{len(tiled.tile_keys):,} tiles of {page_degrees} degrees")
+            return tiled
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    if contraction:
+        with stage("Building contraction hierarchy", "nodes") as progress:
+            build_contraction_hierarchy(graph)
+            progress.count = graph.node_count
+    with stage("Building spatial index", "nodes") as progress:
+        build_spatial_index(graph)
+        progress.count = graph.node_count
     return graph
 
 
 def main() -> None:
-    # we only need the path finding
-    main_graph = get_graph(source_path)
-    print("graph loaded, simplifying...")
-    ox.simplify_graph(main_graph)
-    print("graph simplified, saving graph to disk")
-    ox.save_graphml(main_graph, "north-america-all-roads.graphml")
-    print("Graph saved, exiting...")
+    parser = argparse.ArgumentParser(description="Import the drivable roads of an OSM extract into a road graph")
+    parser.add_argument("source", nargs="?", default=source_path, help="the .osm.pbf file")
+    parser.add_argument("output", nargs="?", default=output_path, help="the road graph directory to write")
+    parser.add_argument("--center", type=float, nargs=2, metavar=("LAT", "LON"), help="only import around this point")
+    parser.add_argument("--radius", type=float, default=50, help="miles around --center to import")
+    parser.add_argument("--skip-contraction", action="store_true", help="route with A* instead, saves import time")
+    parser.add_argument("--tile-miles", type=float, help="import in parallel tiles this many miles across")
+    parser.add_argument("--workers", type=int, help="worker processes for the tiles, defaults to every core")
+    parser.add_argument("--page-degrees", type=float, help="write a tiled graph the device pages in, tile size")
+    parser.add_argument("--skip-simplify", action="store_true", help="keep every OSM node as a graph node")
+    args = parser.parse_args()
+
+    bbox = get_bounding_box(args.center[0], args.center[1], args.radius) if args.center else None
+    start = time.perf_counter()
+    import_graph(
+        args.source,
+        args.output,
+        bbox,
+        not args.skip_contraction,
+        tile_miles=args.tile_miles,
+        workers=args.workers,
+        page_degrees=args.page_degrees,
+        simplify=not args.skip_simplify,
+    )
+    print(f"Time taken: {time.perf_counter() - start:.1f}s")
 
 
 if __name__ == "__main__":
@@ -1,42 +1,99 @@
-from dataclasses import Field, dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
-import osmnx as ox
-from networkx import MultiDiGraph
-from osmnx import distance
+import numpy as np
 
+from gpspi.mapping.contraction import ContractionHierarchy, load_contraction_hierarchy
+from gpspi.mapping.geodesy import haversine_array
+from gpspi.mapping.road_graph import RoadGraph
+from gpspi.mapping.route_cache import RouteCache
+from gpspi.mapping.router import Router
+from gpspi.mapping.spatial_index import RoadSnap, SpatialIndex, load_spatial_index
+from gpspi.mapping.tiled_graph import TiledRoadGraph, load_road_graph
 from gpspi.types.GPS_data import GPSData
 from gpspi.types.saved_data import Waypoint
 
+# a fix within this of a node on the last route to the same destination rejoins that route instead of routing afresh
+REJOIN_LIMIT_METERS: float = 2000.0
+
 
 @dataclass
 class GPSPathFinder:
-    graph_path: str
-    nav_graph: MultiDiGraph = Field(default=None, init=False)  # gets set in __post_init__
+    graph_path: str  # a road graph directory written by the importer, tiled or not
+    route_cache_path: Optional[str] = None  # where computed routes persist, None to only cache them in memory
+    nav_graph: RoadGraph = field(init=False)  # gets set in __post_init__
+    router: Router = field(init=False)
+    hierarchy: Optional[ContractionHierarchy] = field(init=False)  # None if the importer did not build one
+    spatial_index: Optional[SpatialIndex] = field(init=False)  # None if the importer did not build one
+    route_cache: RouteCache = field(init=False)
+    last_route_source: str = field(init=False, default="")  # how the last route was found, for logging
 
     def __post_init__(self) -> None:
-        self.nav_graph: MultiDiGraph = ox.load_graphml(self.graph_path)
+        self.nav_graph = load_road_graph(self.graph_path)
+        self.router = Router(self.nav_graph)
+        self.hierarchy = load_contraction_hierarchy(self.graph_path, self.nav_graph)
+        self.spatial_index = load_spatial_index(self.graph_path, self.nav_graph)
+        self.route_cache = RouteCache(self.nav_graph, self.route_cache_path)
+        self.route_cache.start()
+
+    def close(self) -> None:
+        """Saves the route cache and stops its writer."""
+        self.route_cache.close()
 
-    def find_nearest_node(self, target_waypoint: Waypoint) -> int:
-        node_ids: list[int] = distance.nearest_nodes(
-            self.nav_graph, target_waypoint.latitude, target_waypoint.longitude
+    def find_nearest_node(self, target_waypoint: Waypoint) -> Optional[int]:
+        """Returns the node nearest the waypoint, None on a tiled graph if the spatial index has none near it."""
+        if self.spatial_index is not None:
+            node = self.spatial_index.nearest_node(target_waypoint.latitude, target_waypoint.longitude)
+            if node is not None:
+                return node
+        if isinstance(self.nav_graph, TiledRoadGraph):
+            # scanning every node would map every tile, far past the memory budget
+            return None
+        # no index, or nothing within its search radius
+        distances = haversine_array(
+            target_waypoint.latitude,
+            target_waypoint.longitude,
+            np.asarray(self.nav_graph.latitude),
+            np.asarray(self.nav_graph.longitude),
         )
-        return node_ids[0]
+        return int(np.argmin(distances))
 
     def find_node_by_id(self, node_id: int, name: Optional[str] = None) -> Waypoint:
-        node = self.nav_graph.nodes[node_id]
-        return Waypoint(node["y"], node["x"], 0.0, name=name if name else node["name"])
+        return self.nav_graph.waypoint(node_id, name=name)
 
-    def find_nearest_road(self, current_position: GPSData) -> int:
+    def snap_to_road(self, target_waypoint: Waypoint) -> Optional[RoadSnap]:
+        """Returns the nearest point on any road, or None if there is no spatial index or no road nearby."""
+        if self.spatial_index is None:
+            return None
+        return self.spatial_index.nearest_segment(target_waypoint.latitude, target_waypoint.longitude)
+
+    def find_nearest_road(self, current_position: GPSData) -> Optional[int]:
         current_pos_waypoint = current_position.as_waypoint()
-        road_node_id = self.find_nearest_node(current_pos_waypoint)
-        return road_node_id
+        if isinstance(self.nav_graph, TiledRoadGraph):
+            # the route starts here, map the surrounding tiles before the search asks for them one by one
+            self.nav_graph.prefetch(current_pos_waypoint.latitude, current_pos_waypoint.longitude)
+        snap = self.snap_to_road(current_pos_waypoint)
+        # the end of the road we are on, not just the closest intersection, which may be on another road
+        return snap.nearest_node if snap is not None else self.find_nearest_node(current_pos_waypoint)
 
-    def navigate_to_nearest_road(self, current_position: GPSData) -> Waypoint:
+    def navigate_to_nearest_road(self, current_position: GPSData) -> Optional[Waypoint]:
+        snap = self.snap_to_road(current_position.as_waypoint())
+        if snap is not None:
+            return Waypoint(round(snap.latitude, 6), round(snap.longitude, 6), 0.0, name="Nearest Rd")
         nearest_node = self.find_nearest_road(current_position)
+        if nearest_node is None:
+            return None
         nearest_node_coords = self.find_node_by_id(nearest_node, name="Nearest Rd")
         return nearest_node_coords
 
+    def shortest_path(self, source: int, target: int) -> list[int]:
+        """Returns the nodes of the shortest path from source to target, or [] if there is none."""
+        if self.hierarchy is not None:
+            path, _ = self.hierarchy.route(source, target)
+        else:
+            path, _ = self.router.bidirectional(source, target)
+        return path
+
     def navigate_to_waypoint(self, current_position: GPSData, target_waypoint: Waypoint) -> list[Waypoint]:
         output_points: list[Waypoint] = []
         # get nearest road (node id)
@@ -44,11 +101,73 @@ class GPSPathFinder:
 
         # destination waypoint (node id)
         destination_node = self.find_nearest_node(target_waypoint)
+        if nearest_node is None or destination_node is None:
+            return output_points
 
         # get all node ids between the two nodes
-        shortest_path = ox.shortest_path(self.nav_graph, nearest_node, destination_node)
-        for node in shortest_path:
+        shortest_path = self.route(current_position.as_waypoint(), nearest_node, destination_node)
+        for node, next_node in zip(shortest_path, shortest_path[1:] + [-1]):
             node_coords = self.find_node_by_id(node)
             output_points.append(node_coords)
+            if next_node != -1:
+                output_points += self.shape_points(node, next_node)
 
         return output_points
+
+    def route(self, position: Waypoint, origin: int, destination: int) -> list[int]:
+        """
+        Returns the route from origin to destination, from the cache, by rejoining the last route to destination,
+        or by a full search, in that order of preference
+        :param position: the current position, origin is the node it snapped to
+        :param origin: the start node
+        :param destination: the goal node
+        :return: the nodes of the route, [] if there is none
+        """
+        path = self.route_cache.get(origin, destination)
+        if path is not None:
+            self.last_route_source = "cache"
+            return path
+        path = self.__rejoin(position, origin, destination)
+        if path is not None:
+            self.last_route_source = "rejoin"
+        else:
+            self.last_route_source = "search"
+            path = self.shortest_path(origin, destination)
+        if path:
+            self.route_cache.put(origin, destination, path)
+        return path
+
+    def __rejoin(self, position: Waypoint, origin: int, destination: int) -> Optional[list[int]]:
+        """
+        Re-plans from the last route to destination: the rest of it when origin is on it, or a short route back to
+        the node on it nearest the position followed by the rest of it. None if there is no route to rejoin
+        """
+        stored = self.route_cache.latest_to(destination)
+        if stored is None:
+            return None
+        if origin in stored:
+            # still on the route
+            return stored[stored.index(origin) :]
+        nodes = np.array(stored)
+        distances = haversine_array(
+            position.latitude,
+            position.longitude,
+            np.asarray(self.nav_graph.latitude[nodes], dtype=np.float64),
+            np.asarray(self.nav_graph.longitude[nodes], dtype=np.float64),
+        )
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > REJOIN_LIMIT_METERS:
+            return None  # far off the route, a fresh one is likely shorter than going back
+        back_to_route = self.shortest_path(origin, stored[nearest])
+        if not back_to_route:
+            return None
+        return back_to_route + stored[nearest + 1 :]
+
+    def shape_points(self, source: int, target: int) -> list[Waypoint]:
+        """Returns the points between source and target along the road joining them, for simplified graphs."""
+        edge = self.nav_graph.edge_between(source, target)
+        latitudes, longitudes = self.nav_graph.edge_points(edge)
+        return [
+            Waypoint(round(latitude, 6), round(longitude, 6), 0.0, name="Road")
+            for latitude, longitude in zip(latitudes[1:-1].tolist(), longitudes[1:-1].tolist())
+        ]
@@ -0,0 +1,222 @@
+"""
+Compact, memory mapped nearest city index, replacing reverse_geocoder's lazy CSV parse and KD-tree build.
+
+The index is a single little endian file:
+    header      magic, city count, grid cell size (degrees), grid rows, grid columns, text table length
+    cell_start  uint32[rows * cols + 1], the first city of every grid cell (cities are sorted by cell)
+    latitude    float32[count]
+    longitude   float32[count]
+    text_start  uint32[count + 1], offsets into the text table
+    text        utf-8 "name<US>admin1<US>admin2<US>cc" for every city
+All arrays are read straight out of the mmap, so opening the index costs a few page faults.
+
+Build it once (on any machine) with:
+    python3 -m gpspi.mapping.city_index cities.idx --countries US,CA
+"""
+
+import argparse
+import csv
+import functools
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+
+import numpy as np
+
+from gpspi.mapping.geodesy import EARTH_RADIUS_M, haversine_array
+from gpspi.types.GPS_data import CityData
+
+CITY_INDEX_PATH: str = "cities.idx"
+
+MAGIC: bytes = b"GPSCITY1"
+HEADER = struct.Struct("<8sIfIII4x")  # padded to 32 bytes so every array starts 8 byte aligned
+FIELD_SEPARATOR: str = "\x1f"
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _grid_cells(latitudes: np.ndarray, longitudes: np.ndarray, cell_degrees: float) -> tuple[np.ndarray, int, int]:
+    """Returns the grid cell of every point and the grid size (rows, cols)."""
+    rows = math.ceil(180 / cell_degrees)
+    cols = math.ceil(360 / cell_degrees)
+    row = np.clip(((latitudes + 90) // cell_degrees).astype(np.int64), 0, rows - 1)
+    col = ((longitudes + 180) // cell_degrees).astype(np.int64) % cols
+    return row * cols + col, rows, cols
+
+
+def build_city_index(
+    source_csv: str,
+    output_path: str,
+    countries: Optional[set[str]] = None,
+    admin1: Optional[set[str]] = None,
+    cell_degrees: float = 1.0,
+) -> int:
+    """
+    Builds a city index from a reverse_geocoder style CSV (lat,lon,name,admin1,admin2,cc)
+    :param source_csv: the CSV to read
+    :param output_path: where to write the index
+    :param countries: only keep cities in these country codes
+    :param admin1: only keep cities in these states / provinces
+    :param cell_degrees: the grid cell size
+    :return: the number of cities written
+    """
+    latitudes: list[float] = []
+    longitudes: list[float] = []
+    texts: list[str] = []
+    with open(source_csv, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if countries and row["cc"] not in countries:
+                continue
+            if admin1 and row["admin1"] not in admin1:
+                continue
+            latitudes.append(float(row["lat"]))
+            longitudes.append(float(row["lon"]))
+            texts.append(FIELD_SEPARATOR.join((row["name"], row["admin1"], row["admin2"], row["cc"])))
+
+    lat = np.asarray(latitudes, dtype=np.float32)
+    lon = np.asarray(longitudes, dtype=np.float32)
+    cells, rows, cols = _grid_cells(lat.astype(np.float64), lon.astype(np.float64), cell_degrees)
+    order = np.argsort(cells, kind="stable")
+    cell_start = np.zeros(rows * cols + 1, dtype=np.uint32)
+    np.cumsum(np.bincount(cells, minlength=rows * cols), out=cell_start[1:])
+
+    encoded = [texts[i].encode("utf-8") for i in order]
+    text_start = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(text) for text in encoded], out=text_start[1:])
+    text = b"".join(encoded)
+
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(encoded), cell_degrees, rows, cols, len(text)))
+        for array in (cell_start, lat[order], lon[order], text_start):
+            f.write(array.tobytes())
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+        f.write(text)
+    return len(encoded)
+
+
+class CityIndex:
+    """Read only view of a city index file, see the module docstring for the layout."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, cell_degrees, rows, cols, text_length = HEADER.unpack_from(self.__mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a city index")
+        self.count: int = count
+        self.cell_degrees: float = cell_degrees
+        self.rows: int = rows
+        self.cols: int = cols
+
+        offset = HEADER.size
+        arrays = []
+        for dtype, length in (
+            (np.uint32, rows * cols + 1),
+            (np.float32, count),
+            (np.float32, count),
+            (np.uint32, count + 1),
+        ):
+            arrays.append(np.frombuffer(self.__mmap, dtype=dtype, count=length, offset=offset))
+            offset = _aligned(offset + length * np.dtype(dtype).itemsize)
+        self.cell_start, self.latitude, self.longitude, self.text_start = arrays
+        self.__text_offset: int = offset
+        assert offset + text_length <= len(self.__mmap)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def city(self, index: int) -> CityData:
+        start = self.__text_offset + int(self.text_start[index])
+        end = self.__text_offset + int(self.text_start[index + 1])
+        name, admin1, admin2, cc = self.__mmap[start:end].decode("utf-8").split(FIELD_SEPARATOR)
+        # float32 only holds ~7 digits, round off the noise so the coordinates print like the source CSV
+        latitude = round(float(self.latitude[index]), 5)
+        longitude = round(float(self.longitude[index]), 5)
+        return CityData(name, cc, latitude, longitude, admin1, admin2)
+
+    def __candidates(self, latitude: float, longitude: float, lat_span: float, lon_span: float) -> np.ndarray:
+        """Returns the indexes of every city in the grid cells overlapping the box around the point."""
+        row_first = max(0, int((latitude - lat_span + 90) // self.cell_degrees))
+        row_last = min(self.rows - 1, int((latitude + lat_span + 90) // self.cell_degrees))
+        if lon_span >= 180:
+            col_ranges = [(0, self.cols - 1)]
+        else:
+            col_first = int((longitude - lon_span + 180) // self.cell_degrees) % self.cols
+            col_last = int((longitude + lon_span + 180) // self.cell_degrees) % self.cols
+            # the box can wrap around the antimeridian
+            col_ranges = (
+                [(col_first, col_last)] if col_first <= col_last else [(col_first, self.cols - 1), (0, col_last)]
+            )
+        # the cells of one grid row are contiguous, so every row is a single slice of cities
+        ranges = [
+            np.arange(self.cell_start[row * self.cols + first], self.cell_start[row * self.cols + last + 1])
+            for row in range(row_first, row_last + 1)
+            for first, last in col_ranges
+        ]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[CityData]:
+        """Returns the city nearest to the point, or None if the index is empty."""
+        if self.count == 0:
+            return None
+        # grow a box around the point until it holds a city
+        span = self.cell_degrees / 2
+        candidates = self.__candidates(latitude, longitude, span, span)
+        while candidates.size == 0:
+            span *= 2
+            candidates = self.__candidates(latitude, longitude, span, 360.0 if span >= 180 else span)
+        distances = haversine_array(latitude, longitude, self.latitude[candidates], self.longitude[candidates])
+        best = float(distances.min())
+
+        # a nearer city can only be inside the spherical cap of radius best, check every cell it touches
+        angle = best / EARTH_RADIUS_M
+        lat_span = math.degrees(angle)
+        if abs(latitude) + lat_span >= 90:
+            lon_span = 360.0  # the cap holds a pole
+        else:
+            lon_span = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+        candidates = self.__candidates(latitude, longitude, lat_span, lon_span)
+        distances = haversine_array(latitude, longitude, self.latitude[candidates], self.longitude[candidates])
+        return self.city(int(candidates[int(np.argmin(distances))]))
+
+
+@functools.lru_cache(maxsize=None)
+def load_city_index(path: str = CITY_INDEX_PATH) -> Optional[CityIndex]:
+    """Returns the city index at path, or None if it has not been built."""
+    if not os.path.exists(path):
+        logging.warning(f"No city index at {path}, build one with python3 -m gpspi.mapping.city_index")
+        return None
+    return CityIndex(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the nearest city index")
+    parser.add_argument("output", nargs="?", default=CITY_INDEX_PATH)
+    parser.add_argument("--source", help="cities CSV, defaults to the one bundled with reverse_geocoder")
+    parser.add_argument("--countries", help="comma separated country codes to keep, ex US,CA")
+    parser.add_argument("--admin1", help="comma separated states / provinces to keep, ex Florida,Georgia")
+    parser.add_argument("--cell-degrees", type=float, default=1.0)
+    args = parser.parse_args()
+
+    source = args.source
+    if source is None:
+        import reverse_geocoder
+
+        source = os.path.join(os.path.dirname(reverse_geocoder.__file__), "rg_cities1000.csv")
+    countries = set(args.countries.split(",")) if args.countries else None
+    admin1 = set(args.admin1.split(",")) if args.admin1 else None
+
+    start = time.perf_counter()
+    count = build_city_index(source, args.output, countries, admin1, args.cell_degrees)
+    print(f"Wrote {count} cities to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+    print(f"Time taken: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Contraction hierarchies for a RoadGraph, so long routes take milliseconds on the Pi.
+
+Preprocessing (offline, on the machine running the importer) contracts the nodes one at a time, least important
+first, adding a shortcut edge wherever removing a node would lengthen a shortest path. Every edge then goes either
+up or down the node order, and a query only ever follows edges upward, from the source forward and from the target
+backward, which visits a few hundred nodes no matter how far apart the two are.
+
+The hierarchy is stored next to the graph arrays, in the same CSR form:
+    ch_rank                                 int32[nodes], the contraction order
+    ch_up_indptr, ch_up_target, ...         edges to higher ranked nodes, indexed by their source
+    ch_down_indptr, ch_down_target, ...     edges from higher ranked nodes, indexed by their target
+where every edge also has a length (float32) and a middle node (int32, -1 for a road, else the contracted node a
+shortcut skips over), plus contraction.json, written last. It records the node count and build id of the graph
+(see road_graph.py), and a hierarchy left behind by an earlier import is ignored rather than routed on.
+
+Build it for an existing graph with:
+    python3 -m gpspi.mapping.contraction north-america-all-roads.graph
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from gpspi.mapping.road_graph import RoadGraph
+
+META_FILE: str = "contraction.json"
+
+# witness searches give up after settling this many nodes and add the shortcut anyway, an extra shortcut only costs
+# a little space while an exhaustive search would make preprocessing quadratic
+WITNESS_SETTLE_LIMIT: int = 64
+
+INFINITY: float = float("inf")
+
+# adjacency used while contracting, node -> neighbor -> (length, middle node)
+_Adjacency = list[dict[int, tuple[float, int]]]
+
+
+def _witness_distance(
+    outgoing: _Adjacency, source: int, skip: int, targets: set[int], limit: float
+) -> dict[int, float]:
+    """Dijkstra from source that avoids skip, stopping past limit or once every target is settled."""
+    distances: dict[int, float] = {source: 0.0}
+    queue: list[tuple[float, int]] = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while queue and remaining and settled < WITNESS_SETTLE_LIMIT:
+        distance, node = heapq.heappop(queue)
+        if distance > distances[node]:
+            continue
+        if distance > limit:
+            break
+        remaining.discard(node)
+        settled += 1
+        for neighbor, (length, _) in outgoing[node].items():
+            if neighbor == skip:
+                continue
+            new_distance = distance + length
+            if new_distance < distances.get(neighbor, INFINITY):
+                distances[neighbor] = new_distance
+                heapq.heappush(queue, (new_distance, neighbor))
+    return distances
+
+
+def _shortcuts(outgoing: _Adjacency, incoming: _Adjacency, node: int) -> list[tuple[int, int, float]]:
+    """Returns the (source, target, length) shortcuts needed to contract node."""
+    shortcuts: list[tuple[int, int, float]] = []
+    if not incoming[node] or not outgoing[node]:
+        return shortcuts
+    longest_out = max(length for length, _ in outgoing[node].values())
+    for source, (length_in, _) in incoming[node].items():
+        targets = {target for target in outgoing[node] if target != source}
+        if not targets:
+            continue
+        witnesses = _witness_distance(outgoing, source, node, targets, length_in + longest_out)
+        for target in targets:
+            via = length_in + outgoing[node][target][0]
+            if witnesses.get(target, INFINITY) > via:
+                shortcuts.append((source, target, via))
+    return shortcuts
+
+
+def _priority(outgoing: _Adjacency, incoming: _Adjacency, node: int, contracted_neighbors: list[int]) -> int:
+    # the edge difference, plus a term that spreads the contraction evenly over the graph
+    removed = len(outgoing[node]) + len(incoming[node])
+    return 2 * (len(_shortcuts(outgoing, incoming, node)) - removed) + contracted_neighbors[node]
+
+
+def _csr(
+    node_count: int, sources: list[int], targets: list[int], lengths: list[float], middles: list[int]
+) -> dict[str, np.ndarray]:
+    keys = np.asarray(sources, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=node_count), out=indptr[1:])
+    return {
+        "indptr": indptr,
+        "target": np.asarray(targets, dtype=np.int32)[order],
+        "length": np.asarray(lengths, dtype=np.float32)[order],
+        "middle": np.asarray(middles, dtype=np.int32)[order],
+    }
+
+
+def build_contraction_hierarchy(graph: RoadGraph, output_path: Optional[str] = None) -> "ContractionHierarchy":
+    """
+    Contracts the graph and writes the hierarchy next to it
+    :param graph: the road graph
+    :param output_path: the directory to write the hierarchy to, the graph's own directory if not set
+    :return: the hierarchy, opened from disk
+    """
+    output_path = output_path if output_path is not None else graph.path
+    n = graph.node_count
+    outgoing: _Adjacency = [{} for _ in range(n)]
+    incoming: _Adjacency = [{} for _ in range(n)]
+    for source in range(n):
+        targets, lengths = graph.neighbors(source)
+        for target, length in zip(targets.tolist(), lengths.tolist()):
+            # parallel roads collapse into the shortest, loops never help a shortest path
+            if target != source and length < outgoing[source].get(target, (INFINITY, -1))[0]:
+                outgoing[source][target] = incoming[target][source] = (length, -1)
+
+    contracted_neighbors = [0] * n
+    queue = [(_priority(outgoing, incoming, node, contracted_neighbors), node) for node in range(n)]
+    heapq.heapify(queue)
+    rank = np.zeros(n, dtype=np.int32)
+    up: tuple[list[int], list[int], list[float], list[int]] = ([], [], [], [])
+    down: tuple[list[int], list[int], list[float], list[int]] = ([], [], [], [])
+    shortcut_count = 0
+    start = time.perf_counter()
+    next_rank = 0
+    while queue:
+        _, node = heapq.heappop(queue)
+        # lazy updates, the priority may be stale, re-queue the node if it no longer is the least important
+        priority = _priority(outgoing, incoming, node, contracted_neighbors)
+        if queue and priority > queue[0][0]:
+            heapq.heappush(queue, (priority, node))
+            continue
+        rank[node] = next_rank
+        next_rank += 1
+
+        shortcuts = _shortcuts(outgoing, incoming, node)
+        # every edge still attached to node leads to a node contracted later, so it goes up the order
+        for target, (length, middle) in outgoing[node].items():
+            for array, value in zip(up, (node, target, length, middle)):
+                array.append(value)
+            del incoming[target][node]
+            contracted_neighbors[target] += 1
+        for source, (length, middle) in incoming[node].items():
+            for array, value in zip(down, (node, source, length, middle)):
+                array.append(value)
+            del outgoing[source][node]
+            contracted_neighbors[source] += 1
+        outgoing[node] = {}
+        incoming[node] = {}
+        for source, target, length in shortcuts:
+            if length < outgoing[source].get(target, (INFINITY, -1))[0]:
+                outgoing[source][target] = incoming[target][source] = (length, node)
+                shortcut_count += 1
+        if next_rank % 100_000 == 0:
+            logging.info(f"Contracted {next_rank}/{n} nodes, {shortcut_count} shortcuts")
+    logging.info(f"Contracted {n} nodes in {time.perf_counter() - start:.1f}s, added {shortcut_count} shortcuts")
+
+    arrays = {"rank": rank}
+    for prefix, edges in (("up", up), ("down", down)):
+        for name, array in _csr(n, *edges).items():
+            arrays[f"{prefix}_{name}"] = array
+    os.makedirs(output_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(output_path, f"ch_{name}.npy"), array)
+    with open(os.path.join(output_path, META_FILE), "w") as f:
+        json.dump(
+            {
+                "graph": graph.build_id,
+                "nodes": n,
+                "up_edges": len(up[0]),
+                "down_edges": len(down[0]),
+                "shortcuts": shortcut_count,
+            },
+            f,
+        )
+    return ContractionHierarchy(output_path, graph)
+
+
+def _load(path: str, name: str) -> np.ndarray:
+    return np.asarray(np.load(os.path.join(path, f"ch_{name}.npy"), mmap_mode="r"))
+
+
+class ContractionHierarchy:
+    """Read only, memory mapped hierarchy, see the module docstring for the layout."""
+
+    def __init__(self, path: str, graph: RoadGraph) -> None:
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        if meta["nodes"] != graph.node_count or meta.get("graph") != graph.build_id:
+            raise ValueError(f"The contraction hierarchy in {path} is for another graph, rebuild it")
+        self.node_count: int = meta["nodes"]
+        self.rank: np.ndarray = _load(path, "rank")
+        # (indptr, target, length, middle) of the upward edges and of the downward edges indexed by their target
+        self.up: tuple[np.ndarray, ...] = tuple(
+            _load(path, f"up_{name}") for name in ("indptr", "target", "length", "middle")
+        )
+        self.down: tuple[np.ndarray, ...] = tuple(
+            _load(path, f"down_{name}") for name in ("indptr", "target", "length", "middle")
+        )
+        self.nodes_visited: int = 0  # by the last query, for benchmarking
+
+    def __middle(self, source: int, target: int) -> int:
+        """Returns the middle node of the shortest edge from source to target, -1 if it is a road."""
+        # an edge is stored at its lower ranked end
+        if self.rank[source] < self.rank[target]:
+            indptr, targets, lengths, middles = self.up
+            key, other = source, target
+        else:
+            indptr, targets, lengths, middles = self.down
+            key, other = target, source
+        start, end = int(indptr[key]), int(indptr[key + 1])
+        candidates = np.flatnonzero(targets[start:end] == other)
+        best = candidates[np.argmin(lengths[start:end][candidates])]
+        return int(middles[start + best])
+
+    def __unpack(self, source: int, target: int, path: list[int]) -> None:
+        """Appends the roads the edge from source to target stands for to path, not including source."""
+        stack = [(source, target)]
+        while stack:
+            edge_source, edge_target = stack.pop()
+            middle = self.__middle(edge_source, edge_target)
+            if middle == -1:
+                path.append(edge_target)
+            else:
+                # the first half goes on the stack last, so it is unpacked first
+                stack.append((middle, edge_target))
+                stack.append((edge_source, middle))
+
+    def route(self, source: int, target: int) -> tuple[list[int], float]:
+        """
+        Finds the shortest path with a bidirectional search up the hierarchy
+        :param source: the start node
+        :param target: the goal node
+        :return: the nodes of the path from source to target and its length (meters), ([], inf) if there is none
+        """
+        distances: tuple[dict[int, float], dict[int, float]] = ({source: 0.0}, {target: 0.0})
+        parents: tuple[dict[int, int], dict[int, int]] = ({}, {})
+        queues: tuple[list[tuple[float, int]], list[tuple[float, int]]] = ([(0.0, source)], [(0.0, target)])
+        adjacency = (self.up, self.down)
+        best = INFINITY
+        meeting = -1
+        while queues[0] or queues[1]:
+            # both searches only go up, so neither can improve on best once its closest node is past it
+            for side in (0, 1):
+                queue = queues[side]
+                if queue and queue[0][0] >= best:
+                    queue.clear()
+                if not queue:
+                    continue
+                distance, node = heapq.heappop(queue)
+                own, other = distances[side], distances[1 - side]
+                if distance > own[node]:
+                    continue
+                if node in other and distance + other[node] < best:
+                    best = distance + other[node]
+                    meeting = node
+                indptr, targets, lengths, _ = adjacency[side]
+                start, end = int(indptr[node]), int(indptr[node + 1])
+                for neighbor, length in zip(targets[start:end].tolist(), lengths[start:end].tolist()):
+                    new_distance = distance + length
+                    if new_distance < own.get(neighbor, INFINITY):
+                        own[neighbor] = new_distance
+                        parents[side][neighbor] = node
+                        heapq.heappush(queue, (new_distance, neighbor))
+        self.nodes_visited = len(distances[0]) + len(distances[1])
+        if meeting == -1:
+            return [], INFINITY
+
+        # the hierarchy path goes up from the source to the meeting node and down to the target
+        hierarchy_path = [meeting]
+        while hierarchy_path[-1] in parents[0]:
+            hierarchy_path.append(parents[0][hierarchy_path[-1]])
+        hierarchy_path.reverse()
+        while hierarchy_path[-1] in parents[1]:
+            hierarchy_path.append(parents[1][hierarchy_path[-1]])
+        path = [source]
+        for edge_source, edge_target in zip(hierarchy_path, hierarchy_path[1:]):
+            self.__unpack(edge_source, edge_target, path)
+        return path, best
+
+
+def load_contraction_hierarchy(path: str, graph: RoadGraph) -> Optional[ContractionHierarchy]:
+    """Returns the hierarchy stored with the graph at path, or None if it has not been built for this graph."""
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        logging.info(f"No contraction hierarchy in {path}, routing falls back to A*")
+        return None
+    try:
+        return ContractionHierarchy(path, graph)
+    except ValueError as e:
+        logging.warning(f"{e}, routing falls back to A*")
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy for a road graph")
+    parser.add_argument("graph", help="road graph directory written by the importer")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    graph = RoadGraph(args.graph)
+    start = time.perf_counter()
+    build_contraction_hierarchy(graph)
+    print(f"Time taken: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
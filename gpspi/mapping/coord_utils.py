@@ -1,10 +1,16 @@
-from typing import Union
+from typing import Sequence, Union
 
-import reverse_geocoder as rg
-from osmnx import bearing, distance
+import numpy as np
 
+from gpspi.mapping.city_index import load_city_index
+from gpspi.mapping.geodesy import (
+    haversine,
+    haversine_array,
+    initial_bearing,
+    initial_bearing_array,
+)
 from gpspi.types.GPS_data import CityData
-from gpspi.types.saved_data import Waypoint
+from gpspi.types.saved_data import Waypoint, WaypointSet
 
 
 def get_magnetic_bearing(current_pos: Waypoint, target_pos: Waypoint) -> float:
@@ -21,7 +27,7 @@ def get_magnetic_bearing(current_pos: Waypoint, target_pos: Waypoint) -> float:
     lat2 = target_pos.latitude
     lon2 = target_pos.longitude
     # return the bearing
-    true_bearing = bearing.calculate_bearing(lat1, lon1, lat2, lon2)
+    true_bearing = initial_bearing(lat1, lon1, lat2, lon2)
     offset = 0  # TODO: get the magnetic offset
     magnetic_bearing = true_bearing + offset
     return magnetic_bearing
@@ -41,7 +47,7 @@ def get_distance_meters(current_pos: Waypoint, target_pos: Waypoint) -> float:
     lat2 = target_pos.latitude
     lon2 = target_pos.longitude
     # use the haversine formula to calculate the distance
-    dist_meters = distance.great_circle(lat1, lon1, lat2, lon2)
+    dist_meters = haversine(lat1, lon1, lat2, lon2)
     return dist_meters
 
 
@@ -57,6 +63,46 @@ def get_distance_feet(current_pos: Waypoint, target_pos: Waypoint) -> float:
     return dist_feet
 
 
+def get_waypoint_coordinates(waypoints: Union[Sequence[Waypoint], WaypointSet]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the coordinates of many waypoints as arrays
+    :param waypoints: the waypoints
+    :return: the latitudes and longitudes (degrees) of the waypoints
+    """
+    if isinstance(waypoints, WaypointSet):
+        return waypoints.latitudes, waypoints.longitudes
+    count = len(waypoints)
+    latitudes = np.fromiter((waypoint.latitude for waypoint in waypoints), dtype=np.float64, count=count)
+    longitudes = np.fromiter((waypoint.longitude for waypoint in waypoints), dtype=np.float64, count=count)
+    return latitudes, longitudes
+
+
+def get_distances_and_bearings(
+    current_pos: Waypoint, waypoints: Union[Sequence[Waypoint], WaypointSet]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the distance and bearing from the current position to every waypoint, in one vectorized pass
+    :param current_pos: the current position
+    :param waypoints: the target positions
+    :return: the distances (meters) and magnetic bearings (degrees) from the current position to each waypoint
+    """
+    latitudes, longitudes = get_waypoint_coordinates(waypoints)
+    distances = haversine_array(current_pos.latitude, current_pos.longitude, latitudes, longitudes)
+    true_bearings = initial_bearing_array(current_pos.latitude, current_pos.longitude, latitudes, longitudes)
+    offset = 0  # TODO: get the magnetic offset
+    magnetic_bearings = true_bearings + offset
+    return distances, magnetic_bearings
+
+
+def get_proximity_order(distances: np.ndarray) -> np.ndarray:
+    """
+    Returns the waypoint indexes sorted from nearest to farthest
+    :param distances: the distances to each waypoint, from get_distances_and_bearings
+    :return: the indexes of the waypoints, nearest first (ties keep their saved order)
+    """
+    return np.argsort(distances, kind="stable")
+
+
 def get_nearest_city(current_pos: Waypoint) -> CityData:
     """
     Returns the nearest city to the current position
@@ -65,8 +111,16 @@ def get_nearest_city(current_pos: Waypoint) -> CityData:
     """
     lat = current_pos.latitude
     lon = current_pos.longitude
-    # get the nearest city
-    results: list[dict[str, Union[str, float]]] = rg.search((lat, lon))
+    # get the nearest city, from the prebuilt index if there is one
+    city_index = load_city_index()
+    if city_index is not None:
+        nearest = city_index.nearest(lat, lon)
+        return nearest if nearest is not None else CityData("", "", 0, 0, "", "")
+
+    # reverse_geocoder parses its CSV and builds a KD-tree on first use, which takes seconds
+    import reverse_geocoder as rg
+
+    results: list[dict[str, Union[str, float]]] = rg.search((lat, lon), mode=1, verbose=False)
     if len(results) == 0:
         return CityData("", "", 0, 0, "", "")
     city = results[0]
@@ -77,3 +131,13 @@ def get_nearest_city(current_pos: Waypoint) -> CityData:
     admin1: str = str(city["admin1"])
     admin2: str = str(city["admin2"])
     return CityData(name, cc, r_lat, r_lon, admin1, admin2)
+
+
+def prewarm_nearest_city() -> bool:
+    """
+    Loads whichever lookup get_nearest_city uses (the city index, or reverse_geocoder's KD-tree), so the first
+    real lookup does not stall the UI
+    :return: True once the lookup is ready
+    """
+    get_nearest_city(Waypoint(0.0, 0.0, 0.0))
+    return True
@@ -0,0 +1,138 @@
+"""
+Self contained geodesy, so the runtime never has to import osmnx (and with it geopandas, shapely and pandas).
+Every function has a scalar version built on math, for the once per frame calls, and an _array version built on
+numpy that takes arrays for the target points, for working on many points at once.
+"""
+
+import math
+
+import numpy as np
+
+# the mean earth radius, the same value osmnx uses, so distances match what the importer produced
+EARTH_RADIUS_M: float = 6_371_009.0
+
+# WGS84 ellipsoid, for vincenty
+WGS84_A: float = 6_378_137.0
+WGS84_F: float = 1 / 298.257223563
+WGS84_B: float = WGS84_A * (1 - WGS84_F)
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Returns the great circle distance between two points
+    :param lat1: latitude of the first point (degrees)
+    :param lon1: longitude of the first point (degrees)
+    :param lat2: latitude of the second point (degrees)
+    :param lon2: longitude of the second point (degrees)
+    :return: the distance (meters) between the points on a spherical earth
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    h = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * math.asin(math.sqrt(min(1.0, h))) * EARTH_RADIUS_M
+
+
+def initial_bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Returns the initial bearing of the great circle from the first point to the second
+    :param lat1: latitude of the first point (degrees)
+    :param lon1: longitude of the first point (degrees)
+    :param lat2: latitude of the second point (degrees)
+    :param lon2: longitude of the second point (degrees)
+    :return: the bearing (degrees from true north, 0 to 360)
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_lon = math.radians(lon2 - lon1)
+    y = math.sin(delta_lon) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(delta_lon)
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+def vincenty(
+    lat1: float, lon1: float, lat2: float, lon2: float, max_iterations: int = 200, tolerance: float = 1e-12
+) -> float:
+    """
+    Returns the distance between two points on the WGS84 ellipsoid (Vincenty's inverse formula)
+    :param lat1: latitude of the first point (degrees)
+    :param lon1: longitude of the first point (degrees)
+    :param lat2: latitude of the second point (degrees)
+    :param lon2: longitude of the second point (degrees)
+    :param max_iterations: give up and use haversine after this many iterations (nearly antipodal points)
+    :param tolerance: convergence limit on lambda (radians)
+    :return: the distance (meters) between the points
+    """
+    u1 = math.atan((1 - WGS84_F) * math.tan(math.radians(lat1)))
+    u2 = math.atan((1 - WGS84_F) * math.tan(math.radians(lat2)))
+    big_l = math.radians(lon2 - lon1)
+    sin_u1, cos_u1 = math.sin(u1), math.cos(u1)
+    sin_u2, cos_u2 = math.sin(u2), math.cos(u2)
+
+    lam = big_l
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        if sin_sigma == 0:
+            return 0.0  # coincident points
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / sin_sigma
+        cos_sq_alpha = 1 - sin_alpha**2
+        # on the equator cos_sq_alpha is 0 and so is the term it divides
+        cos_2sigma_m = cos_sigma - 2 * sin_u1 * sin_u2 / cos_sq_alpha if cos_sq_alpha != 0 else 0.0
+        c = WGS84_F / 16 * cos_sq_alpha * (4 + WGS84_F * (4 - 3 * cos_sq_alpha))
+        lam_prev = lam
+        lam = big_l + (1 - c) * WGS84_F * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m**2))
+        )
+        if abs(lam - lam_prev) < tolerance:
+            break
+    else:
+        return haversine(lat1, lon1, lat2, lon2)
+
+    u_sq = cos_sq_alpha * (WGS84_A**2 - WGS84_B**2) / WGS84_B**2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    inner = cos_sigma * (-1 + 2 * cos_2sigma_m**2) - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (
+        -3 + 4 * cos_2sigma_m**2
+    )
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * inner)
+    return WGS84_B * big_a * (sigma - delta_sigma)
+
+
+def haversine_array(
+    lat1: float | np.ndarray, lon1: float | np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """
+    Returns the great circle distances from one point to many, or from each of many points to its own target
+    :param lat1: latitude of the origin, or of one origin per target (degrees)
+    :param lon1: longitude of the origin, or of one origin per target (degrees)
+    :param lat2: latitudes of the targets (degrees)
+    :param lon2: longitudes of the targets (degrees)
+    :return: the distances (meters) from the origin to each target
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    h = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.minimum(1.0, h))) * EARTH_RADIUS_M
+
+
+def initial_bearing_array(lat1: float, lon1: float, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    Returns the initial great circle bearings from one point to many
+    :param lat1: latitude of the origin (degrees)
+    :param lon1: longitude of the origin (degrees)
+    :param lat2: latitudes of the targets (degrees)
+    :param lon2: longitudes of the targets (degrees)
+    :return: the bearings (degrees from true north, 0 to 360) from the origin to each target
+    """
+    phi1 = math.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_lon = np.radians(lon2 - lon1)
+    cos_phi2 = np.cos(phi2)
+    y = np.sin(delta_lon) * cos_phi2
+    x = math.cos(phi1) * np.sin(phi2) - math.sin(phi1) * cos_phi2 * np.cos(delta_lon)
+    return np.degrees(np.arctan2(y, x)) % 360
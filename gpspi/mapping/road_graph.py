@@ -0,0 +1,211 @@
+"""
+Compact road graph, replacing the GraphML file and the networkx graph built from it.
+
+The graph is a directory of .npy arrays in CSR (compressed sparse row) form:
+    latitude    float32[nodes]
+    longitude   float32[nodes]
+    osm_id      int64[nodes], the OpenStreetMap id of every node
+    indptr      int64[nodes + 1], the edges leaving node i are indptr[i]:indptr[i + 1]
+    target      int32[edges], the node every edge leads to
+    length      float32[edges], the length of every edge (meters)
+    reverse_indptr, reverse_target, reverse_length
+                the same edges indexed by their target node, for searching backward from a destination
+    shape_indptr
+                int64[edges + 1], the shape points of edge i are shape_indptr[i]:shape_indptr[i + 1]
+    shape_latitude, shape_longitude
+                float32[shape points], the points between the two ends of every edge, in order from its source, for
+                the roads the simplifier (see simplify.py) merged into one edge
+plus meta.json with the format version, the array sizes and a build id, unique to every graph written, for the files
+that only make sense with one graph (see route_cache.py). Every array is opened with mmap_mode="r", so
+loading the graph costs a few page faults and the OS pages in only the parts of the graph routing touches.
+"""
+
+import json
+import os
+import uuid
+from typing import Optional
+
+import numpy as np
+
+from gpspi.mapping.geodesy import haversine_array
+from gpspi.types.saved_data import Waypoint
+
+FORMAT_VERSION: int = 3
+META_FILE: str = "meta.json"
+
+
+def edge_lengths(latitudes: np.ndarray, longitudes: np.ndarray, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Returns the great circle length of every edge
+    :param latitudes: node latitudes (degrees)
+    :param longitudes: node longitudes (degrees)
+    :param sources: the source node of every edge
+    :param targets: the target node of every edge
+    :return: the edge lengths (meters)
+    """
+    return haversine_array(
+        latitudes[sources].astype(np.float64),
+        longitudes[sources].astype(np.float64),
+        latitudes[targets].astype(np.float64),
+        longitudes[targets].astype(np.float64),
+    ).astype(np.float32)
+
+
+def _csr(keys: np.ndarray, node_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the CSR index pointer for edges grouped by keys and the edge order that groups them."""
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=node_count), out=indptr[1:])
+    return indptr, np.argsort(keys, kind="stable")
+
+
+def build_road_graph(
+    output_path: str,
+    osm_ids: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    lengths: Optional[np.ndarray] = None,
+    shapes: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+) -> "RoadGraph":
+    """
+    Writes a road graph from an edge list
+    :param output_path: the directory to write the graph to
+    :param osm_ids: the OpenStreetMap id of every node
+    :param latitudes: the latitude of every node (degrees)
+    :param longitudes: the longitude of every node (degrees)
+    :param sources: the source node (index into the node arrays) of every directed edge
+    :param targets: the target node of every directed edge
+    :param lengths: the length of every edge (meters), great circle lengths are used if not given
+    :param shapes: the (indptr, latitudes, longitudes) of the shape points of every edge, straight edges if not given
+    :return: the graph, opened from disk
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float32)
+    longitudes = np.asarray(longitudes, dtype=np.float32)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    if lengths is None:
+        lengths = edge_lengths(latitudes, longitudes, sources, targets)
+    lengths = np.asarray(lengths, dtype=np.float32)
+    indptr, order = _csr(sources, len(latitudes))
+    reverse_indptr, reverse_order = _csr(targets, len(latitudes))
+    if shapes is None:
+        shapes = (np.zeros(len(targets) + 1, dtype=np.int64), np.empty(0, np.float32), np.empty(0, np.float32))
+    shape_indptr, shape_latitudes, shape_longitudes = shapes
+    # the shape points follow their edges into CSR order
+    shape_counts = np.diff(shape_indptr)[order]
+    sorted_shape_indptr = np.zeros(len(targets) + 1, dtype=np.int64)
+    np.cumsum(shape_counts, out=sorted_shape_indptr[1:])
+    shape_order = np.repeat(shape_indptr[:-1][order] - sorted_shape_indptr[:-1], shape_counts) + np.arange(
+        sorted_shape_indptr[-1]
+    )
+
+    arrays = {
+        "latitude": latitudes,
+        "longitude": longitudes,
+        "osm_id": np.asarray(osm_ids, dtype=np.int64),
+        "indptr": indptr,
+        "target": targets[order].astype(np.int32),
+        "length": lengths[order],
+        "reverse_indptr": reverse_indptr,
+        "reverse_target": sources[reverse_order].astype(np.int32),
+        "reverse_length": lengths[reverse_order],
+        "shape_indptr": sorted_shape_indptr,
+        "shape_latitude": np.asarray(shape_latitudes, dtype=np.float32)[shape_order],
+        "shape_longitude": np.asarray(shape_longitudes, dtype=np.float32)[shape_order],
+    }
+    os.makedirs(output_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(output_path, f"{name}.npy"), array)
+    # written last, a graph without meta.json is an interrupted import
+    with open(os.path.join(output_path, META_FILE), "w") as f:
+        json.dump(
+            {
+                "version": FORMAT_VERSION,
+                "build_id": uuid.uuid4().hex,
+                "nodes": len(latitudes),
+                "edges": len(targets),
+                "shape_points": int(sorted_shape_indptr[-1]),
+            },
+            f,
+        )
+    return RoadGraph(output_path)
+
+
+def _load(path: str, name: str) -> np.ndarray:
+    # a plain ndarray view of the memmap, indexing an np.memmap costs several times more in the router's inner loop
+    return np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+
+class RoadGraph:
+    """Read only, memory mapped road graph, see the module docstring for the layout."""
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path} is version {meta['version']}, expected {FORMAT_VERSION}, re-run the importer")
+        self.node_count: int = meta["nodes"]
+        self.edge_count: int = meta["edges"]
+        self.build_id: Optional[str] = meta.get("build_id")  # None for graphs written before there was one
+        self.latitude: np.ndarray = _load(path, "latitude")
+        self.longitude: np.ndarray = _load(path, "longitude")
+        self.osm_id: np.ndarray = _load(path, "osm_id")
+        self.indptr: np.ndarray = _load(path, "indptr")
+        self.target: np.ndarray = _load(path, "target")
+        self.length: np.ndarray = _load(path, "length")
+        self.reverse_indptr: np.ndarray = _load(path, "reverse_indptr")
+        self.reverse_target: np.ndarray = _load(path, "reverse_target")
+        self.reverse_length: np.ndarray = _load(path, "reverse_length")
+        self.shape_indptr: np.ndarray = _load(path, "shape_indptr")
+        self.shape_latitude: np.ndarray = _load(path, "shape_latitude")
+        self.shape_longitude: np.ndarray = _load(path, "shape_longitude")
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    def neighbors(self, node: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the target nodes and lengths of the edges leaving node."""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.target[start:end], self.length[start:end]
+
+    def reverse_neighbors(self, node: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the source nodes and lengths of the edges entering node."""
+        start, end = self.reverse_indptr[node], self.reverse_indptr[node + 1]
+        return self.reverse_target[start:end], self.reverse_length[start:end]
+
+    def edge_sources(self, edges: np.ndarray) -> np.ndarray:
+        """Returns the source node of every edge index in edges."""
+        return np.searchsorted(self.indptr, edges, side="right") - 1
+
+    def edge_between(self, source: int, target: int) -> int:
+        """Returns the shortest edge from source to target, -1 if there is none."""
+        start = int(self.indptr[source])
+        targets, lengths = self.neighbors(source)
+        matches = np.flatnonzero(targets == target)
+        if len(matches) == 0:
+            return -1
+        return start + int(matches[np.argmin(lengths[matches])])
+
+    def edge_points(self, edge: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the latitudes and longitudes of the points along edge, from its source to its target."""
+        source = int(self.edge_sources(np.array([edge]))[0])
+        target = int(self.target[edge])
+        start, end = int(self.shape_indptr[edge]), int(self.shape_indptr[edge + 1])
+        latitudes = np.concatenate(([self.latitude[source]], self.shape_latitude[start:end], [self.latitude[target]]))
+        longitudes = np.concatenate(
+            ([self.longitude[source]], self.shape_longitude[start:end], [self.longitude[target]])
+        )
+        return latitudes.astype(np.float64), longitudes.astype(np.float64)
+
+    def coordinates(self, node: int) -> tuple[float, float]:
+        """Returns the (latitude, longitude) of node."""
+        return float(self.latitude[node]), float(self.longitude[node])
+
+    def waypoint(self, node: int, name: Optional[str] = None) -> Waypoint:
+        latitude, longitude = self.coordinates(node)
+        # float32 is good to ~1e-6 degrees, round off the noise so the coordinates print cleanly
+        return Waypoint(
+            round(latitude, 6), round(longitude, 6), 0.0, name=name if name else f"Node {self.osm_id[node]}"
+        )
@@ -0,0 +1,129 @@
+"""
+Least recently used cache of computed routes, kept on disk next to destination.json so it survives a restart.
+
+Routes are keyed by the node the fix snapped to and the destination node, so asking for the same route again from
+the same stretch of road costs a dict lookup instead of a search. Node indexes only mean something for the graph
+they came from: a tiled copy of a graph, or a new import of the same extract, has the same size but numbers its
+nodes differently. So the file records the build id of the graph (see road_graph.py) and is ignored if it is not
+the one loaded; with a graph written before there were build ids the cache is kept in memory only.
+
+Lookups and new routes only touch memory. The cache's own thread writes the file when something changed, every
+SAVE_SECONDS and once more on close(), so routing on the render worker never waits on the SD card.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from gpspi.mapping.road_graph import RoadGraph
+
+DEFAULT_CAPACITY: int = 32
+# how often the writer thread saves the cache, if it changed
+SAVE_SECONDS: float = 60.0
+
+
+class RouteCache(threading.Thread):
+    """Routes (lists of node indexes) by (origin, destination), the least recently used go first past capacity."""
+
+    def __init__(self, graph: RoadGraph, path: Optional[str], capacity: int = DEFAULT_CAPACITY) -> None:
+        super().__init__(name="route-cache", daemon=True)
+        if path is not None and graph.build_id is None:
+            logging.info(f"{graph.path} has no build id, re-run the importer to keep routes across restarts")
+            path = None
+        self.path: Optional[str] = path  # None to keep the cache in memory only
+        self.capacity: int = capacity
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__graph_key: Optional[str] = graph.build_id
+        self.__routes: OrderedDict[tuple[int, int], list[int]] = OrderedDict()
+        self.__lock: threading.Lock = threading.Lock()  # routes are looked up on the render worker, saved here
+        self.__changed: bool = False
+        self.__closed: threading.Event = threading.Event()
+        self.__load()
+
+    def __len__(self) -> int:
+        return len(self.__routes)
+
+    def __load(self) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logging.exception(f"Could not read the route cache {self.path}, starting empty")
+            return
+        if data.get("graph") != self.__graph_key:
+            logging.info(f"The route cache {self.path} is for another road graph, starting empty")
+            return
+        for origin, destination, route in data["routes"]:
+            self.__routes[(origin, destination)] = route
+
+    def save(self) -> None:
+        """
+        Writes the cache to a temporary file, syncs it and renames it over the old one, so a crash never leaves half
+        """
+        if self.path is None:
+            return
+        with self.__lock:
+            routes = [[origin, destination, route] for (origin, destination), route in self.__routes.items()]
+            self.__changed = False
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"graph": self.__graph_key, "routes": routes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+
+    def __save_if_changed(self) -> None:
+        if not self.__changed:
+            return
+        try:
+            self.save()
+        except OSError:
+            # the routes are still in memory, the next save tries again
+            logging.exception(f"Saving the route cache {self.path} failed")
+            self.__changed = True
+
+    def run(self) -> None:
+        while not self.__closed.wait(SAVE_SECONDS):
+            self.__save_if_changed()
+        self.__save_if_changed()
+
+    def close(self) -> None:
+        """Saves the cache if it changed and stops the writer."""
+        self.__closed.set()
+        if self.is_alive():
+            self.join()
+        else:
+            self.__save_if_changed()
+
+    def get(self, origin: int, destination: int) -> Optional[list[int]]:
+        with self.__lock:
+            route = self.__routes.get((origin, destination))
+            if route is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__routes.move_to_end((origin, destination))
+            return route
+
+    def put(self, origin: int, destination: int, route: list[int]) -> None:
+        """Caches a route, the writer thread saves it."""
+        with self.__lock:
+            self.__routes[(origin, destination)] = route
+            self.__routes.move_to_end((origin, destination))
+            while len(self.__routes) > self.capacity:
+                self.__routes.popitem(last=False)
+            self.__changed = self.path is not None
+
+    def latest_to(self, destination: int) -> Optional[list[int]]:
+        """Returns the most recently used route to destination, from wherever it started."""
+        with self.__lock:
+            for (_, route_destination), route in reversed(self.__routes.items()):
+                if route_destination == destination:
+                    return route
+        return None
@@ -0,0 +1,290 @@
+"""
+A* and bidirectional A* over a RoadGraph.
+
+The search state (distances, parents and heuristic values) lives in arrays allocated once per router and reset
+after every query by walking the nodes the query touched, so a short route costs the same on a state sized graph
+as on a city sized one. Past DENSE_STATE_NODES nodes, or on a tiled graph, those arrays would cost more memory than
+the graph itself pages in, and the state moves to dicts holding only the touched nodes instead. The heuristic is the
+great circle distance to the goal, which never overestimates since no road is shorter than the great circle between
+its ends.
+
+Benchmark it on an imported graph with:
+    python3 -m gpspi.mapping.router florida-all-roads.graph --queries 100
+"""
+
+import argparse
+import heapq
+import math
+import random
+import time
+from array import array
+from typing import Callable, Optional
+
+from gpspi.mapping.contraction import load_contraction_hierarchy
+from gpspi.mapping.geodesy import EARTH_RADIUS_M
+from gpspi.mapping.road_graph import RoadGraph
+from gpspi.mapping.tiled_graph import TiledRoadGraph
+
+INFINITY: float = float("inf")
+
+# float32 coordinates and lengths can put the heuristic a hair above the true distance, shrink it to stay admissible
+HEURISTIC_SCALE: float = 0.999
+
+# above this the search state is kept sparse, the dense arrays take 28 bytes per node
+DENSE_STATE_NODES: int = 1_000_000
+
+
+class SparseState(dict):
+    """Search state of the touched nodes only, reads of any other node return the default."""
+
+    def __init__(self, default: float) -> None:
+        super().__init__()
+        self.default = default
+
+    def __missing__(self, node: int) -> float:
+        return self.default
+
+
+class Router:
+    """Shortest paths over a RoadGraph, not thread safe (every query reuses the same search state)."""
+
+    def __init__(self, graph: RoadGraph) -> None:
+        self.graph: RoadGraph = graph
+        self.__allocated: bool = False
+        self.nodes_visited: int = 0  # by the last query, for benchmarking
+
+    def __allocate(self) -> None:
+        # allocated on the first query, not at load time, a graph that is never routed on costs no memory
+        n = self.graph.node_count
+        self.__sparse: bool = n > DENSE_STATE_NODES or isinstance(self.graph, TiledRoadGraph)
+        self.__distance: list[array] | list[SparseState]
+        self.__parent: list[array] | list[SparseState]
+        self.__potential: array | SparseState
+        if self.__sparse:
+            self.__distance = [SparseState(INFINITY), SparseState(INFINITY)]
+            self.__parent = [SparseState(-1), SparseState(-1)]
+            self.__potential = SparseState(math.nan)
+        else:
+            self.__distance = [array("d", [INFINITY]) * n, array("d", [INFINITY]) * n]
+            self.__parent = [array("i", [-1]) * n, array("i", [-1]) * n]
+            self.__potential = array("d", [math.nan]) * n
+        self.__touched: list[int] = []
+        self.__allocated = True
+
+    def __reset(self) -> None:
+        distance_forward, distance_backward = self.__distance
+        parent_forward, parent_backward = self.__parent
+        potential = self.__potential
+        if self.__sparse:
+            for state in [*self.__distance, *self.__parent, potential]:
+                state.clear()
+            self.nodes_visited = len(self.__touched)
+            self.__touched.clear()
+            return
+        for node in self.__touched:
+            distance_forward[node] = distance_backward[node] = INFINITY
+            parent_forward[node] = parent_backward[node] = -1
+            potential[node] = math.nan
+        self.nodes_visited = len(self.__touched)
+        self.__touched.clear()
+
+    def __distance_to(self, node: int) -> Callable[[int], float]:
+        """Returns the heuristic, the (scaled) great circle distance from any node to node."""
+        latitude = self.graph.latitude
+        longitude = self.graph.longitude
+        phi2 = math.radians(float(latitude[node]))
+        lambda2 = math.radians(float(longitude[node]))
+        cos_phi2 = math.cos(phi2)
+        scale = 2 * EARTH_RADIUS_M * HEURISTIC_SCALE
+        sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+
+        def heuristic(other: int) -> float:
+            phi1 = radians(float(latitude[other]))
+            h = (
+                sin((phi2 - phi1) / 2) ** 2
+                + cos(phi1) * cos_phi2 * sin((lambda2 - radians(float(longitude[other]))) / 2) ** 2
+            )
+            return scale * asin(sqrt(min(1.0, h)))
+
+        return heuristic
+
+    def __path(self, meeting: int) -> list[int]:
+        """Follows the parent links from the meeting node back to the source and forward to the target."""
+        parent_forward, parent_backward = self.__parent
+        path = [meeting]
+        node = meeting
+        while parent_forward[node] != -1:
+            node = parent_forward[node]
+            path.append(node)
+        path.reverse()
+        node = meeting
+        while parent_backward[node] != -1:
+            node = parent_backward[node]
+            path.append(node)
+        return path
+
+    def astar(self, source: int, target: int, use_heuristic: bool = True) -> tuple[list[int], float]:
+        """
+        Finds the shortest path with A*
+        :param source: the start node
+        :param target: the goal node
+        :param use_heuristic: set to False for plain Dijkstra
+        :return: the nodes of the path from source to target and its length (meters), ([], inf) if there is none
+        """
+        if not self.__allocated:
+            self.__allocate()
+        distance, _ = self.__distance
+        parent, _ = self.__parent
+        potential = self.__potential
+        touched = self.__touched
+        indptr, targets, lengths = self.graph.indptr, self.graph.target, self.graph.length
+        heuristic = self.__distance_to(target) if use_heuristic else lambda node: 0.0
+
+        distance[source] = 0.0
+        touched.append(source)
+        queue: list[tuple[float, float, int]] = [(heuristic(source), 0.0, source)]
+        try:
+            while queue:
+                _, node_distance, node = heapq.heappop(queue)
+                if node == target:
+                    return self.__path(target), node_distance
+                if node_distance > distance[node]:
+                    continue  # stale queue entry, the node was reached by a shorter path since
+                start, end = int(indptr[node]), int(indptr[node + 1])
+                for neighbor, length in zip(targets[start:end].tolist(), lengths[start:end].tolist()):
+                    new_distance = node_distance + length
+                    if new_distance < distance[neighbor]:
+                        if distance[neighbor] == INFINITY:
+                            touched.append(neighbor)
+                        distance[neighbor] = new_distance
+                        parent[neighbor] = node
+                        estimate = potential[neighbor]
+                        if estimate != estimate:  # nan, not computed yet
+                            estimate = potential[neighbor] = heuristic(neighbor)
+                        heapq.heappush(queue, (new_distance + estimate, new_distance, neighbor))
+            return [], INFINITY
+        finally:
+            self.__reset()
+
+    def bidirectional(self, source: int, target: int) -> tuple[list[int], float]:
+        """
+        Finds the shortest path with bidirectional A*, searching forward from the source and backward from the target
+        with the average of the two heuristics (which keeps the two searches consistent), stopping as soon as no
+        shorter path than the best meeting found so far can exist
+        :param source: the start node
+        :param target: the goal node
+        :return: the nodes of the path from source to target and its length (meters), ([], inf) if there is none
+        """
+        if not self.__allocated:
+            self.__allocate()
+        if source == target:
+            return [source], 0.0
+        distances = self.__distance
+        parents = self.__parent
+        potential = self.__potential
+        touched = self.__touched
+        graph = self.graph
+        adjacency = (
+            (graph.indptr, graph.target, graph.length),
+            (graph.reverse_indptr, graph.reverse_target, graph.reverse_length),
+        )
+        to_target = self.__distance_to(target)
+        to_source = self.__distance_to(source)
+
+        def forward_potential(node: int) -> float:
+            # p(v) = (h_target(v) - h_source(v)) / 2, the backward search uses -p(v)
+            value = potential[node]
+            if value != value:
+                value = potential[node] = (to_target(node) - to_source(node)) / 2
+            return value
+
+        distances[0][source] = distances[1][target] = 0.0
+        touched += [source, target]
+        queues: list[list[tuple[float, int]]] = [
+            [(forward_potential(source), source)],
+            [(-forward_potential(target), target)],
+        ]
+        best = INFINITY
+        meeting = -1
+        try:
+            while queues[0] and queues[1]:
+                # the searches keep keys d(v) + p(v) and d'(v) - p(v), no shorter path is left once they sum to best
+                if queues[0][0][0] + queues[1][0][0] >= best:
+                    break
+                side = 0 if len(queues[0]) <= len(queues[1]) else 1
+                sign = 1.0 if side == 0 else -1.0
+                distance, other_distance = distances[side], distances[1 - side]
+                parent = parents[side]
+                indptr, targets, lengths = adjacency[side]
+                queue = queues[side]
+
+                key, node = heapq.heappop(queue)
+                node_distance = distance[node]
+                if key > node_distance + sign * forward_potential(node):
+                    continue  # stale queue entry
+                start, end = int(indptr[node]), int(indptr[node + 1])
+                for neighbor, length in zip(targets[start:end].tolist(), lengths[start:end].tolist()):
+                    new_distance = node_distance + length
+                    if new_distance < distance[neighbor]:
+                        if distance[neighbor] == INFINITY and other_distance[neighbor] == INFINITY:
+                            touched.append(neighbor)
+                        distance[neighbor] = new_distance
+                        parent[neighbor] = node
+                        heapq.heappush(queue, (new_distance + sign * forward_potential(neighbor), neighbor))
+                        total = new_distance + other_distance[neighbor]
+                        if total < best:
+                            best = total
+                            meeting = neighbor
+            if meeting == -1:
+                return [], INFINITY
+            return self.__path(meeting), best
+        finally:
+            self.__reset()
+
+
+def benchmark(graph_path: str, queries: int, seed: int) -> None:
+    graph = RoadGraph(graph_path)
+    router = Router(graph)
+    generator = random.Random(seed)
+    pairs = [(generator.randrange(graph.node_count), generator.randrange(graph.node_count)) for _ in range(queries)]
+    print(f"{graph.node_count} nodes, {graph.edge_count} edges, {queries} random queries")
+
+    methods: dict[str, Callable[[int, int], tuple[list[int], float]]] = {
+        "dijkstra": lambda source, target: router.astar(source, target, use_heuristic=False),
+        "astar": router.astar,
+        "bidirectional": router.bidirectional,
+    }
+    hierarchy = load_contraction_hierarchy(graph_path, graph)
+    if hierarchy is not None:
+        methods["contraction"] = hierarchy.route
+    reference: Optional[list[float]] = None
+    for name, method in methods.items():
+        lengths: list[float] = []
+        visited = 0
+        start = time.perf_counter()
+        for source, target in pairs:
+            lengths.append(method(source, target)[1])
+            visited += hierarchy.nodes_visited if name == "contraction" else router.nodes_visited
+        elapsed = time.perf_counter() - start
+        mismatches = 0
+        if reference is None:
+            reference = lengths
+        else:
+            mismatches = sum(1 for a, b in zip(reference, lengths) if not math.isclose(a, b, rel_tol=1e-6))
+        print(
+            f"{name:>14}: {elapsed / queries * 1000:8.2f} ms/query, {visited / queries:10.0f} nodes/query"
+            + (f", {mismatches} length mismatches" if mismatches else "")
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the router on a road graph")
+    parser.add_argument("graph", help="road graph directory written by the importer")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.graph, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Simplification of a RoadGraph, merging the chains of nodes that only continue a road into single edges.
+
+Most OSM nodes only give a road its shape: they join exactly two neighbours, the road coming in and the road going
+on. Routing never needs to stop at one, so every chain of them between two real nodes (intersections and dead ends)
+becomes one edge. The length of the edge is the sum of the lengths it replaces, and the removed nodes are kept in
+order as the edge's shape points (see road_graph.py), so snapping and drawing still follow the road.
+
+A node is removed when it has exactly two neighbours and either one edge in and one edge out (a one way road) or
+edges in from and out to both (a two way road). The chains are followed in lock step with numpy, one node of every
+chain per step, so a step costs the same for a county as for a continent. Loops made only of removable nodes (a
+roundabout with no roads leaving it) have no end to start from and are left as they are.
+
+Simplify an existing graph with:
+    python3 -m gpspi.mapping.simplify north-america-all-roads.graph north-america-simple.graph
+"""
+
+import argparse
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from gpspi.mapping.road_graph import RoadGraph, build_road_graph
+
+
+@dataclass(frozen=True)
+class SimplifyStats:
+    nodes_before: int
+    nodes_after: int
+    edges_before: int
+    edges_after: int
+    bytes_before: int  # of the graph arrays, on disk and mapped
+    bytes_after: int
+
+    @property
+    def reduction(self) -> float:
+        """The fraction of the graph's size the simplification saved."""
+        return 1 - self.bytes_after / self.bytes_before if self.bytes_before else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.nodes_before:,} -> {self.nodes_after:,} nodes, "
+            f"{self.edges_before:,} -> {self.edges_after:,} edges, "
+            f"{self.bytes_before / 1e6:,.1f} -> {self.bytes_after / 1e6:,.1f} MB ({self.reduction:.0%} smaller)"
+        )
+
+
+def _graph_bytes(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.name.endswith(".npy"))
+
+
+def removable_nodes(graph: RoadGraph) -> np.ndarray:
+    """
+    Finds the nodes that only continue a road
+    :param graph: the road graph
+    :return: a bool per node, True for the nodes a chain can pass through
+    """
+    n = graph.node_count
+    sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(graph.indptr))
+    targets = np.asarray(graph.target, dtype=np.int64)
+    out_degree = np.diff(graph.indptr)
+    in_degree = np.diff(graph.reverse_indptr)
+
+    # distinct neighbours, whichever way the edges between them go
+    loops = sources == targets
+    pairs = np.unique(np.minimum(sources[~loops], targets[~loops]) * n + np.maximum(sources[~loops], targets[~loops]))
+    neighbours = np.bincount(pairs // n, minlength=n) + np.bincount(pairs % n, minlength=n)
+
+    one_way = (out_degree == 1) & (in_degree == 1)
+    # two edges out to and two in from the two neighbours, not two parallel edges to the same one
+    two_way = (out_degree == 2) & (in_degree == 2)
+    candidates = np.flatnonzero(two_way)
+    out_first = graph.indptr[candidates]
+    in_first = graph.reverse_indptr[candidates]
+    two_way[candidates] = (graph.target[out_first] != graph.target[out_first + 1]) & (
+        graph.reverse_target[in_first] != graph.reverse_target[in_first + 1]
+    )
+    removable = (neighbours == 2) & (one_way | two_way)
+    removable[sources[loops]] = False
+    return removable
+
+
+def simplify_road_graph(graph: RoadGraph, output_path: str) -> tuple[RoadGraph, SimplifyStats]:
+    """
+    Writes the graph with every chain of removable nodes merged into one edge
+    :param graph: the road graph, its own shape points are kept too
+    :param output_path: the directory to write the simplified graph to
+    :return: the simplified graph, opened from disk, and how much smaller it is
+    """
+    removable = removable_nodes(graph)
+    indptr = np.asarray(graph.indptr)
+    targets = np.asarray(graph.target, dtype=np.int64)
+    lengths = np.asarray(graph.length, dtype=np.float64)
+    sources = np.repeat(np.arange(graph.node_count, dtype=np.int64), np.diff(indptr))
+    out_degree = np.diff(indptr)
+
+    while True:
+        # every chain starts on an edge leaving a node that stays
+        starts = np.flatnonzero(~removable[sources])
+        chain_count = len(starts)
+        previous = sources[starts]
+        current = targets[starts]
+        total = lengths[starts].copy()
+        chain_edges = [starts]  # the edges of every chain, step by step
+        chain_ids = [np.arange(chain_count)]
+        active = np.arange(chain_count)
+        ends = np.empty(chain_count, dtype=np.int64)
+        while len(active):
+            done = ~removable[current]
+            ends[active[done]] = current[done]
+            active, previous, current = active[~done], previous[~done], current[~done]
+            # a two way node goes on through the edge that does not lead back, a one way node has one edge out
+            first = indptr[current]
+            turn_back = (targets[first] == previous) & (out_degree[current] == 2)
+            edges = first + turn_back
+            previous, current = current, targets[edges]
+            total[active] += lengths[edges]
+            chain_edges.append(edges)
+            chain_ids.append(active)
+
+        # nodes no chain reached are on loops of removable nodes only, keep them and follow again
+        visited = np.zeros(graph.node_count, dtype=bool)
+        visited[targets[np.concatenate(chain_edges)]] = True
+        stranded = removable & ~visited
+        if not stranded.any():
+            break
+        removable &= ~stranded
+
+    # the shape of a chain: each edge's own shape points, then the node it leads to, except after the last edge
+    all_edges = np.concatenate(chain_edges)
+    all_chains = np.concatenate(chain_ids)
+    steps = np.concatenate([np.full(len(edges), step) for step, edges in enumerate(chain_edges)])
+    order = np.lexsort((steps, all_chains))
+    all_edges, all_chains = all_edges[order], all_chains[order]
+    is_last = np.append(all_chains[1:] != all_chains[:-1], True)
+    shape_indptr = np.asarray(graph.shape_indptr)
+    edge_shape_counts = np.diff(shape_indptr)[all_edges]
+    point_counts = edge_shape_counts + ~is_last  # shape points, plus the node at the end unless it is the last
+    point_starts = np.cumsum(point_counts) - point_counts
+    point_total = int(point_counts.sum())
+    latitudes = np.empty(point_total, dtype=np.float32)
+    longitudes = np.empty(point_total, dtype=np.float32)
+    owner = np.repeat(np.arange(len(all_edges)), point_counts)
+    offset = np.arange(point_total) - point_starts[owner]
+    from_shape = offset < edge_shape_counts[owner]
+    shape_points = shape_indptr[all_edges[owner[from_shape]]] + offset[from_shape]
+    latitudes[from_shape] = graph.shape_latitude[shape_points]
+    longitudes[from_shape] = graph.shape_longitude[shape_points]
+    chain_nodes = targets[all_edges[owner[~from_shape]]]
+    latitudes[~from_shape] = graph.latitude[chain_nodes]
+    longitudes[~from_shape] = graph.longitude[chain_nodes]
+    chain_shape_indptr = np.zeros(chain_count + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(all_chains, weights=point_counts, minlength=chain_count).astype(np.int64),
+        out=chain_shape_indptr[1:],
+    )
+
+    kept = np.flatnonzero(~removable)
+    renumber = np.full(graph.node_count, -1, dtype=np.int64)
+    renumber[kept] = np.arange(len(kept))
+    simplified = build_road_graph(
+        output_path,
+        graph.osm_id[kept],
+        graph.latitude[kept],
+        graph.longitude[kept],
+        renumber[sources[starts]],
+        renumber[ends],
+        total,
+        (chain_shape_indptr, latitudes, longitudes),
+    )
+    stats = SimplifyStats(
+        graph.node_count,
+        simplified.node_count,
+        graph.edge_count,
+        simplified.edge_count,
+        _graph_bytes(graph.path),
+        _graph_bytes(output_path),
+    )
+    logging.info(f"Simplified {graph.path}: {stats}")
+    return simplified, stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Merge the road graph's shape only nodes into its edges")
+    parser.add_argument("graph", help="road graph directory written by the importer")
+    parser.add_argument("output", help="the simplified graph directory to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    _, stats = simplify_road_graph(RoadGraph(args.graph), args.output)
+    print(stats)
+    print(f"Time taken: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Grid spatial index over the nodes and road segments of a RoadGraph, for snapping a GPS fix to the road network.
+
+The world is split into square cells of cell_degrees, numbered row * columns + column from (-90, -180). Only the
+cells holding something are stored, sorted, so a continent sized graph costs a few bytes per node:
+    grid_node_cell, grid_node_start, grid_node      the nodes in every non-empty cell
+    grid_segment_cell, grid_segment_start, grid_segment, grid_segment_piece
+                                                    the straight pieces of the edges (indexes into the graph's edge
+                                                    arrays, and the piece between shape points k and k + 1) whose
+                                                    bounding box overlaps every non-empty cell, one direction per road
+plus grid.json with the cell size, written last. A lookup searches rings of cells outward from the fix until no
+closer cell is left, measuring in a local flat projection, which is exact to well under a metre at these scales.
+
+Build it for an existing graph with:
+    python3 -m gpspi.mapping.spatial_index north-america-all-roads.graph
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+
+import numpy as np
+
+from gpspi.mapping.geodesy import EARTH_RADIUS_M
+from gpspi.mapping.road_graph import RoadGraph
+
+T = TypeVar("T")
+
+META_FILE: str = "grid.json"
+
+DEFAULT_CELL_DEGREES: float = 0.01  # about 1.1 km north to south
+
+# give up past this many rings of cells, a fix this far from any road is not near a road
+MAX_RINGS: int = 100
+
+# pieces_in_box reads at most this many cells, about 7.7 km square at the default cell size
+MAX_BOX_CELLS: int = 49
+
+METERS_PER_DEGREE: float = math.radians(1) * EARTH_RADIUS_M
+
+
+@dataclass(frozen=True)
+class RoadSnap:
+    """The point on the road network nearest to a position."""
+
+    edge: int  # index into the graph's edge arrays
+    source: int  # the node the edge leaves
+    target: int  # the node the edge leads to
+    fraction: float  # how far along the edge the point is, 0 at source, 1 at target
+    latitude: float
+    longitude: float
+    distance: float  # from the position to the point (meters)
+
+    @property
+    def nearest_node(self) -> int:
+        return self.source if self.fraction < 0.5 else self.target
+
+
+def _cells(latitudes: np.ndarray, longitudes: np.ndarray, cell_degrees: float) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the (row, column) of the cell holding every point."""
+    rows = np.floor((np.asarray(latitudes, dtype=np.float64) + 90) / cell_degrees).astype(np.int64)
+    columns = np.floor((np.asarray(longitudes, dtype=np.float64) + 180) / cell_degrees).astype(np.int64)
+    return rows, columns
+
+
+def _group(keys: np.ndarray, items: np.ndarray) -> dict[str, np.ndarray]:
+    """Groups items by cell key into the (cell, start, item) arrays."""
+    order = np.argsort(keys, kind="stable")
+    cells, counts = np.unique(keys[order], return_counts=True)
+    start = np.zeros(len(cells) + 1, dtype=np.int64)
+    np.cumsum(counts, out=start[1:])
+    return {"cell": cells, "start": start, "items": items[order].astype(np.int64), "order": order}
+
+
+def _longitude_delta(start: float, end: float) -> float:
+    """Returns the change in longitude from start to end the short way round (degrees)."""
+    return (end - start + 180) % 360 - 180
+
+
+def _piece_ends(
+    graph: RoadGraph, edges: np.ndarray, pieces: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the (latitudes, longitudes) of the start and of the end of every edge piece."""
+    sources = graph.edge_sources(edges)
+    targets = np.asarray(graph.target[edges], dtype=np.int64)
+    shape_start = np.asarray(graph.shape_indptr[edges], dtype=np.int64)
+    shape_count = np.asarray(graph.shape_indptr[edges + 1], dtype=np.int64) - shape_start
+
+    def point(k: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # point 0 is the source, then the shape points, then the target
+        latitudes = np.asarray(graph.latitude[sources], dtype=np.float64)
+        longitudes = np.asarray(graph.longitude[sources], dtype=np.float64)
+        shape = (k > 0) & (k <= shape_count)
+        latitudes[shape] = graph.shape_latitude[shape_start[shape] + k[shape] - 1]
+        longitudes[shape] = graph.shape_longitude[shape_start[shape] + k[shape] - 1]
+        end = k == shape_count + 1
+        latitudes[end] = graph.latitude[targets[end]]
+        longitudes[end] = graph.longitude[targets[end]]
+        return latitudes, longitudes
+
+    start_latitudes, start_longitudes = point(pieces)
+    end_latitudes, end_longitudes = point(pieces + 1)
+    return start_latitudes, start_longitudes, end_latitudes, end_longitudes
+
+
+def build_spatial_index(
+    graph: RoadGraph, output_path: Optional[str] = None, cell_degrees: float = DEFAULT_CELL_DEGREES
+) -> "SpatialIndex":
+    """
+    Builds the grid index for a graph and writes it next to it
+    :param graph: the road graph
+    :param output_path: the directory to write the index to, the graph's own directory if not set
+    :param cell_degrees: the grid cell size
+    :return: the index, opened from disk
+    """
+    output_path = output_path if output_path is not None else graph.path
+    columns = math.ceil(360 / cell_degrees)
+    node_rows, node_columns = _cells(graph.latitude, graph.longitude, cell_degrees)
+    nodes = _group(node_rows * columns + node_columns, np.arange(graph.node_count))
+
+    # a two way road is two edges, index only one of them. Roads between the same two nodes can take different
+    # ways there, the length tells them apart (rounded, the two directions were summed in opposite orders)
+    sources = np.repeat(np.arange(graph.node_count, dtype=np.int64), np.diff(graph.indptr))
+    targets = np.asarray(graph.target, dtype=np.int64)
+    lengths = np.round(np.asarray(graph.length, dtype=np.float64)).astype(np.int64)
+    forward_keys = np.stack([sources, targets, lengths], axis=1).view(np.dtype((np.void, 24))).ravel()
+    reverse_keys = np.stack([targets, sources, lengths], axis=1).view(np.dtype((np.void, 24))).ravel()
+    edges = np.flatnonzero((sources < targets) | ~np.isin(reverse_keys, forward_keys))
+
+    # every straight piece of an edge goes in every cell of its bounding box
+    piece_counts = np.diff(np.asarray(graph.shape_indptr))[edges] + 1
+    piece_edges = np.repeat(edges, piece_counts)
+    pieces = np.arange(len(piece_edges)) - np.repeat(np.cumsum(piece_counts) - piece_counts, piece_counts)
+    start_latitudes, start_longitudes, end_latitudes, end_longitudes = _piece_ends(graph, piece_edges, pieces)
+    start_rows, start_columns = _cells(start_latitudes, start_longitudes, cell_degrees)
+    end_rows, end_columns = _cells(end_latitudes, end_longitudes, cell_degrees)
+    row_first, row_last = np.minimum(start_rows, end_rows), np.maximum(start_rows, end_rows)
+    column_first, column_last = np.minimum(start_columns, end_columns), np.maximum(start_columns, end_columns)
+    # a piece crossing the antimeridian goes the short way round, east from its western end past the last column
+    wraps = column_last - column_first > columns // 2
+    column_first[wraps], column_last[wraps] = column_last[wraps], column_first[wraps] + columns
+    widths = column_last - column_first + 1
+    counts = (row_last - row_first + 1) * widths
+    repeated = np.repeat(np.arange(len(piece_edges)), counts)
+    offsets = np.arange(len(repeated)) - np.repeat(np.cumsum(counts) - counts, counts)
+    segment_rows = row_first[repeated] + offsets // widths[repeated]
+    segment_columns = (column_first[repeated] + offsets % widths[repeated]) % columns
+    segments = _group(segment_rows * columns + segment_columns, piece_edges[repeated])
+    segment_pieces = pieces[repeated][segments["order"]].astype(np.int32)
+
+    os.makedirs(output_path, exist_ok=True)
+    for prefix, arrays in (("node", nodes), ("segment", segments)):
+        np.save(os.path.join(output_path, f"grid_{prefix}_cell.npy"), arrays["cell"])
+        np.save(os.path.join(output_path, f"grid_{prefix}_start.npy"), arrays["start"])
+        np.save(os.path.join(output_path, f"grid_{prefix}.npy"), arrays["items"])
+    np.save(os.path.join(output_path, "grid_segment_piece.npy"), segment_pieces)
+    with open(os.path.join(output_path, META_FILE), "w") as f:
+        json.dump({"cell_degrees": cell_degrees, "nodes": graph.node_count, "segments": len(piece_edges)}, f)
+    return SpatialIndex(output_path, graph)
+
+
+def _load(path: str, name: str) -> np.ndarray:
+    return np.asarray(np.load(os.path.join(path, f"grid_{name}.npy"), mmap_mode="r"))
+
+
+class SpatialIndex:
+    """Read only, memory mapped grid index, see the module docstring for the layout."""
+
+    def __init__(self, path: str, graph: RoadGraph) -> None:
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        if meta["nodes"] != graph.node_count:
+            raise ValueError(f"The spatial index in {path} is for another graph, rebuild it")
+        self.graph: RoadGraph = graph
+        self.cell_degrees: float = meta["cell_degrees"]
+        self.rows: int = math.ceil(180 / self.cell_degrees)
+        self.columns: int = math.ceil(360 / self.cell_degrees)
+        self.node_cell, self.node_start, self.node = (_load(path, name) for name in ("node_cell", "node_start", "node"))
+        self.segment_cell, self.segment_start, self.segment, self.segment_piece = (
+            _load(path, name) for name in ("segment_cell", "segment_start", "segment", "segment_piece")
+        )
+
+    @staticmethod
+    def __ring(row: int, column: int, radius: int) -> list[tuple[int, int]]:
+        """Returns the cells exactly radius cells away from (row, column)."""
+        if radius == 0:
+            return [(row, column)]
+        cells = [(row + dr, column + dc) for dr in (-radius, radius) for dc in range(-radius, radius + 1)]
+        cells += [(row + dr, column + dc) for dc in (-radius, radius) for dr in range(-radius + 1, radius)]
+        return cells
+
+    def __ring_items(self, cell_keys: np.ndarray, starts: np.ndarray, cells: list[tuple[int, int]]) -> np.ndarray:
+        """Returns the positions in the item arrays of everything in the cells."""
+        # columns wrap around the antimeridian, rows stop at the poles
+        keys = np.array(
+            [row * self.columns + column % self.columns for row, column in cells if 0 <= row < self.rows],
+            dtype=np.int64,
+        )
+        positions = np.searchsorted(cell_keys, keys)
+        found = positions < len(cell_keys)
+        found[found] = cell_keys[positions[found]] == keys[found]
+        positions = positions[found]
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(starts[position], starts[position + 1]) for position in positions])
+
+    def __search(
+        self,
+        latitude: float,
+        longitude: float,
+        cell_keys: np.ndarray,
+        starts: np.ndarray,
+        measure: Callable[[np.ndarray], tuple[float, T]],
+    ) -> Optional[T]:
+        """
+        Searches rings of cells outward, measure returns (best distance, best result) for a batch of positions in the
+        item arrays
+        """
+        row = int(math.floor((latitude + 90) / self.cell_degrees))
+        column = int(math.floor((longitude + 180) / self.cell_degrees))
+        best_distance = math.inf
+        best: Optional[T] = None
+        for radius in range(MAX_RINGS + 1):
+            candidates = self.__ring_items(cell_keys, starts, self.__ring(row, column, radius))
+            if len(candidates):
+                distance, result = measure(candidates)
+                if distance < best_distance:
+                    best_distance, best = distance, result
+            # everything past this ring is at least radius cells away, measured across the narrowest cell side
+            latitude_edge = min(89.9, abs(latitude) + (radius + 1) * self.cell_degrees)
+            cell_meters = self.cell_degrees * METERS_PER_DEGREE * math.cos(math.radians(latitude_edge))
+            if best_distance <= radius * cell_meters:
+                break
+        return best
+
+    @staticmethod
+    def __project(
+        latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the points in a flat (x east, y north) projection centred on the position (meters)."""
+        x = ((longitudes - longitude + 180) % 360 - 180) * (METERS_PER_DEGREE * math.cos(math.radians(latitude)))
+        y = (latitudes - latitude) * METERS_PER_DEGREE
+        return x, y
+
+    def __unique_pieces(self, positions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the (edge, piece) at the positions in the segment arrays, once each."""
+        edges, pieces = self.segment[positions], self.segment_piece[positions].astype(np.int64)
+        # a piece crossing several of the cells shows up once per cell
+        _, unique = np.unique(edges * (int(pieces.max()) + 1) + pieces, return_index=True)
+        return edges[unique], pieces[unique]
+
+    def nearest_node(self, latitude: float, longitude: float) -> Optional[int]:
+        """Returns the node nearest to the position, or None if there is none within MAX_RINGS cells."""
+
+        def measure(positions: np.ndarray) -> tuple[float, int]:
+            nodes = self.node[positions]
+            x, y = self.__project(latitude, longitude, self.graph.latitude[nodes], self.graph.longitude[nodes])
+            distances = np.hypot(x, y)
+            best = int(np.argmin(distances))
+            return float(distances[best]), int(nodes[best])
+
+        return self.__search(latitude, longitude, self.node_cell, self.node_start, measure)
+
+    def nearest_segment(self, latitude: float, longitude: float) -> Optional[RoadSnap]:
+        """Returns the point on the road network nearest to the position, or None if there is no road nearby."""
+
+        def measure(positions: np.ndarray) -> tuple[float, RoadSnap]:
+            edges, pieces = self.__unique_pieces(positions)
+            start_latitudes, start_longitudes, end_latitudes, end_longitudes = _piece_ends(self.graph, edges, pieces)
+            start_x, start_y = self.__project(latitude, longitude, start_latitudes, start_longitudes)
+            end_x, end_y = self.__project(latitude, longitude, end_latitudes, end_longitudes)
+            dx, dy = end_x - start_x, end_y - start_y
+            squared = dx * dx + dy * dy
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraction = np.clip(-(start_x * dx + start_y * dy) / squared, 0.0, 1.0)
+            fraction = np.nan_to_num(fraction)  # zero length pieces
+            distances = np.hypot(start_x + fraction * dx, start_y + fraction * dy)
+            best = int(np.argmin(distances))
+            edge, piece, along = int(edges[best]), int(pieces[best]), float(fraction[best])
+
+            # how far along the whole edge the point is, through the pieces before it
+            latitudes, longitudes = self.graph.edge_points(edge)
+            x, y = self.__project(latitude, longitude, latitudes, longitudes)
+            piece_lengths = np.hypot(np.diff(x), np.diff(y))
+            total = float(piece_lengths.sum())
+            travelled = float(piece_lengths[:piece].sum()) + along * float(piece_lengths[piece])
+            snap_longitude = start_longitudes[best] + along * _longitude_delta(
+                start_longitudes[best], end_longitudes[best]
+            )
+            snap = RoadSnap(
+                edge=edge,
+                source=int(self.graph.edge_sources(np.array([edge]))[0]),
+                target=int(self.graph.target[edge]),
+                fraction=travelled / total if total > 0 else 0.0,
+                latitude=float(start_latitudes[best] + along * (end_latitudes[best] - start_latitudes[best])),
+                longitude=float((snap_longitude + 180) % 360 - 180),
+                distance=float(distances[best]),
+            )
+            return snap.distance, snap
+
+        return self.__search(latitude, longitude, self.segment_cell, self.segment_start, measure)
+
+    def pieces_in_box(
+        self, south: float, west: float, north: float, east: float, max_cells: int = MAX_BOX_CELLS
+    ) -> Optional[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Finds the straight road pieces in the cells a box touches, for drawing
+        :param south: the box's southern edge (degrees)
+        :param west: the box's western edge (degrees)
+        :param north: the box's northern edge (degrees)
+        :param east: the box's eastern edge (degrees)
+        :param max_cells: the most cells to read, a box covering more is too big to draw the roads of
+        :return: the (start latitudes, start longitudes, end latitudes, end longitudes) of the pieces, None if the box
+            covers more than max_cells
+        """
+        rows, columns = _cells(np.array([south, north]), np.array([west, east]), self.cell_degrees)
+        row_first, row_last = max(int(rows[0]), 0), min(int(rows[1]), self.rows - 1)
+        column_first, column_last = int(columns[0]), int(columns[1])
+        if column_last < column_first:
+            column_last += self.columns  # the box crosses the antimeridian, __ring_items wraps the columns
+        if (row_last - row_first + 1) * (column_last - column_first + 1) > max_cells:
+            return None
+        cells = [
+            (row, column) for row in range(row_first, row_last + 1) for column in range(column_first, column_last + 1)
+        ]
+        positions = self.__ring_items(self.segment_cell, self.segment_start, cells)
+        if len(positions) == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return empty, empty, empty, empty
+        edges, pieces = self.__unique_pieces(positions)
+        return _piece_ends(self.graph, edges, pieces)
+
+
+def load_spatial_index(path: str, graph: RoadGraph) -> Optional[SpatialIndex]:
+    """Returns the index stored with the graph at path, or None if it has not been built."""
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        logging.info(f"No spatial index in {path}, nearest road lookups scan every node")
+        return None
+    return SpatialIndex(path, graph)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the spatial index for a road graph")
+    parser.add_argument("graph", help="road graph directory written by the importer")
+    parser.add_argument("--cell-degrees", type=float, default=DEFAULT_CELL_DEGREES)
+    args = parser.parse_args()
+
+    graph = RoadGraph(args.graph)
+    start = time.perf_counter()
+    index = build_spatial_index(graph, cell_degrees=args.cell_degrees)
+    print(f"Indexed {graph.node_count} nodes in {len(index.node_cell)} cells, {len(index.segment_cell)} road cells")
+    print(f"Time taken: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Road graph split into geographic tiles that are memory mapped on demand, for regions too big to map at once.
+
+The nodes are renumbered so every tile holds a contiguous range of them, and the edges leaving a tile's nodes are
+stored with it. Each tile is a directory of the same arrays as a RoadGraph (see road_graph.py), except that the
+node indexes in target / reverse_target and the offsets in indptr / reverse_indptr / shape_indptr are global, so an
+edge crossing into another tile needs no special handling. tiles.json holds the node, edge and shape point range of
+every tile.
+
+A TiledRoadGraph exposes the same attributes as a RoadGraph, as PagedArrays that find and map the tile holding the
+requested index on first use. Mapped tiles are kept in an LRU up to a memory budget, so memory follows the area
+being routed through and not the size of the region. The spatial index is built over the renumbered nodes and
+stored next to tiles.json as usual.
+
+Convert an imported graph with:
+    python3 -m gpspi.mapping.tiled_graph north-america-all-roads.graph north-america-tiled.graph --tile-degrees 0.5
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+import numpy as np
+
+from gpspi.mapping.road_graph import FORMAT_VERSION, RoadGraph, build_road_graph
+from gpspi.mapping.spatial_index import build_spatial_index
+
+TILES_FILE: str = "tiles.json"
+
+DEFAULT_TILE_DEGREES: float = 0.5
+DEFAULT_MEMORY_BUDGET_MB: float = 64.0
+
+NODE_ARRAYS: tuple[str, ...] = ("latitude", "longitude", "osm_id", "indptr", "reverse_indptr")
+EDGE_ARRAYS: tuple[str, ...] = ("target", "length", "shape_indptr")
+REVERSE_EDGE_ARRAYS: tuple[str, ...] = ("reverse_target", "reverse_length")
+SHAPE_ARRAYS: tuple[str, ...] = ("shape_latitude", "shape_longitude")
+
+
+def build_tiled_graph(
+    graph: RoadGraph, output_path: str, tile_degrees: float = DEFAULT_TILE_DEGREES
+) -> "TiledRoadGraph":
+    """
+    Writes a graph as tiles
+    :param graph: the graph to split
+    :param output_path: the directory to write the tiles to
+    :param tile_degrees: the tile size
+    :return: the tiled graph, opened from disk
+    """
+    columns = math.ceil(360 / tile_degrees)
+    rows = np.floor((graph.latitude.astype(np.float64) + 90) / tile_degrees).astype(np.int64)
+    tile_keys = rows * columns + np.floor((graph.longitude.astype(np.float64) + 180) / tile_degrees).astype(np.int64)
+    order = np.argsort(tile_keys, kind="stable")
+    renumber = np.empty(graph.node_count, dtype=np.int64)
+    renumber[order] = np.arange(graph.node_count)
+
+    # the renumbered graph, written whole first, the tiles are cut from it and the spatial index is built on it
+    flat_path = f"{output_path}.flat"
+    sources = np.repeat(np.arange(graph.node_count, dtype=np.int64), np.diff(graph.indptr))
+    flat = build_road_graph(
+        flat_path,
+        graph.osm_id[order],
+        graph.latitude[order],
+        graph.longitude[order],
+        renumber[sources],
+        renumber[graph.target],
+        graph.length,
+        (graph.shape_indptr, graph.shape_latitude, graph.shape_longitude),
+    )
+    os.makedirs(output_path, exist_ok=True)
+    build_spatial_index(flat, output_path)
+
+    keys, node_starts = np.unique(tile_keys[order], return_index=True)
+    node_offsets = np.append(node_starts, graph.node_count)
+    tiles = []
+    for i, key in enumerate(keys.tolist()):
+        first, last = int(node_offsets[i]), int(node_offsets[i + 1])
+        edge_first, edge_last = int(flat.indptr[first]), int(flat.indptr[last])
+        reverse_first, reverse_last = int(flat.reverse_indptr[first]), int(flat.reverse_indptr[last])
+        shape_first, shape_last = int(flat.shape_indptr[edge_first]), int(flat.shape_indptr[edge_last])
+        tile_path = os.path.join(output_path, f"tile_{key}")
+        os.makedirs(tile_path, exist_ok=True)
+        # the index pointers keep one extra entry, the end of the tile's last node or edge
+        arrays: dict[str, np.ndarray] = {
+            "latitude": flat.latitude[first:last],
+            "longitude": flat.longitude[first:last],
+            "osm_id": flat.osm_id[first:last],
+            "indptr": flat.indptr[first : last + 1],
+            "reverse_indptr": flat.reverse_indptr[first : last + 1],
+            "target": flat.target[edge_first:edge_last],
+            "length": flat.length[edge_first:edge_last],
+            "reverse_target": flat.reverse_target[reverse_first:reverse_last],
+            "reverse_length": flat.reverse_length[reverse_first:reverse_last],
+            "shape_indptr": flat.shape_indptr[edge_first : edge_last + 1],
+            "shape_latitude": flat.shape_latitude[shape_first:shape_last],
+            "shape_longitude": flat.shape_longitude[shape_first:shape_last],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tile_path, f"{name}.npy"), array)
+        tiles.append(
+            {"key": key, "nodes": first, "edges": edge_first, "reverse_edges": reverse_first, "shapes": shape_first}
+        )
+    del flat
+    shutil.rmtree(flat_path)
+
+    with open(os.path.join(output_path, TILES_FILE), "w") as f:
+        json.dump(
+            {
+                "version": FORMAT_VERSION,
+                "build_id": uuid.uuid4().hex,  # the nodes are renumbered, this is not the flat graph
+                "tile_degrees": tile_degrees,
+                "nodes": graph.node_count,
+                "edges": graph.edge_count,
+                "shape_points": len(graph.shape_latitude),
+                "tiles": tiles,
+            },
+            f,
+        )
+    return TiledRoadGraph(output_path)
+
+
+class PagedArray:
+    """
+    One of the graph arrays, spread over the tiles. Supports what the router and spatial index use: an int index,
+    a slice within one tile, and an index array.
+    """
+
+    def __init__(self, graph: "TiledRoadGraph", name: str, offsets: list[int], length: int) -> None:
+        self.graph: TiledRoadGraph = graph
+        self.name: str = name
+        self.offsets: list[int] = offsets  # the first global index held by every tile
+        self.length: int = length
+        # the tile read last, searches stay within one tile for long stretches, skip the lookup while they do; the
+        # graph drops it when it unmaps the tile, so it never keeps an evicted tile mapped
+        self.__cached_tile: int = -1
+        self.__first: int = 0
+        self.__last: int = 0
+        self.__array: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __tile(self, index: int) -> np.ndarray:
+        """Returns the arrays of the tile holding index, and makes it the cached one."""
+        tile = bisect.bisect_right(self.offsets, index) - 1
+        array = self.graph.tile(tile)[self.name]
+        self.__cached_tile = tile
+        self.__first = self.offsets[tile]
+        self.__last = self.__first + len(array)
+        self.__array = array
+        return array
+
+    def __getitem__(self, index: Union[int, np.integer, slice, np.ndarray]) -> Any:
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self.length)
+            if not self.__first <= start < self.__last:
+                self.__tile(start)
+            return self.__array[start - self.__first : stop - self.__first]  # type: ignore[index]
+        if isinstance(index, np.ndarray):
+            tiles = np.searchsorted(self.offsets, index, side="right") - 1
+            result = np.empty(len(index), dtype=self.graph.tile(0)[self.name].dtype)
+            for tile in np.unique(tiles).tolist():
+                selected = tiles == tile
+                result[selected] = self.graph.tile(tile)[self.name][index[selected] - self.offsets[tile]]
+            return result
+        if not self.__first <= index < self.__last:
+            self.__tile(index)
+        return self.__array[index - self.__first]  # type: ignore[index]
+
+    def release(self, tile: int) -> None:
+        """Drops the cached tile if it is the one given, called by the graph when it unmaps it."""
+        if self.__cached_tile == tile:
+            self.__cached_tile = -1
+            self.__first = self.__last = 0
+            self.__array = None
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None) -> np.ndarray:
+        # maps every tile in turn, only for offline use and the brute force fallbacks
+        ends = self.offsets[1:] + [self.length]
+        array = np.concatenate(
+            [
+                self.graph.tile(tile)[self.name][: end - first]
+                for tile, (first, end) in enumerate(zip(self.offsets, ends))
+            ]
+        )
+        return array if dtype is None else array.astype(dtype)
+
+
+class TiledRoadGraph(RoadGraph):
+    """A RoadGraph whose tiles are mapped on first use and unmapped least recently used first past the budget."""
+
+    def __init__(self, path: str, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB) -> None:
+        self.path = path
+        with open(os.path.join(path, TILES_FILE), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path} is version {meta['version']}, expected {FORMAT_VERSION}, re-run the importer")
+        self.node_count = meta["nodes"]
+        self.edge_count = meta["edges"]
+        self.build_id = meta.get("build_id")
+        self.tile_degrees: float = meta["tile_degrees"]
+        self.tile_keys: list[int] = [tile["key"] for tile in meta["tiles"]]
+        self.memory_budget: int = int(memory_budget_mb * 1024 * 1024)
+        self.mapped_bytes: int = 0
+        self.tiles_loaded: int = 0  # every time a tile was mapped, for tuning the budget
+        self.__tiles: OrderedDict[int, dict[str, np.ndarray]] = OrderedDict()
+
+        node_offsets = [tile["nodes"] for tile in meta["tiles"]]
+        edge_offsets = [tile["edges"] for tile in meta["tiles"]]
+        reverse_offsets = [tile["reverse_edges"] for tile in meta["tiles"]]
+        shape_offsets = [tile["shapes"] for tile in meta["tiles"]]
+        # the index pointers are read at i + 1 for the last node or edge of a tile, its tile keeps that entry too
+        self.latitude = PagedArray(self, "latitude", node_offsets, self.node_count)  # type: ignore[assignment]
+        self.longitude = PagedArray(self, "longitude", node_offsets, self.node_count)  # type: ignore[assignment]
+        self.osm_id = PagedArray(self, "osm_id", node_offsets, self.node_count)  # type: ignore[assignment]
+        self.indptr = PagedArray(self, "indptr", node_offsets, self.node_count + 1)  # type: ignore[assignment]
+        self.reverse_indptr = PagedArray(  # type: ignore[assignment]
+            self, "reverse_indptr", node_offsets, self.node_count + 1
+        )
+        self.target = PagedArray(self, "target", edge_offsets, self.edge_count)  # type: ignore[assignment]
+        self.length = PagedArray(self, "length", edge_offsets, self.edge_count)  # type: ignore[assignment]
+        self.reverse_target = PagedArray(  # type: ignore[assignment]
+            self, "reverse_target", reverse_offsets, self.edge_count
+        )
+        self.reverse_length = PagedArray(  # type: ignore[assignment]
+            self, "reverse_length", reverse_offsets, self.edge_count
+        )
+        self.shape_indptr = PagedArray(  # type: ignore[assignment]
+            self, "shape_indptr", edge_offsets, self.edge_count + 1
+        )
+        self.shape_latitude = PagedArray(  # type: ignore[assignment]
+            self, "shape_latitude", shape_offsets, meta["shape_points"]
+        )
+        self.shape_longitude = PagedArray(  # type: ignore[assignment]
+            self, "shape_longitude", shape_offsets, meta["shape_points"]
+        )
+        self.paged_arrays: list[PagedArray] = [array for array in vars(self).values() if isinstance(array, PagedArray)]
+
+    def tile(self, tile: int) -> dict[str, np.ndarray]:
+        """Returns the arrays of a tile, mapping it (and unmapping the least recently used tiles) if needed."""
+        arrays = self.__tiles.get(tile)
+        if arrays is not None:
+            self.__tiles.move_to_end(tile)
+            return arrays
+        tile_path = os.path.join(self.path, f"tile_{self.tile_keys[tile]}")
+        arrays = {
+            name: np.asarray(np.load(os.path.join(tile_path, f"{name}.npy"), mmap_mode="r"))
+            for name in NODE_ARRAYS + EDGE_ARRAYS + REVERSE_EDGE_ARRAYS + SHAPE_ARRAYS
+        }
+        self.__tiles[tile] = arrays
+        self.mapped_bytes += sum(array.nbytes for array in arrays.values())
+        self.tiles_loaded += 1
+        # never unmap the tile just mapped, a single tile larger than the budget still has to work
+        while self.mapped_bytes > self.memory_budget and len(self.__tiles) > 1:
+            evicted_tile, evicted = self.__tiles.popitem(last=False)
+            self.mapped_bytes -= sum(array.nbytes for array in evicted.values())
+            for paged_array in self.paged_arrays:
+                paged_array.release(evicted_tile)
+        return arrays
+
+    @property
+    def tiles_mapped(self) -> int:
+        return len(self.__tiles)
+
+    def edge_sources(self, edges: np.ndarray) -> np.ndarray:
+        tiles = np.searchsorted(self.target.offsets, edges, side="right") - 1
+        sources = np.empty(len(edges), dtype=np.int64)
+        for tile in np.unique(tiles).tolist():
+            selected = tiles == tile
+            indptr = self.tile(tile)["indptr"]
+            sources[selected] = np.searchsorted(indptr, edges[selected], side="right") - 1 + self.indptr.offsets[tile]
+        return sources
+
+    def prefetch(self, latitude: float, longitude: float) -> None:
+        """Maps the tile around a position and its eight neighbours, ahead of the search needing them."""
+        columns = math.ceil(360 / self.tile_degrees)
+        row = math.floor((latitude + 90) / self.tile_degrees)
+        column = math.floor((longitude + 180) / self.tile_degrees)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                key = (row + dr) * columns + (column + dc) % columns
+                position = bisect.bisect_left(self.tile_keys, key)
+                if position < len(self.tile_keys) and self.tile_keys[position] == key:
+                    self.tile(position)
+
+
+def load_road_graph(path: str, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB) -> RoadGraph:
+    """Opens the graph at path, tiled or not."""
+    if os.path.exists(os.path.join(path, TILES_FILE)):
+        logging.info(f"Paging the tiled road graph in {path} within {memory_budget_mb:.0f} MB")
+        return TiledRoadGraph(path, memory_budget_mb)
+    return RoadGraph(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Split a road graph into tiles for on-device paging")
+    parser.add_argument("graph", help="road graph directory written by the importer")
+    parser.add_argument("output", help="the tiled graph directory to write")
+    parser.add_argument("--tile-degrees", type=float, default=DEFAULT_TILE_DEGREES)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tiled = build_tiled_graph(RoadGraph(args.graph), args.output, args.tile_degrees)
+    print(f"Wrote {len(tiled.tile_keys)} tiles, {tiled.node_count} nodes, {tiled.edge_count} edges")
+    print(f"Time taken: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
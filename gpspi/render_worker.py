@@ -0,0 +1,63 @@
+import logging
+import queue
+import threading
+from typing import Callable, Optional
+
+from gpspi.button_handler import LCDButton
+
+# Render at least this often so the sync state does not go stale while nothing else happens.
+IDLE_REDRAW_SECONDS: float = 1.0
+
+# A None event is a plain redraw request, anything else is a button press.
+RenderEvent = Optional[LCDButton]
+
+
+class RenderWorker(threading.Thread):
+    """
+    The only thread that draws or talks to the LCD.
+    GPIO callbacks and the GPS reader just queue events; every event waiting when the worker wakes up is
+    handed to the render callback as one batch, so a burst of button presses turns into a single frame.
+    """
+
+    def __init__(self, render: Callable[[list[RenderEvent]], None]) -> None:
+        super().__init__(name="render-worker", daemon=True)
+        self.render: Callable[[list[RenderEvent]], None] = render
+        self.__events: queue.SimpleQueue[RenderEvent] = queue.SimpleQueue()
+        self.__stopped: threading.Event = threading.Event()
+
+    def push_button(self, button: LCDButton) -> None:
+        """Queue a button press, safe to call from any thread."""
+        self.__events.put(button)
+
+    def request_redraw(self) -> None:
+        """Queue a redraw of the current page, safe to call from any thread."""
+        self.__events.put(None)
+
+    def stop(self) -> None:
+        """Stops the worker once the frame it is drawing is done, so nothing it draws from is closed under it."""
+        self.__stopped.set()
+        self.__events.put(None)  # wake it up
+        if self.is_alive():
+            self.join()
+
+    def __next_batch(self) -> list[RenderEvent]:
+        try:
+            events = [self.__events.get(timeout=IDLE_REDRAW_SECONDS)]
+        except queue.Empty:
+            return [None]
+        while True:
+            try:
+                events.append(self.__events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def run(self) -> None:
+        while True:
+            events = self.__next_batch()
+            if self.__stopped.is_set():
+                return
+            try:
+                self.render(events)
+            except Exception:
+                # a bad frame must not kill the display
+                logging.exception("Render failed")
@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ResourceState(Enum):
+    LOADING: int = 0
+    READY: int = 1
+    UNAVAILABLE: int = 2  # the loader failed or the data is not installed
+
+
+class BackgroundResource(Generic[T]):
+    """A slow to load resource (geocoder, road graph, ...) that is loaded on its own thread so the UI never waits."""
+
+    def __init__(self, name: str, loader: Callable[[], Optional[T]]) -> None:
+        self.name: str = name  # short, it is shown on the LCD
+        self.loader: Callable[[], Optional[T]] = loader  # returns None if the data is not installed
+        self.state: ResourceState = ResourceState.LOADING
+        self.value: Optional[T] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == ResourceState.READY
+
+    def load(self) -> None:
+        start = time.monotonic()
+        try:
+            self.value = self.loader()
+        except Exception:
+            logging.exception(f"Loading {self.name} failed")
+            self.value = None
+        self.load_seconds = time.monotonic() - start
+        # the value is set before the state, readers check the state first
+        self.state = ResourceState.READY if self.value is not None else ResourceState.UNAVAILABLE
+        logging.info(f"{self.name} {self.state.name.lower()} after {self.load_seconds:.2f}s")
+
+
+class ResourceLoader:
+    """Loads every registered resource in the background and reports progress through on_change."""
+
+    def __init__(self, on_change: Callable[[], None], started_at: Optional[float] = None) -> None:
+        self.on_change: Callable[[], None] = on_change  # called from the loader thread, must be thread safe
+        self.started_at: float = started_at if started_at is not None else time.monotonic()
+        self.resources: list[BackgroundResource[Any]] = []
+        self.__thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Optional[T]]) -> BackgroundResource[T]:
+        resource: BackgroundResource[T] = BackgroundResource(name, loader)
+        self.resources.append(resource)
+        return resource
+
+    def start(self) -> None:
+        self.__thread = threading.Thread(target=self.__load_all, name="resource-loader", daemon=True)
+        self.__thread.start()
+
+    def __load_all(self) -> None:
+        # one at a time, on a Pi Zero loading in parallel only makes every resource late
+        for resource in self.resources:
+            resource.load()
+            self.on_change()
+        logging.info(f"Time to ready: {time.monotonic() - self.started_at:.2f}s")
+
+    @property
+    def status(self) -> str:
+        """One LCD line describing the loading progress."""
+        for resource in self.resources:
+            if resource.state == ResourceState.LOADING:
+                return f"Loading {resource.name}..."
+        unavailable = [resource.name for resource in self.resources if resource.state == ResourceState.UNAVAILABLE]
+        if unavailable:
+            return f"No {', '.join(unavailable)}"[:20]
+        return "Maps ready"
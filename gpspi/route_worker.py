@@ -0,0 +1,48 @@
+import logging
+import queue
+import threading
+from typing import Callable, Optional
+
+# A job is a route search that applies its own result, None stops the worker.
+RouteJob = Optional[Callable[[], None]]
+
+
+class RouteWorker(threading.Thread):
+    """
+    Runs route searches one at a time, off the render worker.
+    A search can take seconds on a large graph, and the render worker holds the state lock the GPS reader needs while
+    it handles a button. So the button handler only copies the position and submits a job; the job routes without
+    the lock, takes it just to apply the result and asks for a redraw.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(name="route-worker", daemon=True)
+        self.__jobs: queue.SimpleQueue[RouteJob] = queue.SimpleQueue()
+        self.busy: bool = False  # a job is queued or running
+
+    def submit(self, job: Callable[[], None]) -> bool:
+        """Queue a job unless one is already queued or running, returns False if it was not queued."""
+        if self.busy:
+            return False
+        self.busy = True
+        self.__jobs.put(job)
+        return True
+
+    def stop(self) -> None:
+        """Stops the worker once the search it is running is done."""
+        self.__jobs.put(None)
+        if self.is_alive():
+            self.join()
+
+    def run(self) -> None:
+        while True:
+            job = self.__jobs.get()
+            if job is None:
+                return
+            try:
+                job()
+            except Exception:
+                # a failed search must not stop routing
+                logging.exception("Routing failed")
+            finally:
+                self.busy = False
@@ -0,0 +1,368 @@
+"""
+The breadcrumb trail: every fix the GPS reports, kept in a fixed size ring file so it never fills the SD card.
+
+The file is a header and then capacity records of TRACK_POINT, packed, memory mapped so a batch of fixes is one slice
+copy. Once the ring is full the newest fix overwrites the oldest. The header counts every fix ever written, which
+says both where the next one goes and where the oldest one is; it is only updated after the records it covers are
+synced, so a power cut loses the unsynced batch but never leaves the header pointing at records that were not
+written. Exports read the ring a chunk at a time, so a track of any length costs the same memory to write out.
+
+The recorder appends on its own thread while the map and exports read, so every access to the records holds the
+file's lock: a chunk is copied out under it, and a reader that falls behind the ring skips the records overwritten
+since. The syncs, which wait on the SD card, run outside it and cover only the pages a batch changed, so a reader on
+the render worker never waits for one.
+
+Export a track, simplified on the way out if asked (see track_simplify.py), with:
+    python3 -m gpspi.track_log track.bin track.gpx --simplify douglas-peucker --tolerance 5
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Iterator, Optional, TextIO
+
+import numpy as np
+
+from gpspi.track_simplify import (
+    DEFAULT_BUCKET_SECONDS,
+    DEFAULT_TOLERANCE_M,
+    SimplifyMethod,
+    TrackSimplifier,
+)
+from gpspi.types.GPS_data import GPSData
+from gpspi.types.track_point import TRACK_POINT
+
+TRACK_MAGIC: bytes = b"GPSTRACK"
+TRACK_VERSION: int = 1
+# magic, version, record size, capacity, fixes written since the file was created
+HEADER: struct.Struct = struct.Struct("<8sIIQQ")
+HEADER_SIZE: int = 64  # room to grow, and keeps the records aligned
+
+# a week at one fix a second, about 36 MB
+DEFAULT_CAPACITY: int = 7 * 24 * 3600
+# the recorder writes its buffered fixes when it holds this many or the oldest is this old, whichever comes first
+FLUSH_RECORDS: int = 120
+FLUSH_SECONDS: float = 60.0
+EXPORT_CHUNK_RECORDS: int = 4096
+
+
+class TrackFile:
+    """
+    A ring of TRACK_POINT records in a memory mapped file, created at the given capacity if it does not exist.
+    Opening anything else, or a track file cut short, raises ValueError.
+    """
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY, writable: bool = True) -> None:
+        self.path: str = path
+        self.__lock: threading.Lock = threading.Lock()
+        self.__closed: bool = False
+        # records numbered below this minus capacity are being overwritten by the append in progress
+        self.__reserved: int = 0
+        if not os.path.exists(path):
+            if not writable:
+                raise FileNotFoundError(path)
+            self.__create(capacity)
+        self.__file = open(path, "r+b" if writable else "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        if size < HEADER_SIZE:
+            self.__file.close()
+            raise ValueError(f"{path} is not a version {TRACK_VERSION} track file")
+        self.__map: mmap.mmap = mmap.mmap(
+            self.__file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        )
+        magic, version, record_size, self.capacity, self.written = HEADER.unpack_from(self.__map)
+        if (
+            magic != TRACK_MAGIC
+            or version != TRACK_VERSION
+            or record_size != TRACK_POINT.itemsize
+            or size < HEADER_SIZE + self.capacity * TRACK_POINT.itemsize
+        ):
+            self.__map.close()
+            self.__file.close()
+            raise ValueError(f"{path} is not a version {TRACK_VERSION} track file")
+        self.__reserved = self.written
+        self.__records: np.ndarray = np.frombuffer(
+            self.__map, dtype=TRACK_POINT, count=self.capacity, offset=HEADER_SIZE
+        )
+
+    def __create(self, capacity: int) -> None:
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(
+                HEADER.pack(TRACK_MAGIC, TRACK_VERSION, TRACK_POINT.itemsize, capacity, 0).ljust(HEADER_SIZE, b"\0")
+            )
+            f.truncate(HEADER_SIZE + capacity * TRACK_POINT.itemsize)  # sparse until the ring comes round
+        os.replace(temporary_path, self.path)
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def append(self, points: np.ndarray) -> None:
+        """
+        Writes a batch of TRACK_POINT records after the newest and syncs them, then the header; there is only ever
+        one writer, which must not close the file while it appends
+        :param points: the records, oldest first; only the last capacity are kept if there are more
+        """
+        points = points[-self.capacity :]
+        with self.__lock:
+            if self.__closed:
+                raise ValueError(f"{self.path} is closed")
+            start = self.written % self.capacity
+            first = min(len(points), self.capacity - start)
+            # readers stop at written, and from here on skip the oldest records this batch overwrites
+            self.__reserved = self.written + len(points)
+            self.__records[start : start + first] = points[:first]
+            self.__records[: len(points) - first] = points[first:]  # wrapped round to the start of the ring
+        self.__sync(HEADER_SIZE + start * TRACK_POINT.itemsize, HEADER_SIZE + (start + first) * TRACK_POINT.itemsize)
+        if len(points) > first:
+            self.__sync(HEADER_SIZE, HEADER_SIZE + (len(points) - first) * TRACK_POINT.itemsize)
+        with self.__lock:
+            self.written = self.__reserved
+            HEADER.pack_into(
+                self.__map, 0, TRACK_MAGIC, TRACK_VERSION, TRACK_POINT.itemsize, self.capacity, self.written
+            )
+        self.__sync(0, HEADER.size)
+
+    def __sync(self, first_byte: int, end_byte: int) -> None:
+        """Syncs the pages of the file holding bytes first_byte to end_byte."""
+        offset = first_byte - first_byte % mmap.PAGESIZE  # flush only takes whole pages
+        self.__map.flush(offset, end_byte - offset)
+
+    def __copy(self, first: int, last: int) -> np.ndarray:
+        """Copies the records numbered first to last (counting every fix written), the lock must be held."""
+        start = first % self.capacity
+        if start + last - first <= self.capacity:
+            return self.__records[start : start + last - first].copy()
+        return np.concatenate((self.__records[start:], self.__records[: start + last - first - self.capacity]))
+
+    def chunks(self, chunk_records: int = EXPORT_CHUNK_RECORDS) -> Iterator[np.ndarray]:
+        """
+        Yields copies of the records, oldest first, at most chunk_records at a time; the fixes written meanwhile are
+        not included, the ones they overwrite before they are read are skipped
+        """
+        with self.__lock:
+            first, last = max(0, self.written - self.capacity), self.written
+        while first < last:
+            with self.__lock:
+                if self.__closed:
+                    return
+                first = max(first, self.__reserved - self.capacity)
+                end = min(first + chunk_records, last)
+                chunk = self.__copy(first, end) if first < end else None
+            if chunk is None:
+                return
+            yield chunk
+            first = end
+
+    def recent(self, count: int) -> np.ndarray:
+        """Returns a copy of the newest records, at most count, oldest first."""
+        with self.__lock:
+            if self.__closed:
+                return np.empty(0, dtype=TRACK_POINT)
+            return self.__copy(max(0, self.__reserved - self.capacity, self.written - count), self.written)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__closed = True
+            # the record view holds the map open
+            self.__records = np.empty(0, dtype=TRACK_POINT)
+            self.__map.close()
+            self.__file.close()
+
+
+def track_point(gps_data: GPSData) -> Optional[tuple[float, ...]]:
+    """The fix as a TRACK_POINT row, None without a position and time."""
+    if gps_data.latitude is None or gps_data.longitude is None or gps_data.time is None:
+        return None
+
+    def value(field: Optional[float]) -> float:
+        return float(field) if field is not None else float("nan")
+
+    return (
+        gps_data.time.timestamp(),
+        gps_data.latitude,
+        gps_data.longitude,
+        value(gps_data.altitude),
+        value(gps_data.speed),
+        value(gps_data.true_heading),
+    )
+
+
+class TrackRecorder(threading.Thread):
+    """
+    Records fixes into a TrackFile without the caller ever touching the SD card.
+    record() only queues the fix; the recorder thread buffers them and writes FLUSH_RECORDS at a time (or whatever it
+    holds after FLUSH_SECONDS), so a fix a second costs one write and sync every couple of minutes instead of one each.
+    With a simplifier the fixes go through it first and only what it keeps is written; it holds back up to its window
+    of fixes, which a power cut loses along with the buffer.
+    """
+
+    def __init__(
+        self, path: str, capacity: int = DEFAULT_CAPACITY, simplifier: Optional[TrackSimplifier] = None
+    ) -> None:
+        super().__init__(name="track-recorder", daemon=True)
+        try:
+            self.track: TrackFile = TrackFile(path, capacity)
+        except ValueError as e:
+            # keep the old file for a look later, but never let it stop the app starting
+            bad_path = f"{path}.bad"
+            logging.error(f"{e}, moving it to {bad_path} and starting a new track")
+            os.replace(path, bad_path)
+            self.track = TrackFile(path, capacity)
+        self.simplifier: Optional[TrackSimplifier] = simplifier
+        self.__queue: queue.SimpleQueue[Optional[tuple[float, ...]]] = queue.SimpleQueue()
+        self.__last_time: Optional[float] = None
+
+    def record(self, gps_data: GPSData) -> None:
+        """Queues the current fix, once per GPS time, called on the thread that updates gps_data."""
+        point = track_point(gps_data)
+        if point is None or point[0] == self.__last_time:
+            return
+        self.__last_time = point[0]
+        self.__queue.put(point)
+
+    def close(self) -> None:
+        """Writes everything buffered and stops the recorder."""
+        self.__queue.put(None)
+        if self.is_alive():
+            self.join()
+        self.track.close()
+
+    def __write(self, buffered: list[np.ndarray]) -> None:
+        try:
+            self.track.append(np.concatenate(buffered))
+        except OSError:
+            logging.exception("Writing the track failed, dropping the buffered fixes")
+
+    def run(self) -> None:
+        buffered: list[np.ndarray] = []
+        buffered_records = 0
+        deadline = float("inf")  # when the oldest buffered fix has waited FLUSH_SECONDS
+        while True:
+            try:
+                point = self.__queue.get(timeout=max(0.0, deadline - time.monotonic()) if buffered else None)
+            except queue.Empty:
+                point = ()  # the deadline passed
+            if point is None:
+                break
+            if point:
+                records = np.array([point], dtype=TRACK_POINT)
+                if self.simplifier is not None:
+                    records = self.simplifier.push(records)
+                if len(records):
+                    if not buffered:
+                        deadline = time.monotonic() + FLUSH_SECONDS
+                    buffered.append(records)
+                    buffered_records += len(records)
+            if buffered and (buffered_records >= FLUSH_RECORDS or time.monotonic() >= deadline):
+                self.__write(buffered)
+                buffered, buffered_records = [], 0
+        if self.simplifier is not None:
+            buffered.append(self.simplifier.finish())
+            logging.info(f"Track simplification: {self.simplifier.stats}")
+        if sum(len(records) for records in buffered):
+            self.__write(buffered)
+
+
+# Export
+
+
+def _iso_times(seconds: np.ndarray) -> np.ndarray:
+    return np.char.add(np.datetime_as_string((seconds * 1000).astype("datetime64[ms]"), unit="ms"), "Z")
+
+
+def write_csv(points: Iterator[np.ndarray], out: TextIO) -> int:
+    """
+    Writes the track as CSV, one chunk of points at a time
+    :param points: chunks of TRACK_POINT records, oldest first
+    :param out: the text file to write to
+    :return: the number of points written
+    """
+    out.write("time,latitude,longitude,altitude,speed,heading\n")
+    count = 0
+    for chunk in points:
+        columns = [
+            _iso_times(chunk["time"]),
+            np.char.mod("%.7f", chunk["latitude"]),
+            np.char.mod("%.7f", chunk["longitude"]),
+        ] + [np.where(np.isnan(chunk[name]), "", np.char.mod("%.2f", chunk[name])) for name in TRACK_POINT.names[3:]]
+        out.writelines(",".join(row) + "\n" for row in zip(*(column.tolist() for column in columns)))
+        count += len(chunk)
+    return count
+
+
+def write_gpx(points: Iterator[np.ndarray], out: TextIO, name: str = "gpspi track") -> int:
+    """
+    Writes the track as a GPX 1.1 track of one segment, one chunk of points at a time
+    :param points: chunks of TRACK_POINT records, oldest first
+    :param out: the text file to write to
+    :param name: the name of the track
+    :return: the number of points written
+    """
+    out.write(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="gpspi" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f"<trk><name>{name}</name><trkseg>\n"
+    )
+    count = 0
+    for chunk in points:
+        elevations = np.where(np.isnan(chunk["altitude"]), "", np.char.mod("<ele>%.1f</ele>", chunk["altitude"]))
+        rows = zip(
+            np.char.mod("%.7f", chunk["latitude"]).tolist(),
+            np.char.mod("%.7f", chunk["longitude"]).tolist(),
+            elevations.tolist(),
+            _iso_times(chunk["time"]).tolist(),
+        )
+        out.writelines(
+            f'<trkpt lat="{lat}" lon="{lon}">{elevation}<time>{timestamp}</time></trkpt>\n'
+            for lat, lon, elevation, timestamp in rows
+        )
+        count += len(chunk)
+    out.write("</trkseg></trk>\n</gpx>\n")
+    return count
+
+
+def export_track(track: TrackFile, output_path: str, simplifier: Optional[TrackSimplifier] = None) -> int:
+    """
+    Writes the track to a file
+    :param track: the track
+    :param output_path: the file to write, as CSV if it ends in .csv, GPX otherwise
+    :param simplifier: simplifies the track on the way out, if given
+    :return: the number of points written
+    """
+    points = track.chunks() if simplifier is None else simplifier.stream(track.chunks())
+    with open(output_path, "w") as out:
+        if output_path.lower().endswith(".csv"):
+            return write_csv(points, out)
+        return write_gpx(points, out, name=os.path.basename(track.path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the recorded track as GPX or CSV")
+    parser.add_argument("track", help="track file written by the app")
+    parser.add_argument("output", help="the .gpx or .csv file to write")
+    parser.add_argument("--simplify", choices=[method.value for method in SimplifyMethod], help="simplify the track")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE_M, help="simplification tolerance (m)")
+    parser.add_argument("--bucket-seconds", type=float, default=DEFAULT_BUCKET_SECONDS, help="for time-buckets")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    simplifier = (
+        TrackSimplifier(SimplifyMethod(args.simplify), args.tolerance, args.bucket_seconds) if args.simplify else None
+    )
+    track = TrackFile(args.track, writable=False)
+    count = export_track(track, args.output, simplifier)
+    track.close()
+    print(f"Wrote {count} points to {args.output}")
+    if simplifier is not None:
+        print(f"Simplified {simplifier.stats}")
+    print(f"Time taken: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
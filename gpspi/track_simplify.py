@@ -0,0 +1,240 @@
+"""
+Simplification of recorded tracks, so a day at 10 Hz does not cost a day at 10 Hz to store, draw or export.
+
+Douglas-Peucker keeps the fewest points that stay within the tolerance of every point dropped. Visvalingam drops
+the points that make the smallest triangles with their neighbours first, which keeps the character of a wiggly
+track better at the same count. Both measure in metres on a local flat projection, which is exact enough over the
+few hundred metres a window covers. Time buckets keep the first fix in every bucket_seconds, whatever the shape.
+
+TrackSimplifier runs any of them on a stream of TRACK_POINT records (see types/track_point.py) while holding at most
+window of them: when the window fills it is simplified, the points that are final are passed on and the rest, from
+the last kept point, carry into the next window. The recorder uses it as a stage between the GPS and the ring file, the
+export runs the ring through it.
+"""
+
+import heapq
+import math
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from gpspi.mapping.geodesy import EARTH_RADIUS_M
+from gpspi.types.track_point import TRACK_POINT
+
+DEFAULT_TOLERANCE_M: float = 3.0
+DEFAULT_BUCKET_SECONDS: float = 5.0
+DEFAULT_WINDOW: int = 256
+
+
+class SimplifyMethod(Enum):
+    DOUGLAS_PEUCKER = "douglas-peucker"
+    VISVALINGAM = "visvalingam"
+    TIME_BUCKETS = "time-buckets"
+
+
+@dataclass
+class TrackSimplifyStats:
+    points_in: int = 0
+    points_out: int = 0
+    seconds: float = 0.0  # spent simplifying
+
+    @property
+    def compression(self) -> float:
+        """Points in per point out."""
+        return self.points_in / self.points_out if self.points_out else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Points simplified per second."""
+        return self.points_in / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.points_in:,} -> {self.points_out:,} points ({self.compression:.1f}:1), "
+            f"{self.throughput:,.0f} points/s"
+        )
+
+
+def _local_meters(latitudes: np.ndarray, longitudes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """East and north of the first point, in metres."""
+    north = np.radians(latitudes - latitudes[0]) * EARTH_RADIUS_M
+    delta_lon = (longitudes - longitudes[0] + 180) % 360 - 180
+    east = np.radians(delta_lon) * EARTH_RADIUS_M * math.cos(math.radians(float(latitudes[0])))
+    return east, north
+
+
+def _segment_distances(x: np.ndarray, y: np.ndarray, ax: float, ay: float, bx: float, by: float) -> np.ndarray:
+    """The distance from every point to the segment from a to b."""
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.clip(((x - ax) * dx + (y - ay) * dy) / length2, 0, 1) if length2 else 0.0
+    return np.hypot(x - ax - t * dx, y - ay - t * dy)
+
+
+def douglas_peucker(latitudes: np.ndarray, longitudes: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Simplifies a line with Douglas-Peucker
+    :param latitudes: latitudes of the points (degrees)
+    :param longitudes: longitudes of the points (degrees)
+    :param tolerance_m: the furthest a dropped point may be from the simplified line (meters)
+    :return: a bool per point, True for the points kept; the first and last always are
+    """
+    n = len(latitudes)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    x, y = _local_meters(latitudes, longitudes)
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(x[first + 1 : last], y[first + 1 : last], x[first], y[first], x[last], y[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack += [(first, split), (split, last)]
+    return keep
+
+
+def visvalingam(latitudes: np.ndarray, longitudes: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Simplifies a line with Visvalingam-Whyatt
+    :param latitudes: latitudes of the points (degrees)
+    :param longitudes: longitudes of the points (degrees)
+    :param tolerance_m: points are dropped, smallest first, while the triangle one makes with its neighbours is under
+        tolerance_m squared (square meters)
+    :return: a bool per point, True for the points kept; the first and last always are
+    """
+    n = len(latitudes)
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+    east, north = _local_meters(latitudes, longitudes)
+    x, y = east.tolist(), north.tolist()
+    previous = list(range(-1, n - 1))
+    following = list(range(1, n + 1))
+
+    def area(i: int) -> float:
+        a, c = previous[i], following[i]
+        return abs((x[a] - x[i]) * (y[c] - y[i]) - (x[c] - x[i]) * (y[a] - y[i])) / 2
+
+    threshold = tolerance_m * tolerance_m
+    areas = [0.0] + [area(i) for i in range(1, n - 1)] + [0.0]
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    while heap:
+        smallest, i = heapq.heappop(heap)
+        if not keep[i] or smallest != areas[i]:
+            continue  # removed already, or its area changed when a neighbour went
+        if smallest >= threshold:
+            break
+        keep[i] = False
+        before, after = previous[i], following[i]
+        following[before], previous[after] = after, before
+        for j in (before, after):
+            if 0 < j < n - 1:
+                areas[j] = area(j)
+                heapq.heappush(heap, (areas[j], j))
+    return keep
+
+
+def time_buckets(times: np.ndarray, bucket_seconds: float, last_bucket: Optional[float] = None) -> np.ndarray:
+    """
+    Downsamples by time
+    :param times: the time of every point (seconds), in order
+    :param bucket_seconds: the length of a bucket (seconds)
+    :param last_bucket: the bucket of the point before these, if any
+    :return: a bool per point, True for the first point in each bucket
+    """
+    buckets = np.floor(times / bucket_seconds)
+    return buckets != np.concatenate(([last_bucket if last_bucket is not None else np.nan], buckets[:-1]))
+
+
+class TrackSimplifier:
+    """Simplifies a stream of track records holding at most window of them, see the module docstring."""
+
+    def __init__(
+        self,
+        method: SimplifyMethod = SimplifyMethod.DOUGLAS_PEUCKER,
+        tolerance_m: float = DEFAULT_TOLERANCE_M,
+        bucket_seconds: float = DEFAULT_BUCKET_SECONDS,
+        window: int = DEFAULT_WINDOW,
+    ) -> None:
+        self.method: SimplifyMethod = method
+        self.tolerance_m: float = tolerance_m
+        self.bucket_seconds: float = bucket_seconds
+        self.window: int = max(window, 3)
+        self.stats: TrackSimplifyStats = TrackSimplifyStats()
+        # not passed on yet, the first is the anchor: the last point passed on
+        self.__pending: Optional[np.ndarray] = None
+        self.__last_bucket: Optional[float] = None
+
+    def __keep(self, points: np.ndarray) -> np.ndarray:
+        if self.method == SimplifyMethod.VISVALINGAM:
+            return visvalingam(points["latitude"], points["longitude"], self.tolerance_m)
+        return douglas_peucker(points["latitude"], points["longitude"], self.tolerance_m)
+
+    def __push_window(self, points: np.ndarray) -> np.ndarray:
+        emitted = []
+        if self.__pending is None:
+            # the first point of a track is always kept and anchors the first window
+            emitted.append(points[:1])
+            self.__pending = points[:0]
+        pending = np.concatenate((self.__pending, points))
+        while len(pending) >= self.window:
+            kept = np.flatnonzero(self.__keep(pending[: self.window]))
+            # the last kept point only ends the window, the one before it is the last that is final
+            anchor = kept[-2] if len(kept) > 2 else self.window - 1
+            emitted.append(pending[kept[1:-1]] if len(kept) > 2 else pending[anchor : anchor + 1])
+            pending = pending[anchor:]
+        self.__pending = pending.copy()
+        return np.concatenate(emitted) if emitted else points[:0]
+
+    def push(self, points: np.ndarray) -> np.ndarray:
+        """
+        Simplifies more of the track
+        :param points: the next TRACK_POINT records, oldest first
+        :return: the records that are final, maybe none; the rest come out of later pushes or finish()
+        """
+        start = time.perf_counter()
+        if self.method == SimplifyMethod.TIME_BUCKETS:
+            emitted = points[time_buckets(points["time"], self.bucket_seconds, self.__last_bucket)]
+            if len(points):
+                self.__last_bucket = math.floor(points["time"][-1] / self.bucket_seconds)
+        elif len(points):
+            emitted = self.__push_window(points)
+        else:
+            emitted = points
+        self.stats.points_in += len(points)
+        self.stats.points_out += len(emitted)
+        self.stats.seconds += time.perf_counter() - start
+        return emitted
+
+    def finish(self) -> np.ndarray:
+        """Returns the records still held, simplified, and starts over for a new track."""
+        pending, self.__pending, self.__last_bucket = self.__pending, None, None
+        if pending is None:
+            return np.empty(0, dtype=TRACK_POINT)
+        if len(pending) < 2:
+            return pending[:0]  # only the anchor, passed on already
+        start = time.perf_counter()
+        emitted = pending[np.flatnonzero(self.__keep(pending))[1:]]
+        self.stats.points_out += len(emitted)
+        self.stats.seconds += time.perf_counter() - start
+        return emitted
+
+    def stream(self, chunks: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """Simplifies a whole track given in chunks, for the batch export."""
+        for chunk in chunks:
+            emitted = self.push(chunk)
+            if len(emitted):
+                yield emitted
+        emitted = self.finish()
+        if len(emitted):
+            yield emitted
@@ -47,7 +47,17 @@ class GPSData:
         time: Optional[str],
         true_heading: Optional[float],
         mag_heading: Optional[float],
-    ) -> None:
+    ) -> bool:
+        """Merge a position report into the stored data, returns True if any field changed."""
+        before = (
+            self.latitude,
+            self.longitude,
+            self.altitude,
+            self.speed,
+            self.time,
+            self.true_heading,
+            self.mag_heading,
+        )
         self.latitude = latitude if latitude is not None else self.latitude
         self.longitude = longitude if longitude is not None else self.longitude
         self.altitude = altitude if altitude is not None else self.altitude
@@ -55,10 +65,22 @@ class GPSData:
         self.time = datetime.datetime.fromisoformat(time) if time is not None else self.time
         self.true_heading = true_heading if true_heading is not None else self.true_heading
         self.mag_heading = mag_heading if mag_heading is not None else self.mag_heading
+        return before != (
+            self.latitude,
+            self.longitude,
+            self.altitude,
+            self.speed,
+            self.time,
+            self.true_heading,
+            self.mag_heading,
+        )
 
-    def update_satellite_data(self, time: Optional[str], satellites: list[dict[str, object]]) -> None:
+    def update_satellite_data(self, time: Optional[str], satellites: Optional[list[dict[str, object]]]) -> bool:
+        """Merge a satellite report into the stored data, returns True if any field changed."""
+        before = (self.time, self.satellites)
         self.time = datetime.datetime.fromisoformat(time) if time is not None else self.time
         self.satellites = satellites if satellites is not None else self.satellites
+        return before != (self.time, self.satellites)
 
 
 @dataclass(frozen=True)
@@ -1,4 +1,18 @@
+from dataclasses import dataclass, field
 from enum import Enum
+from operator import attrgetter
+from typing import Any, Callable, Optional
+
+from gpspi.mapping.coord_utils import get_distance_feet, get_magnetic_bearing
+from gpspi.types.saved_data import Waypoint
+
+Color = tuple[int, int, int]
+
+WHITE: Color = (255, 255, 255)
+GREEN: Color = (0, 255, 0)
+RED: Color = (255, 0, 0)
+
+MPS_TO_MPH: float = 2.2369362921
 
 
 class Page(Enum):
@@ -8,3 +22,166 @@ class Page(Enum):
     SELECT_WAYPOINTS: int = 3
     COMPASS_HEADING_AND_SPEED: int = 4
     COORDINATES_AND_DISTANCE: int = 5
+    MAP: int = 6  # drawn by gpspi.map_view, it has no PageLayout
+
+
+@dataclass(frozen=True)
+class PageField:
+    """One line of a page, formatted from the display attributes named in inputs."""
+
+    inputs: tuple[str, ...]  # dotted attribute paths on the display, ex "gps_data.latitude"
+    formatter: Callable[..., str]  # called with the input values, in order
+    color: Optional[Callable[..., Color]] = None  # same arguments as formatter, white if not set
+
+
+@dataclass(frozen=True)
+class PageLayout:
+    """The fields and button labels of a page."""
+
+    fields: tuple[PageField, ...]
+    buttons: list[str] = field(default_factory=lambda: ["N/A", "N/A", "N/A"])
+    requires: Optional[str] = None  # dotted attribute path that must be truthy for the fields to be shown
+    fallback: str = ""  # shown instead of the fields when requires is not met
+
+
+def static(text: str) -> PageField:
+    return PageField((), lambda: text)
+
+
+class PageView:
+    """Formats a PageLayout, recomputing only the fields whose inputs changed since the last update."""
+
+    def __init__(self, page: Page, layout: PageLayout) -> None:
+        self.page: Page = page
+        self.layout: PageLayout = layout
+        self.lines: list[str] = [""] * len(layout.fields)
+        self.colors: list[Color] = [WHITE] * len(layout.fields)
+        self.__getters: list[Optional[Callable[[Any], Any]]] = [
+            attrgetter(*page_field.inputs) if page_field.inputs else None for page_field in layout.fields
+        ]
+        self.__requires: Optional[Callable[[Any], Any]] = attrgetter(layout.requires) if layout.requires else None
+        self.__last_inputs: list[Optional[tuple[Any, ...]]] = [None] * len(layout.fields)
+
+    def update(self, source: Any) -> tuple[list[str], list[Color]]:
+        """Return the lines and colors of the page for the current state of source (the GPSDisplay)."""
+        if self.__requires is not None and not self.__requires(source):
+            return [self.layout.fallback], [WHITE]
+        for i, (page_field, getter) in enumerate(zip(self.layout.fields, self.__getters)):
+            if getter is None:
+                values: tuple[Any, ...] = ()
+            elif len(page_field.inputs) == 1:
+                values = (getter(source),)
+            else:
+                values = getter(source)
+            if values == self.__last_inputs[i]:
+                continue
+            self.__last_inputs[i] = values
+            self.lines[i] = page_field.formatter(*values)
+            if page_field.color is not None:
+                self.colors[i] = page_field.color(*values)
+        return self.lines, self.colors
+
+
+def _rounded(value: Optional[float], digits: int = 2) -> str:
+    return "?" if value is None else str(round(value, digits))
+
+
+def _target_heading(latitude: Optional[float], longitude: Optional[float], destination: Waypoint) -> str:
+    if latitude is None or longitude is None:
+        return "TgtH:?"
+    return f"TgtH:{get_magnetic_bearing(Waypoint(latitude, longitude, 0.0), destination)}"
+
+
+def _target_distance(latitude: Optional[float], longitude: Optional[float], destination: Waypoint) -> str:
+    if latitude is None or longitude is None:
+        return "? Mi"
+    return f"{round(get_distance_feet(Waypoint(latitude, longitude, 0.0), destination) / 5280,2)} Mi"
+
+
+def _waypoint_title(index: int, count: int, nearest_first: bool) -> str:
+    return f"{'Near' if nearest_first else 'Waypoint'} {index + 1}/{count}"
+
+
+def _waypoint_proximity(proximity: Optional[tuple[float, float]]) -> str:
+    if proximity is None:
+        return "Dist: ?"
+    distance, bearing = proximity
+    return f"{round(distance * 3.28084 / 5280, 2)}Mi @ {round(bearing)}"
+
+
+def _sync_color(in_sync: bool) -> Color:
+    return GREEN if in_sync else RED
+
+
+_POSITION = ("gps_data.latitude", "gps_data.longitude", "saved_data.destination")
+
+PAGE_LAYOUTS: dict[Page, PageLayout] = {
+    Page.TIME_AND_SATELLITES: PageLayout(
+        (
+            PageField(("gps_data.time",), lambda t: t.strftime("%Y-%m-%d %H:%M:%S")),
+            PageField(("gps_data.num_satellites",), lambda n: f"Sats connected: {n}"),
+            PageField(("gps_data.in_sync",), lambda s: f"Synced: {'Yes' if s else 'No'}"),
+            PageField(("resource_status",), lambda status: status),
+        ),
+        buttons=["B+", "B-", "RB"],
+    ),
+    Page.GPS_COORDINATES: PageLayout(
+        (
+            PageField(("gps_data.in_sync",), lambda _: "Current Cords", _sync_color),
+            PageField(("gps_data.in_sync",), lambda _: "Green = recent", _sync_color),
+            PageField(("gps_data.latitude",), lambda lat: f"Lat: {lat}"),
+            PageField(("gps_data.longitude",), lambda lon: f"Lon: {lon}"),
+        ),
+    ),
+    Page.SELECT_DESTINATION: PageLayout(
+        (
+            static("Destination set to:"),
+            PageField(("saved_data.destination",), lambda d: f"Lat: {d.latitude}"),
+            PageField(("saved_data.destination",), lambda d: f"Lon: {d.longitude}"),
+            PageField(("saved_data.destination",), lambda d: f"Name: {d.name}"),
+        ),
+        buttons=["NR", "NC", "WP"],
+        requires="saved_data.destination",
+        fallback="No destination set",
+    ),
+    Page.SELECT_WAYPOINTS: PageLayout(
+        (
+            PageField(("cur_waypoint_index", "waypoint_count", "sort_waypoints_by_distance"), _waypoint_title),
+            PageField(("cur_waypoint",), lambda w: f"Lat: {w.latitude}"),
+            PageField(("cur_waypoint",), lambda w: f"Lon: {w.longitude}"),
+            PageField(("cur_waypoint",), lambda w: f"Alt: {w.altitude}"),
+            PageField(("cur_waypoint",), lambda w: f"Name: {w.name}"),
+            PageField(("cur_waypoint_proximity",), _waypoint_proximity),
+        ),
+        buttons=["DEL", "PREV", "NEXT"],
+        requires="cur_waypoint",
+        fallback="No waypoints saved",
+    ),
+    Page.COMPASS_HEADING_AND_SPEED: PageLayout(
+        (
+            PageField(
+                ("gps_data.speed",), lambda v: f"Cur Speed:{_rounded(v * MPS_TO_MPH if v is not None else None)}MPH"
+            ),
+            PageField(("gps_data.mag_heading",), lambda h: f"CurH:{_rounded(h)}"),
+            PageField(_POSITION, _target_heading),
+            static("Headings are in"),
+            static("Magnetic Degrees"),
+        ),
+        requires="saved_data.destination",
+        fallback="No destination set",
+    ),
+    Page.COORDINATES_AND_DISTANCE: PageLayout(
+        (
+            PageField(("gps_data.latitude",), lambda lat: f"LAT: {lat}"),
+            PageField(("gps_data.longitude",), lambda lon: f"Lng: {lon}"),
+            static("Current Cords^"),
+            PageField(("saved_data.destination",), lambda d: f"LAT: {d.latitude}"),
+            PageField(("saved_data.destination",), lambda d: f"Lng: {d.longitude}"),
+            static("Target Cords^"),
+            static("Dist to Tgt:"),
+            PageField(_POSITION, _target_distance),
+        ),
+        requires="saved_data.destination",
+        fallback="No destination set",
+    ),
+}
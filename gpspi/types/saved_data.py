@@ -1,5 +1,7 @@
 from dataclasses import dataclass, field
-from typing import Optional, TypedDict
+from typing import Iterable, Iterator, Optional, TypedDict, Union, overload
+
+import numpy as np
 
 
 class DictWaypoint(TypedDict):
@@ -8,12 +10,20 @@ class DictWaypoint(TypedDict):
     altitude: float
 
 
+class DictWaypointColumns(TypedDict):
+    latitude: list[float]
+    longitude: list[float]
+    altitude: list[float]
+    name: list[int]  # index into names, -1 for no name
+    names: list[str]
+
+
 class DictSavedData(TypedDict):
     destination: Optional[DictWaypoint]
-    waypoints: list[DictWaypoint]
+    waypoints: Union[DictWaypointColumns, list[DictWaypoint]]  # a list in files written before WaypointSet
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Waypoint:
     latitude: float
     longitude: float
@@ -32,20 +42,203 @@ class Waypoint:
         }
 
 
+class WaypointSet:
+    """
+    A list of waypoints stored as columns: latitude, longitude and altitude arrays, and an index per waypoint into a
+    table of the distinct names. Indexing returns a Waypoint built on the fly, the vectorized geodesy reads the
+    coordinate arrays directly. Appending is amortized O(1), the arrays grow by doubling.
+    """
+
+    def __init__(self, waypoints: Iterable[Waypoint] = ()) -> None:
+        self.__size: int = 0
+        self.__latitude: np.ndarray = np.empty(0, dtype=np.float64)
+        self.__longitude: np.ndarray = np.empty(0, dtype=np.float64)
+        self.__altitude: np.ndarray = np.empty(0, dtype=np.float64)
+        self.__name: np.ndarray = np.empty(0, dtype=np.int32)
+        self.names: list[str] = []
+        self.__name_ids: dict[str, int] = {}
+        self.version: int = 0  # changes whenever a waypoint is added or deleted, for caches of what was drawn
+        self.extend(waypoints)
+
+    # Columns
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self.__latitude[: self.__size]
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self.__longitude[: self.__size]
+
+    @property
+    def altitudes(self) -> np.ndarray:
+        return self.__altitude[: self.__size]
+
+    def __intern(self, name: Optional[str]) -> int:
+        if name is None:
+            return -1
+        name_id = self.__name_ids.get(name)
+        if name_id is None:
+            name_id = self.__name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def __append_columns(
+        self, latitudes: np.ndarray, longitudes: np.ndarray, altitudes: np.ndarray, names: np.ndarray
+    ) -> None:
+        size = self.__size + len(latitudes)
+        if size > len(self.__latitude):
+            capacity = max(size, 2 * len(self.__latitude), 16)
+
+            def grow(column: np.ndarray) -> np.ndarray:
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[: self.__size] = column[: self.__size]
+                return grown
+
+            self.__latitude, self.__longitude = grow(self.__latitude), grow(self.__longitude)
+            self.__altitude, self.__name = grow(self.__altitude), grow(self.__name)
+        self.__latitude[self.__size : size] = latitudes
+        self.__longitude[self.__size : size] = longitudes
+        self.__altitude[self.__size : size] = altitudes
+        self.__name[self.__size : size] = names
+        self.__size = size
+        self.version += 1
+
+    # List interface
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __iter__(self) -> Iterator[Waypoint]:
+        for index in range(self.__size):
+            yield self[index]
+
+    @overload
+    def __getitem__(self, index: int) -> Waypoint: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "WaypointSet": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Waypoint, "WaypointSet"]:
+        if isinstance(index, slice):
+            selected = WaypointSet()
+            selected.names, selected.__name_ids = list(self.names), dict(self.__name_ids)
+            selected.__append_columns(
+                self.latitudes[index], self.longitudes[index], self.altitudes[index], self.__name[: self.__size][index]
+            )
+            return selected
+        if not -self.__size <= index < self.__size:
+            raise IndexError("waypoint index out of range")
+        index %= self.__size
+        name_id = int(self.__name[index])
+        return Waypoint(
+            float(self.__latitude[index]),
+            float(self.__longitude[index]),
+            float(self.__altitude[index]),
+            name=self.names[name_id] if name_id >= 0 else None,
+        )
+
+    def __delitem__(self, index: int) -> None:
+        if not -self.__size <= index < self.__size:
+            raise IndexError("waypoint index out of range")
+        index %= self.__size
+        for column in (self.__latitude, self.__longitude, self.__altitude, self.__name):
+            column[index : self.__size - 1] = column[index + 1 : self.__size]
+        self.__size -= 1
+        self.version += 1
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, WaypointSet):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __iadd__(self, waypoints: Iterable[Waypoint]) -> "WaypointSet":
+        self.extend(waypoints)
+        return self
+
+    def __repr__(self) -> str:
+        return f"WaypointSet({len(self)} waypoints)"
+
+    def append(self, waypoint: Waypoint) -> None:
+        self.extend((waypoint,))
+
+    def extend(self, waypoints: Iterable[Waypoint]) -> None:
+        if isinstance(waypoints, WaypointSet):
+            # the trailing -1 maps no name (-1) to no name
+            remap = np.array([self.__intern(name) for name in waypoints.names] + [-1], dtype=np.int32)
+            self.__append_columns(
+                waypoints.latitudes,
+                waypoints.longitudes,
+                waypoints.altitudes,
+                remap[waypoints.__name[: len(waypoints)]],
+            )
+            return
+        waypoints = list(waypoints)
+        self.__append_columns(
+            np.array([waypoint.latitude for waypoint in waypoints], dtype=np.float64),
+            np.array([waypoint.longitude for waypoint in waypoints], dtype=np.float64),
+            np.array([waypoint.altitude for waypoint in waypoints], dtype=np.float64),
+            np.array([self.__intern(waypoint.name) for waypoint in waypoints], dtype=np.int32),
+        )
+
+    # Serialization
+
+    @classmethod
+    def from_columns(cls, data: DictWaypointColumns) -> "WaypointSet":
+        waypoints = cls()
+        waypoints.names = list(data["names"])
+        waypoints.__name_ids = {name: name_id for name_id, name in enumerate(waypoints.names)}
+        waypoints.__append_columns(
+            np.array(data["latitude"], dtype=np.float64),
+            np.array(data["longitude"], dtype=np.float64),
+            np.array(data["altitude"], dtype=np.float64),
+            np.array(data["name"], dtype=np.int32),
+        )
+        return waypoints
+
+    @classmethod
+    def from_dicts(cls, data: list[DictWaypoint]) -> "WaypointSet":
+        waypoints = cls()
+        count = len(data)
+        waypoints.__append_columns(
+            np.fromiter((waypoint["latitude"] for waypoint in data), dtype=np.float64, count=count),
+            np.fromiter((waypoint["longitude"] for waypoint in data), dtype=np.float64, count=count),
+            np.fromiter((waypoint["altitude"] for waypoint in data), dtype=np.float64, count=count),
+            np.full(count, -1, dtype=np.int32),
+        )
+        return waypoints
+
+    def to_columns(self) -> DictWaypointColumns:
+        # only the names still in use
+        name_ids = self.__name[: self.__size]
+        used, remapped = np.unique(name_ids, return_inverse=True)
+        if len(used) and used[0] == -1:
+            remapped -= 1
+            used = used[1:]
+        return {
+            "latitude": self.latitudes.tolist(),
+            "longitude": self.longitudes.tolist(),
+            "altitude": self.altitudes.tolist(),
+            "name": remapped.astype(np.int32).tolist(),
+            "names": [self.names[name_id] for name_id in used.tolist()],
+        }
+
+
 @dataclass
 class SavedData:
     destination: Optional[Waypoint] = None
-    waypoints: list[Waypoint] = field(default_factory=list)
+    waypoints: WaypointSet = field(default_factory=WaypointSet)
 
     @classmethod
     def from_dict(cls, data: DictSavedData) -> "SavedData":
+        waypoints = data["waypoints"]
         return cls(
             Waypoint.from_dict(data["destination"]) if data["destination"] else None,
-            [Waypoint.from_dict(waypoint) for waypoint in data["waypoints"]],
+            WaypointSet.from_dicts(waypoints) if isinstance(waypoints, list) else WaypointSet.from_columns(waypoints),
         )
 
     def to_dict(self) -> "DictSavedData":
         return {
             "destination": self.destination.to_dict() if self.destination else None,
-            "waypoints": [waypoint.to_dict() for waypoint in self.waypoints],
+            "waypoints": self.waypoints.to_columns(),
         }
@@ -0,0 +1,14 @@
+import numpy as np
+
+# One fix of the recorded track, packed: timestamp (seconds since the epoch, UTC), position (degrees), altitude
+# (meters), speed (m/s), heading (degrees from true north); NaN for what the fix did not report
+TRACK_POINT: np.dtype = np.dtype(
+    [
+        ("time", "<f8"),
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+        ("altitude", "<f4"),
+        ("speed", "<f4"),
+        ("heading", "<f4"),
+    ]
+)
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Any, Optional
+
+from gpspi.types.saved_data import DictSavedData, SavedData, Waypoint, WaypointSet
+
+# Rewrite the snapshot and empty the journal after this many journal entries.
+COMPACT_EVERY: int = 500
+
+# A journal entry is one change, {"seq": n, "op": "add" | "delete" | "destination", ...}.
+JournalEntry = dict[str, Any]
+
+# Queued for the writer: an entry to append, "compact", or None to stop.
+WriterItem = Optional[JournalEntry | str]
+
+
+def apply_entry(data: SavedData, entry: JournalEntry) -> None:
+    """Replays one journal entry onto data."""
+    if entry["op"] == "add":
+        data.waypoints += WaypointSet.from_columns(entry["waypoints"])
+    elif entry["op"] == "delete":
+        del data.waypoints[entry["index"]]
+    elif entry["op"] == "destination":
+        data.destination = Waypoint.from_dict(entry["waypoint"]) if entry["waypoint"] else None
+    else:
+        raise ValueError(f"Unknown journal entry {entry['op']}")
+
+
+class WaypointStore(threading.Thread):
+    """
+    Keeps SavedData on disk as a snapshot (the destination.json format, plus the sequence number of the last change
+    in it) and an append-only journal of the changes since, one JSON line each.
+    Every change is applied to data at once and queued; the writer thread appends everything queued when it wakes up
+    as one write and one fsync, so the UI never waits on the SD card and a change costs one line, however many
+    waypoints there are. A power cut loses at most the changes still queued and can only tear the last line, which
+    the replay drops (as it skips the part of a line a failed write left before its retry). Compaction writes a new
+    snapshot beside the old one and renames it over, then empties the journal; the sequence numbers keep a crash
+    between the two from replaying a change twice.
+    """
+
+    def __init__(self, snapshot_path: str, journal_path: Optional[str] = None) -> None:
+        super().__init__(name="waypoint-store", daemon=True)
+        self.snapshot_path: str = snapshot_path
+        self.journal_path: str = journal_path if journal_path is not None else f"{snapshot_path}.journal"
+        self.__queue: queue.SimpleQueue[WriterItem] = queue.SimpleQueue()
+        self.__sequence: int = 0  # of the last change made
+        self.__journal_entries: int = 0  # in the journal file
+        self.data: SavedData = self.__load()
+        # the writer's own copy of what is on disk, compacted without touching the UI's data
+        self.__written: SavedData = SavedData(self.data.destination, self.data.waypoints[:])
+        self.__written_sequence: int = self.__sequence
+        self.__pending: list[JournalEntry] = []  # entries whose write failed, retried with the next batch
+        self.__torn: bool = False  # a failed write may have left part of a line
+
+    # Loading
+
+    def __load(self) -> SavedData:
+        """Reads the snapshot and replays the journal onto it."""
+        snapshot_sequence = 0
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            snapshot_sequence = snapshot.pop("sequence", 0)
+            data = SavedData.from_dict(DictSavedData(**snapshot))  # type: ignore[typeddict-item]
+        except FileNotFoundError:
+            data = SavedData()
+        self.__sequence = snapshot_sequence
+        try:
+            with open(self.journal_path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = b""
+        complete = content.rfind(b"\n") + 1
+        if complete < len(content):
+            # a write cut short by a power cut, drop it so the next entry starts on a line of its own
+            logging.warning(f"Dropping a torn entry at the end of {self.journal_path}")
+            os.truncate(self.journal_path, complete)
+        lines = content[:complete].decode().splitlines()
+        self.__journal_entries = len(lines)
+        replayed = 0
+        for line in lines:
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # what a failed write left before its retry
+                logging.warning(f"Skipping a torn entry in {self.journal_path}")
+                continue
+            if entry["seq"] <= self.__sequence:
+                # already in the snapshot (the journal was not emptied after the last compaction) or a retried write
+                continue
+            apply_entry(data, entry)
+            self.__sequence = entry["seq"]
+            replayed += 1
+        if replayed:
+            logging.info(f"Replayed {replayed} waypoint changes from {self.journal_path}")
+        return data
+
+    # Changes, called on the UI thread
+
+    def __record(self, op: str, **fields: Any) -> None:
+        self.__sequence += 1
+        self.__queue.put({"seq": self.__sequence, "op": op, **fields})
+
+    def add_waypoints(self, waypoints: list[Waypoint]) -> None:
+        if waypoints:
+            self.data.waypoints += waypoints
+            self.__record("add", waypoints=WaypointSet(waypoints).to_columns())
+
+    def delete_waypoint(self, index: int) -> None:
+        del self.data.waypoints[index]
+        self.__record("delete", index=index)
+
+    def set_destination(self, destination: Optional[Waypoint]) -> None:
+        self.data.destination = destination
+        self.__record("destination", waypoint=destination.to_dict() if destination else None)
+
+    def compact(self) -> None:
+        """Queues a compaction, safe to call from any thread."""
+        self.__queue.put("compact")
+
+    def close(self) -> None:
+        """Writes everything queued, compacts, and stops the writer."""
+        self.__queue.put("compact")
+        self.__queue.put(None)
+        if self.is_alive():
+            self.join()
+
+    # Writer thread
+
+    def __write_snapshot(self) -> None:
+        snapshot = {**self.__written.to_dict(), "sequence": self.__written_sequence}
+        temporary_path = f"{self.snapshot_path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        # the snapshot holds every change now, start the journal over
+        with open(self.journal_path, "w") as f:
+            os.fsync(f.fileno())
+        self.__journal_entries = 0
+
+    def __append(self, entries: list[JournalEntry]) -> None:
+        self.__pending += entries
+        with open(self.journal_path, "a") as f:
+            # after a failed write start on a new line, the replay skips whatever part of a line it left
+            f.write(("\n" if self.__torn else "") + "".join(json.dumps(entry) + "\n" for entry in self.__pending))
+            self.__torn = False
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in self.__pending:
+            apply_entry(self.__written, entry)
+            self.__written_sequence = entry["seq"]
+        self.__journal_entries += len(self.__pending)
+        self.__pending = []
+
+    def __next_batch(self) -> list[WriterItem]:
+        items = [self.__queue.get()]
+        while True:
+            try:
+                items.append(self.__queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def run(self) -> None:
+        running = True
+        while running:
+            entries: list[JournalEntry] = []
+            compact = False
+            for item in self.__next_batch():
+                if item is None:
+                    running = False
+                elif item == "compact":
+                    compact = True
+                else:
+                    entries.append(item)  # type: ignore[arg-type]
+            try:
+                if entries or self.__pending:
+                    self.__append(entries)
+                if self.__journal_entries and (compact or self.__journal_entries >= COMPACT_EVERY):
+                    self.__write_snapshot()
+            except OSError:
+                # keep the changes in memory, the next batch tries again
+                logging.exception("Saving waypoints failed")
+                self.__torn = True